@@ -0,0 +1,48 @@
+# conftest.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Shared benchmark fixtures.  OpenFOAM is replaced by the stub tools the
+tests use, see tests/openfoam_stubs.py."""
+
+import os, sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tests.openfoam_stubs import stub_openfoam, stubRotor
+
+# Meridional grid sizes (points_m, points_s) and blade counts to sweep
+GRID_SIZES = [(15, 10), (40, 20), (100, 50), (400, 200)]
+BLADE_COUNTS = [3, 7, 15]
+
+def gridId(grid):
+	return "%dx%d" % grid
+
+@pytest.fixture(scope="session")
+def rotors(stub_openfoam, tmp_path_factory):
+	"""Factory for lazy FreeVortexBlades solved against the stub tools, one per
+	grid size, shared by all benchmarks in the session."""
+	case_dir = tmp_path_factory.mktemp("cases")
+	built = {}
+	def rotor(grid):
+		if grid not in built:
+			built[grid] = stubRotor(case_dir / gridId(grid), *grid, lazy=True)
+		return built[grid]
+	return rotor
+
+@pytest.fixture(scope="session")
+def rotor_meshes(rotors):
+	"""Factory for the blades and merged mesh of a rotor with Z blades on a
+	given grid size, as a dict of blades, vertices and quads."""
+	built = {}
+	def mesh(grid, Z):
+		if (grid, Z) not in built:
+			rotor = rotors(grid)
+			rotor.update(Z=Z)
+			built[(grid, Z)] = {"blades": rotor.blades,
+			                    "vertices": rotor.vertices,
+			                    "quads": rotor.quads}
+		return built[(grid, Z)]
+	return mesh
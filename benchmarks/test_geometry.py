@@ -0,0 +1,77 @@
+# test_geometry.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Benchmarks of the geometry and export hot paths over grid sizes and blade
+counts.  Run with --benchmark-autosave (or --benchmark-json) to keep results
+for comparison across commits."""
+
+import io
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from conftest import GRID_SIZES, BLADE_COUNTS, gridId
+
+from turbokit import BladeFactoryBase, default_thickness, stl_writer, weld_mesh
+from turbokit.BladeFactoryBase import BladeHubCompleter
+
+grids = pytest.mark.parametrize("grid", GRID_SIZES, ids=gridId)
+blade_counts = pytest.mark.parametrize("Z", BLADE_COUNTS, ids=lambda Z: "Z%d" % Z)
+
+@grids
+def test_make_meridional_patch(benchmark, rotors, grid):
+	rotor = rotors(grid)
+	benchmark(rotor.makeMeridionalPatch)
+
+@grids
+def test_make_blade_profile(benchmark, rotors, grid):
+	rotor = rotors(grid)
+	rotor.velocityLookup() # built once per solution, not per profile
+	benchmark(rotor.makeBladeProfile)
+
+@grids
+def test_blade_factory(benchmark, rotors, grid):
+	rotor = rotors(grid)
+	factory = BladeFactoryBase(default_thickness, default_thickness)
+	blade = benchmark(factory, rotor.r, rotor.z, rotor.th, rotor.beta)
+	benchmark.extra_info["quads"] = len(blade.quads)
+
+@grids
+@blade_counts
+def test_hub_blade_spans(benchmark, rotors, rotor_meshes, grid, Z):
+	rotor = rotors(grid)
+	blades = rotor_meshes(grid, Z)["blades"]
+	completer = BladeHubCompleter(blades, rotor.r, rotor.z, 0,
+	                              rotor.interblade_faces, lazy=True)
+	benchmark(completer.makeBladeSpans)
+
+@grids
+@blade_counts
+def test_binary_stl_writer(benchmark, rotor_meshes, grid, Z):
+	mesh = rotor_meshes(grid, Z)
+	def write():
+		stream = io.BytesIO()
+		stl = stl_writer.Binary_STL_Writer(stream)
+		stl.add_mesh(mesh["vertices"], mesh["quads"])
+		stl.close()
+		return stl.counter, len(stream.getvalue())
+	triangles, size = benchmark(write)
+	benchmark.extra_info["triangles"] = triangles
+	benchmark.extra_info["bytes"] = size
+
+@grids
+@pytest.mark.parametrize("level,tolerance", [(2, None), (0, 5e-5), (2, 5e-5)],
+                         ids=["level2", "tol5e-5", "level2-tol5e-5"])
+def test_lod_mesh(benchmark, rotors, grid, level, tolerance):
+	rotor = rotors(grid)
+	rotor.update(Z=7)
+	vertices, quads = benchmark(rotor.makeLodMesh, level, tolerance)
+	benchmark.extra_info["quads"] = len(quads)
+
+@grids
+def test_weld_mesh(benchmark, rotor_meshes, grid):
+	mesh = rotor_meshes(grid, 7)
+	vertices, quads = benchmark(weld_mesh, mesh["vertices"], mesh["quads"], 1e-9)
+	benchmark.extra_info["vertices"] = len(mesh["vertices"])
+	benchmark.extra_info["welded"] = len(vertices)
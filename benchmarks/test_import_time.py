@@ -0,0 +1,42 @@
+# test_import_time.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Import time of the turbokit package, measured in fresh interpreters.  That
+importing it doesn't pull in the heavy optional dependencies is checked in
+tests/test_imports.py."""
+
+import os, sys
+import re
+import subprocess
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def runPython(code, *options):
+	"""Run code in a new interpreter that imports turbokit from this tree.
+	Returns its (stdout, stderr)."""
+	env = dict(os.environ)
+	env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT, env.get("PYTHONPATH", "")])
+	proc = subprocess.run([sys.executable] + list(options) + ["-c", code],
+	                      env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+	                      check=True)
+	return proc.stdout.decode("utf-8"), proc.stderr.decode("utf-8")
+
+def importTimeUs(module):
+	"""Cumulative import time of module in microseconds, from -X importtime."""
+	_, stderr = runPython("import " + module, "-X", "importtime")
+	for line in stderr.splitlines():
+		match = re.match(r"import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$", line)
+		if match and match.group(2) == module:
+			return int(match.group(1))
+	raise RuntimeError("No import time reported for %s" % module)
+
+def test_import_time(benchmark):
+	"""Wall time of starting an interpreter and importing turbokit.  The import
+	itself, without interpreter startup, is recorded in extra_info."""
+	benchmark.pedantic(runPython, args=("import turbokit",), rounds=10, iterations=1)
+	benchmark.extra_info["import_us"] = importTimeUs("turbokit")
+	benchmark.extra_info["numpy_import_us"] = importTimeUs("numpy")
@@ -0,0 +1,26 @@
+# setup.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+from setuptools import setup
+
+setup(
+	name="turbokit",
+	version="0.1.0",
+	description="Python library for designing and simulating turbomachinery",
+	author="Peter Hokanson",
+	license="GPLv3",
+	packages=["turbokit"],
+	package_data={"turbokit": ["case_templates/freevortex/*",
+	                           "case_templates/freevortex/0/*",
+	                           "case_templates/freevortex/constant/*",
+	                           "case_templates/freevortex/constant/polyMesh/*",
+	                           "case_templates/freevortex/system/*"]},
+	python_requires=">=3.7",
+	install_requires=["numpy"],
+	extras_require={
+		# Running OpenFOAM cases: boundary files and solved field interpolation
+		"openfoam": ["PyFoam", "scipy"],
+		"plot": ["matplotlib"],
+	},
+)
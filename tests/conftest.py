@@ -0,0 +1,19 @@
+# conftest.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Shared test fixtures.  The stub OpenFOAM tools are also used by the
+benchmarks, see openfoam_stubs.py."""
+
+import os, sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tests.openfoam_stubs import stub_openfoam, stubRotor
+
+@pytest.fixture
+def rotor(stub_openfoam, tmp_path):
+	"""Small FreeVortexBlades solved against the stub tools."""
+	return stubRotor(tmp_path / "case", 15, 10)
@@ -0,0 +1,46 @@
+# openfoam_stubs.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Stub OpenFOAM tools shared by the tests and the benchmarks, which both
+import this module as tests.openfoam_stubs.  The stubs are executables put
+first on PATH: blockMesh only touches the polyMesh points file, the other
+meshing and solver tools do nothing, and sample copies the recorded
+fixtures/U_frontWall.raw into the case as the solved velocity field."""
+
+import os
+import stat
+
+import pytest
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SAMPLE_TIME = "100"
+
+STUB_TOOLS = {
+	"blockMesh": "touch constant/polyMesh/points\n",
+	"checkMesh": "exit 0\n",
+	"simpleFoam": "exit 0\n",
+	"sample": "mkdir -p postProcessing/surfaces/%s\n"
+	          "cp '%s' postProcessing/surfaces/%s/U_frontWall.raw\n" %
+	          (SAMPLE_TIME, os.path.join(FIXTURE_DIR, "U_frontWall.raw"), SAMPLE_TIME),
+	"foamListTimes": "echo %s\n" % SAMPLE_TIME,
+}
+
+@pytest.fixture(scope="session")
+def stub_openfoam(tmp_path_factory):
+	"""Put stub OpenFOAM executables first on PATH for the session."""
+	bin_dir = tmp_path_factory.mktemp("stub_bin")
+	for name, script in STUB_TOOLS.items():
+		path = bin_dir / name
+		path.write_text("#!/bin/sh\n" + script)
+		path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+	patch = pytest.MonkeyPatch()
+	patch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+	yield bin_dir
+	patch.undo()
+
+def stubRotor(casename, points_m, points_s, **params):
+	"""FreeVortexBlades on a points_m x points_s grid, meshed directly and
+	solved against the stub tools."""
+	from turbokit import FreeVortexBlades
+	return FreeVortexBlades(casename=str(casename), points_m=points_m,
+	                        points_s=points_s, direct_mesh="binary", **params)
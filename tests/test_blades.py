@@ -0,0 +1,63 @@
+# test_blades.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Blade thickness evaluated over whole grids and node by node."""
+
+import math
+
+import numpy as np
+import pytest
+
+from turbokit import BladeFactoryBase, FreeVortexBlades, default_thickness
+
+def bladeGrid(points_m=9, points_s=5):
+	m, s = np.meshgrid(np.linspace(0, 1, points_m), np.linspace(0, 1, points_s),
+	                   indexing="ij")
+	r = 3e-3 + 9e-3 * m
+	z = 7e-3 * (1 - m) + 2e-3 * s
+	th = 0.5 * m
+	beta = 0.3 + 0.4 * m
+	return r, z, th, beta
+
+def test_default_thickness_arrays():
+	m, s = np.meshgrid(np.linspace(0, 1, 9), np.linspace(0, 1, 5), indexing="ij")
+	thickness = default_thickness(m, s)
+	assert thickness.shape == m.shape
+	for idx in np.ndindex(m.shape):
+		assert thickness[idx] == default_thickness(float(m[idx]), float(s[idx]))
+
+def scalarThickness(m, s):
+	"""Thickness function that only accepts scalars."""
+	return 1e-3 * math.sin(math.pi * m) * (1 + 0.1 * s)
+
+@pytest.mark.parametrize("thickness_fn", [default_thickness, scalarThickness])
+def test_array_thickness_matches_per_node(thickness_fn):
+	grid = bladeGrid()
+	array_blade = BladeFactoryBase(thickness_fn, thickness_fn)(*grid)
+	node_blade = BladeFactoryBase(thickness_fn, thickness_fn, array_thickness=False)(*grid)
+	assert np.allclose(array_blade.th_l, node_blade.th_l, rtol=0, atol=1e-15)
+	assert np.allclose(array_blade.th_t, node_blade.th_t, rtol=0, atol=1e-15)
+	assert np.array_equal(array_blade.th_l[[0,-1]], grid[2][[0,-1]])
+
+def test_rotor_defaults_to_array_thickness():
+	rotor = FreeVortexBlades(lazy=True)
+	assert rotor.thickness_fn_l is default_thickness
+	assert rotor.thickness_fn_t is default_thickness
+	assert rotor.bladeFactories[0].thickness_fn_l is default_thickness
+
+class OldFactory(BladeFactoryBase):
+	"""Factory with the __call__ signature from before m_values and s_values."""
+	def __call__(self, r, z, th, beta):
+		self.calls = getattr(self, "calls", 0) + 1
+		return super(OldFactory, self).__call__(r, z, th, beta)
+
+@pytest.mark.parametrize("grid_tolerance", [None, 2e-6])
+def test_old_factory_signature(stub_openfoam, tmp_path, grid_tolerance):
+	factory = OldFactory()
+	rotor = FreeVortexBlades(casename=str(tmp_path / "case"), points_m=15, points_s=10,
+	                         direct_mesh="binary", grid_tolerance=grid_tolerance,
+	                         grid_max_length=5e-4 if grid_tolerance else None,
+	                         bladeFactories=[factory] * 7)
+	assert factory.calls >= 1
+	expected = BladeFactoryBase()(rotor.r, rotor.z, rotor.th, rotor.beta)
+	assert np.array_equal(rotor.blades[0].vertices, expected.vertices)
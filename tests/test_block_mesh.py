@@ -0,0 +1,195 @@
+# test_block_mesh.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""blockMeshDict layout: one block per cell, or mesh_blocks graded blocks
+with curved edges, and the dictionary written for it."""
+
+import os
+
+import numpy as np
+import pytest
+
+from turbokit import FreeVortex, Instrumentation
+from turbokit.BlockMeshWriter import writeBlockMeshDict
+
+POINTS_M = 15
+POINTS_S = 10
+
+def blockMeshData(tmp_path, name, **params):
+	fv = FreeVortex(casename=str(tmp_path / name), points_m=POINTS_M, points_s=POINTS_S,
+	                lazy=True, **params)
+	return fv, fv.blockmesh_data
+
+@pytest.mark.parametrize("mesh_blocks", [1, 3, 5])
+def test_block_cells(stub_openfoam, tmp_path, mesh_blocks):
+	fv, data = blockMeshData(tmp_path, "case", mesh_blocks=mesh_blocks)
+	cells = data["cells"]
+	assert len(data["blocks"]) == len(cells) == mesh_blocks
+	assert cells[:,0].sum() == POINTS_M - 1
+	assert (cells[:,1] == POINTS_S - 1).all() and (cells[:,2] == 1).all()
+	assert np.prod(cells, axis=1).sum() == (POINTS_M - 1) * (POINTS_S - 1)
+	# Neighbouring blocks share the face between them
+	for block, next_block in zip(data["blocks"][:-1], data["blocks"][1:]):
+		assert set(block[[1, 2, 5, 6]]) == set(next_block[[0, 3, 4, 7]])
+
+def test_block_grading(stub_openfoam, tmp_path):
+	fv, data = blockMeshData(tmp_path, "case", mesh_blocks=3)
+	start = 0
+	for (cells_m, cells_s, _), grading in zip(data["cells"], data["simpleGrading"]):
+		end = start + cells_m
+		r, z = fv.r[start:end+1], fv.z[start:end+1]
+		# Last cell over first cell along m, at hub and shroud
+		dm = np.hypot(np.diff(r, axis=0), np.diff(z, axis=0))[:,[0,-1]]
+		assert grading[0] == pytest.approx(np.mean(dm[-1] / dm[0]))
+		# The default grid is uniform in s
+		assert grading[1] == pytest.approx(1)
+		assert grading[2] == 1
+		start = end
+	assert not np.allclose(data["simpleGrading"][:,0], 1)
+
+def test_block_edges(stub_openfoam, tmp_path):
+	fv, data = blockMeshData(tmp_path, "case", mesh_blocks=3, mesh_edge_points=6)
+	vertices = data["vertices"]
+	corners = set(data["blocks"].ravel())
+	block_edges = [{frozenset(edge) for edge in
+	                block[[[0, 1], [3, 2], [4, 5], [7, 6]]].tolist()}
+	               for block in data["blocks"]]
+	# Hub and shroud edges along m, on both wedge sides, for every block
+	assert len(data["edges"]) == 4 * len(data["blocks"])
+	for edge_type, start, end, points in data["edges"]:
+		assert edge_type == "spline"
+		assert len(points) == 6
+		assert start in corners and end in corners
+		assert sum(frozenset((start, end)) in edges for edges in block_edges) == 1
+		# Interior points run from the start vertex to the end vertex
+		path = np.concatenate(([vertices[start]], points, [vertices[end]]))
+		steps = np.linalg.norm(np.diff(path, axis=0), axis=1)
+		assert steps.max() < 3 * steps.mean()
+		assert np.all(np.diff(np.linalg.norm(path - vertices[start], axis=1)) > 0)
+		assert np.allclose(path[:,2] / path[:,0], path[0,2] / path[0,0])
+
+def test_single_block_matches_cells(stub_openfoam, tmp_path):
+	fv, cell_data = blockMeshData(tmp_path, "cells")
+	fv, block_data = blockMeshData(tmp_path, "block", mesh_blocks=1)
+	cell_vertices = cell_data["vertices"]
+	assert len(cell_data["blocks"]) == (POINTS_M - 1) * (POINTS_S - 1)
+	assert tuple(block_data["cells"][0]) == (POINTS_M - 1, POINTS_S - 1, 1)
+	# The block's corners are the corner vertices of the per-cell mesh
+	# Cells are blocks in (m, s) order, with corners (m0s0, m1s0, m1s1, m0s1)
+	grid = cell_data["blocks"].reshape(POINTS_M - 1, POINTS_S - 1, 8)
+	corner_blocks = [grid[0,0], grid[-1,0], grid[-1,-1], grid[0,-1]] * 2
+	corners = cell_vertices[[block[i] for i, block in enumerate(corner_blocks)]]
+	assert np.allclose(block_data["vertices"][block_data["blocks"][0]], corners)
+	# Patches cover the same faces, now as one face per block side
+	for name, patch in block_data["boundary"].items():
+		assert len(patch["faces"]) == 1
+		assert len(cell_data["boundary"][name]["faces"]) in (POINTS_M - 1, POINTS_S - 1,
+		                                                     (POINTS_M - 1) * (POINTS_S - 1))
+
+def foamList(value, length=None, width=1):
+	"""Items of a parsed OpenFOAM list of length entries, each parsed as width
+	items, checking the written length."""
+	if isinstance(value, tuple):
+		assert value[0] == length
+		value = value[1]
+	if length is not None:
+		assert len(value) == length * width
+	return value
+
+def test_dict_round_trip(tmp_path):
+	ParsedParameterFile = pytest.importorskip(
+		"PyFoam.RunDictionary.ParsedParameterFile").ParsedParameterFile
+	vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+	                     [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]]) * 0.123456789012
+	blocks = np.array([np.arange(8), np.arange(8)[::-1]])
+	cells = np.array([[3, 2, 1], [4, 5, 6]])
+	grading = np.array([[2.5, 1, 1], [1, 0.25, 1]])
+	boundary = [("walls", "wall", np.array([[0, 3, 2, 1], [4, 5, 6, 7]])),
+	            ("inlet", "patch", np.array([[0, 1, 5, 4]]))]
+	edges = [("arc", 0, 1, np.array([[0.06, -0.01, 0]])),
+	         ("spline", 4, 5, np.array([[0.03, 0, 0.12], [0.09, 0.001, 0.12]]))]
+	filename = str(tmp_path / "blockMeshDict")
+	with open(filename, "w") as f:
+		writeBlockMeshDict(f, vertices, blocks, cells, grading, boundary, edges,
+		                   convertToMeters=0.001)
+
+	parsed = ParsedParameterFile(filename)
+	assert parsed["convertToMeters"] == 0.001
+	assert np.array_equal([v.vals for v in foamList(parsed["vertices"], 8)], vertices)
+
+	hexes = np.array(foamList(parsed["blocks"], 2, 5), dtype=object).reshape(-1, 5)
+	assert (hexes[:,0] == "hex").all() and (hexes[:,3] == "simpleGrading").all()
+	assert np.array_equal(np.stack(hexes[:,1]), blocks)
+	def triples(column):
+		return np.array([str(v).strip("()").split() for v in column], dtype=float)
+	assert np.array_equal(triples(hexes[:,2]), cells)
+	assert np.array_equal(triples(hexes[:,4]), grading)
+
+	parsed_edges = np.array(foamList(parsed["edges"], 2, 4), dtype=object).reshape(-1, 4)
+	for (edge_type, start, end, points), parsed_edge in zip(edges, parsed_edges):
+		assert list(parsed_edge[:3]) == [edge_type, start, end]
+		assert np.array_equal([v.vals for v in parsed_edge[3]], points)
+
+	patches = foamList(parsed["boundary"], 2, 2)
+	for (name, patch_type, faces), parsed_name, patch in zip(boundary, patches[::2],
+	                                                          patches[1::2]):
+		assert parsed_name == name and patch["type"] == patch_type
+		assert np.array_equal(patch["faces"], faces)
+	assert foamList(parsed["mergePatchPairs"], 0) == []
+
+def test_unchanged_dict_not_rewritten(stub_openfoam, tmp_path):
+	records = []
+	previous = Instrumentation.setSink(records.append)
+	try:
+		fv, data = blockMeshData(tmp_path, "case", mesh_blocks=3, reuse_case=True)
+		filename = os.path.join(fv.casename, "constant/polyMesh/blockMeshDict")
+		os.utime(filename, ns=(10**18, 10**18))
+
+		# Rerunning the mesh stage writes the same dictionary
+		fv.update(mesh_blocks=3)
+		fv.blockmesh_data
+		assert os.stat(filename).st_mtime_ns == 10**18
+		fv.update(mesh_blocks=4)
+		fv.blockmesh_data
+		assert os.stat(filename).st_mtime_ns != 10**18
+	finally:
+		Instrumentation.setSink(previous)
+	written = [record["written"] for record in records if record["stage"] == "writeMesh"]
+	assert written == [True, False, True]
+
+def test_streamed_dict_matches_reused(stub_openfoam, tmp_path):
+	# A fresh case is streamed to the file, a reused one written if changed
+	dicts = []
+	for reuse_case in (False, True):
+		fv, data = blockMeshData(tmp_path, "case%d" % reuse_case, mesh_blocks=3,
+		                         reuse_case=reuse_case)
+		with open(os.path.join(fv.casename, "constant/polyMesh/blockMeshDict")) as f:
+			dicts.append(f.read())
+	assert dicts[0] == dicts[1]
+	assert "blocks" in dicts[0]
+
+def test_unchanged_dict_not_remeshed(stub_openfoam, tmp_path):
+	records = []
+	previous = Instrumentation.setSink(records.append)
+	try:
+		casename = str(tmp_path / "case")
+		for points_m in (POINTS_M, POINTS_M, POINTS_M + 1):
+			FreeVortex(casename=casename, points_m=points_m, points_s=POINTS_S,
+			           reuse_case=True)
+	finally:
+		Instrumentation.setSink(previous)
+	stages = [record["stage"] for record in records]
+	# The second run finds blockMesh already ran on the same dictionary
+	assert stages.count("blockMesh") == stages.count("checkMesh") == 2
+	assert stages.count("simpleFoam") == 3
+
+@pytest.mark.parametrize("params", [{}, {"mesh_blocks": 3}, {"direct_mesh": "ascii"}])
+def test_write_mesh_cell_count(stub_openfoam, tmp_path, params):
+	records = []
+	previous = Instrumentation.setSink(records.append)
+	try:
+		blockMeshData(tmp_path, "case", **params)
+	finally:
+		Instrumentation.setSink(previous)
+	written, = [record for record in records if record["stage"] == "writeMesh"]
+	assert written["cells"] == (POINTS_M - 1) * (POINTS_S - 1)
@@ -0,0 +1,120 @@
+# test_case_runner.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""AsyncCaseRunner concurrency, timeouts and cancellation, with stub tools
+that hang or log when they run."""
+
+import os
+import time
+import stat
+import asyncio
+import subprocess
+
+import pytest
+
+from turbokit import FreeVortex
+from turbokit.CaseRunner import AsyncCaseRunner
+from turbokit.SolveCache import SolveCache
+
+# Backgrounds a long sleep, as a wrapper script starting the solver would
+HANGING_SOLVER = "sleep 60 &\necho $! > sleeper.pid\nwait\n"
+
+@pytest.fixture
+def tools(stub_openfoam, tmp_path, monkeypatch):
+	"""Replace stub tools for one test: tools(name, script)."""
+	bin_dir = tmp_path / "bin"
+	bin_dir.mkdir()
+	monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+	def tool(name, script):
+		path = bin_dir / name
+		path.write_text("#!/bin/sh\n" + script)
+		path.chmod(path.stat().st_mode | stat.S_IXUSR)
+	return tool
+
+def prepare(tmp_path, count=1):
+	"""Prepared cases, meshed and solved by the runner."""
+	return [FreeVortex(casename=str(tmp_path / ("case%d" % i)), points_m=15,
+	                   points_s=10, run_solver=False)
+	        for i in range(count)]
+
+def alive(pid):
+	try:
+		with open("/proc/%d/stat" % pid) as f:
+			return f.read().rsplit(")", 1)[1].split()[0] not in "ZX"
+	except FileNotFoundError:
+		return False
+
+def assertKilled(casename):
+	"""The sleeper started by HANGING_SOLVER is gone."""
+	with open(os.path.join(casename, "sleeper.pid")) as f:
+		pid = int(f.read())
+	deadline = time.monotonic() + 5
+	while alive(pid) and time.monotonic() < deadline:
+		time.sleep(0.05)
+	assert not alive(pid)
+
+def test_runs_cases(stub_openfoam, tmp_path):
+	cases = prepare(tmp_path, 2)
+	results = asyncio.run(AsyncCaseRunner(max_concurrent=2).runCases(cases))
+	assert results == cases
+	assert all(fv.end_time == "100" and len(fv.xyz_points) for fv in cases)
+
+def test_timeout_kills_process_group(tools, tmp_path):
+	tools("simpleFoam", HANGING_SOLVER)
+	fv, = prepare(tmp_path)
+	runner = AsyncCaseRunner(timeouts={"simpleFoam": 0.5})
+	start = time.monotonic()
+	with pytest.raises(subprocess.TimeoutExpired):
+		asyncio.run(runner.runCase(fv))
+	assert time.monotonic() - start < 10
+	assertKilled(fv.casename)
+
+def test_cancel_kills_tools(tools, tmp_path):
+	tools("simpleFoam", HANGING_SOLVER)
+	cases = prepare(tmp_path, 2)
+	async def cancelRun():
+		task = asyncio.ensure_future(AsyncCaseRunner(max_concurrent=2).runCases(cases))
+		while not all(os.path.exists(os.path.join(fv.casename, "sleeper.pid"))
+		              for fv in cases):
+			await asyncio.sleep(0.05)
+		task.cancel()
+		await task
+	with pytest.raises(asyncio.CancelledError):
+		asyncio.run(asyncio.wait_for(cancelRun(), 20))
+	for fv in cases:
+		assertKilled(fv.casename)
+
+def maxRunning(log):
+	"""Most solvers running at once, from their start/end lines."""
+	running = most = 0
+	with open(log) as f:
+		for line in f:
+			running += 1 if line.startswith("start") else -1
+			most = max(most, running)
+	return most
+
+def test_max_concurrent(tools, tmp_path):
+	log = tmp_path / "solver.log"
+	tools("simpleFoam", "echo start >> '%s'\nsleep 0.3\necho end >> '%s'\n" % (log, log))
+	cases = prepare(tmp_path, 5)
+	results = asyncio.run(AsyncCaseRunner(max_concurrent=2).runCases(cases))
+	assert results == cases
+	assert maxRunning(log) == 2
+
+def test_reused_across_event_loops(tools, tmp_path):
+	# With one slot the second case waits on the semaphore in every run
+	tools("simpleFoam", "sleep 0.1\n")
+	runner = AsyncCaseRunner(max_concurrent=1)
+	for run in range(2):
+		cases = prepare(tmp_path / ("run%d" % run), 2)
+		assert asyncio.run(runner.runCases(cases)) == cases
+
+def test_cached_case_skips_tools(tools, tmp_path):
+	cache = SolveCache(str(tmp_path / "cache"))
+	FreeVortex(casename=str(tmp_path / "solved"), points_m=15, points_s=10,
+	           solve_cache=cache)
+	tools("blockMesh", "exit 1\n")
+	tools("checkMesh", "exit 1\n")
+	fv = FreeVortex(casename=str(tmp_path / "cached"), points_m=15, points_s=10,
+	                solve_cache=cache, run_solver=False)
+	assert asyncio.run(AsyncCaseRunner().runCase(fv)) is fv
@@ -0,0 +1,86 @@
+# test_case_staging.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Hard-linked case staging, in-place-safe rewrites and output cleanup."""
+
+import os
+
+import pytest
+
+from turbokit import FreeVortex
+from turbokit.SolveCache import SolveCache
+from turbokit.CaseStaging import stageCase, writeIfChanged, cleanCase
+
+TEMPLATE_FILES = {
+	"system/controlDict": "deltaT 1;\n",
+	"0/U": "template velocity\n",
+	"constant/polyMesh/blockMeshDict": "template mesh\n",
+}
+
+@pytest.fixture
+def template(tmp_path):
+	template = tmp_path / "template"
+	for name, text in TEMPLATE_FILES.items():
+		path = template / name
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_text(text)
+	return template
+
+def sameFile(a, b):
+	return os.stat(str(a)).st_ino == os.stat(str(b)).st_ino
+
+def test_links_template(template, tmp_path):
+	case = tmp_path / "case"
+	assert stageCase(str(template), str(case)) == len(TEMPLATE_FILES)
+	for name in TEMPLATE_FILES:
+		assert sameFile(template / name, case / name)
+	assert stageCase(str(template), str(case)) == 0
+
+def test_rewrite_breaks_link(template, tmp_path):
+	case = tmp_path / "case"
+	stageCase(str(template), str(case))
+	assert writeIfChanged(str(case / "0/U"), "case velocity\n")
+	assert not sameFile(template / "0/U", case / "0/U")
+	assert (template / "0/U").read_text() == TEMPLATE_FILES["0/U"]
+	assert (case / "0/U").read_text() == "case velocity\n"
+
+	# Kept files are left for their writer; others are linked again
+	(case / "system/controlDict").unlink()
+	assert stageCase(str(template), str(case), keep=["0/U"]) == 1
+	assert (case / "0/U").read_text() == "case velocity\n"
+	assert sameFile(template / "system/controlDict", case / "system/controlDict")
+
+def test_unchanged_file_keeps_mtime(tmp_path):
+	filename = str(tmp_path / "U")
+	assert writeIfChanged(filename, "velocity\n")
+	os.utime(filename, ns=(10**18, 10**18))
+	assert not writeIfChanged(filename, "velocity\n")
+	assert not writeIfChanged(filename, b"velocity\n")
+	assert os.stat(filename).st_mtime_ns == 10**18
+	assert writeIfChanged(filename, "velocity!\n")
+	assert os.stat(filename).st_mtime_ns != 10**18
+
+def test_removes_solver_output(template, tmp_path):
+	case = tmp_path / "case"
+	stageCase(str(template), str(case))
+	for name in ("100", "0.5", "1e-3", "postProcessing/surfaces/100",
+	             "processor0/100", "logs"):
+		(case / name).mkdir(parents=True)
+	(case / "log.simpleFoam").write_text("")
+	cleanCase(str(case))
+	assert sorted(os.listdir(str(case))) == ["0", "constant", "log.simpleFoam",
+	                                         "logs", "system"]
+	assert sameFile(template / "0/U", case / "0/U")
+
+def test_reused_case_leaves_template(stub_openfoam, tmp_path):
+	template = FreeVortex(lazy=True).case_template
+	before = SolveCache.hashTree(template)
+	casename = str(tmp_path / "case")
+	for inlet_v in ((0.5, 0.0, 0.0), (1.0, 0.0, 0.0)):
+		FreeVortex(casename=casename, points_m=15, points_s=10, reuse_case=True,
+		           inlet_v=inlet_v)
+	assert SolveCache.hashTree(template) == before
+	assert os.path.exists(os.path.join(casename, "postProcessing"))
+	for name in FreeVortex.generated_files:
+		assert not os.path.samefile(os.path.join(template, name),
+		                            os.path.join(casename, name))
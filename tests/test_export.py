@@ -0,0 +1,169 @@
+# test_export.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Correctness of the STL and indexed mesh exports."""
+
+import io
+import struct
+
+import numpy as np
+import pytest
+import scipy.spatial
+
+from turbokit import stl_writer, weld_mesh
+from turbokit.IndexedMeshWriter import splitFaces
+
+def readBinaryStl(data):
+	"""(header triangle count, records) of binary STL data."""
+	count = struct.unpack_from("<I", data, 80)[0]
+	return count, np.frombuffer(data, dtype=stl_writer.BINARY_RECORD, offset=84)
+
+def edgeCounts(quads):
+	"""Faces per undirected edge, and the largest number of faces sharing a
+	directed edge."""
+	edges = np.concatenate([np.stack((faces, np.roll(faces, -1, axis=1)), axis=-1).reshape(-1, 2)
+	                        for faces in splitFaces(quads)])
+	undirected = np.unique(np.sort(edges, axis=1), axis=0, return_counts=True)[1]
+	directed = np.unique(edges, axis=0, return_counts=True)[1]
+	return undirected, directed.max()
+
+# Unit square split in two quads, plus a degenerate quad
+VERTICES = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                     [2, 0, 0], [2, 1, 0]], dtype=float)
+QUADS = np.array([[0, 1, 2, 3], [1, 4, 5, 2], [0, 0, 0, 0]])
+
+def test_binary_stl_records():
+	stream = io.BytesIO()
+	stl = stl_writer.Binary_STL_Writer(stream)
+	stl.add_mesh(VERTICES, QUADS)
+	stl.close()
+	data = stream.getvalue()
+	count, records = readBinaryStl(data)
+	assert count == stl.counter == len(records) == 4
+	assert len(data) == stl.bytes_written == 84 + 50 * 4
+	assert np.allclose(records["normal"], [0, 0, 1])
+
+def test_binary_stl_declared_count():
+	stream = io.BytesIO()
+	stl = stl_writer.Binary_STL_Writer(stream, count=5)
+	stl.add_mesh(VERTICES, QUADS)
+	with pytest.raises(ValueError):
+		stl.close()
+
+def test_rotor_stl_matches_stream(rotor, tmp_path):
+	filename = str(tmp_path / "rotor.stl")
+	rotor.writeStlMesh(filename)
+	with open(filename, "rb") as f:
+		data = f.read()
+	count, records = readBinaryStl(data)
+	assert count == len(records) == stl_writer.count_triangles(rotor.vertices, rotor.quads)
+	assert rotor.writeStlStream(io.BytesIO()) == count
+
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_stream_header_count(rotor, symmetric):
+	rotor.symmetric = symmetric
+	streams = [io.BytesIO(), io.BytesIO()]
+	rotor.writeStlStream(streams[0], count_first=True)
+	rotor.writeStlStream(streams[1], count_first=False)
+	count, records = readBinaryStl(streams[0].getvalue())
+	assert count == len(records) == stl_writer.count_triangles(rotor.vertices, rotor.quads)
+	assert streams[0].getvalue() == streams[1].getvalue()
+
+def test_instanced_rotor_matches_per_blade(rotor):
+	# Rotated copies of one blade sector give the same rotor as building
+	# every blade, hub and shroud sector separately
+	rotor.makeSymmetricMesh()
+	vertices, quads = rotor.vertices, rotor.quads
+	rotor.makeAsymmetricMesh()
+	assert np.allclose(vertices, rotor.vertices, rtol=0, atol=1e-12)
+	assert np.array_equal(quads, rotor.quads)
+
+def test_stl_without_built_mesh(rotor, tmp_path):
+	from turbokit import FreeVortexBlades
+	streamed = FreeVortexBlades(casename=str(tmp_path / "streamed"), points_m=15,
+	                            points_s=10, direct_mesh="binary", build_mesh=False)
+	assert "vertices" not in streamed.__dict__
+	filenames = [str(tmp_path / "built.stl"), str(tmp_path / "streamed.stl")]
+	rotor.writeStlMesh(filenames[0])
+	streamed.writeStlMesh(filenames[1])
+	assert "vertices" not in streamed.__dict__
+	(count, built), (streamed_count, records) = [readBinaryStl(open(name, "rb").read())
+	                                             for name in filenames]
+	assert count == streamed_count == len(records)
+	assert np.allclose(records["vertices"], built["vertices"], atol=1e-7)
+
+def test_indexed_mesh_formats(rotor, tmp_path, capsys):
+	counts = [rotor.writeIndexedMesh(str(tmp_path / name)) for name in ("rotor.ply", "rotor.OBJ")]
+	assert counts[0] == counts[1]
+	assert capsys.readouterr().out == ""
+	with pytest.raises(ValueError, match=r"'\.stl'.*\.obj, \.ply"):
+		rotor.writeIndexedMesh(str(tmp_path / "rotor.stl"))
+	assert not (tmp_path / "rotor.stl").exists()
+
+def test_welded_rotor_is_manifold(rotor):
+	vertices, quads = weld_mesh(rotor.vertices, rotor.quads, 1e-9)
+	assert len(vertices) < len(rotor.vertices)
+	undirected, directed = edgeCounts(quads)
+	# Closed: every edge joins exactly two faces, consistently oriented
+	assert np.all(undirected == 2)
+	assert directed == 1
+
+def pointTriangleDistance(p, a, b, c):
+	"""Distance between matching rows of (N, 3) points p and triangles a, b, c."""
+	normals = np.cross(b - a, c - a)
+	normals /= np.linalg.norm(normals, axis=1)[:,np.newaxis]
+	height = np.einsum("nk,nk->n", p - a, normals)
+	foot = p - height[:,np.newaxis] * normals
+	# Distance to the plane where the projection falls inside the triangle,
+	# otherwise to the nearest edge
+	inside = np.ones(len(p), dtype=bool)
+	for u, v in ((a, b), (b, c), (c, a)):
+		inside &= np.einsum("nk,nk->n", np.cross(v - u, foot - u), normals) >= 0
+	distance = np.where(inside, np.abs(height), np.inf)
+	for u, v in ((a, b), (b, c), (c, a)):
+		t = np.clip(np.einsum("nk,nk->n", p - u, v - u) /
+		            np.maximum(np.einsum("nk,nk->n", v - u, v - u), 1e-300), 0, 1)
+		distance = np.minimum(distance, np.linalg.norm(p - u - t[:,np.newaxis] * (v - u), axis=1))
+	return distance
+
+def surfaceDistance(points, triangles, limit):
+	"""Distance from each of (N, 3) points to the nearest of (T, 3, 3) triangles,
+	or inf where no triangle is within limit."""
+	centres = triangles.mean(axis=1)
+	radii = np.linalg.norm(triangles - centres[:,np.newaxis], axis=2).max(axis=1)
+	near = scipy.spatial.cKDTree(points).query_ball_point(centres, radii + limit)
+	tri_idx = np.repeat(np.arange(len(triangles)), [len(n) for n in near])
+	point_idx = np.concatenate([np.asarray(n, dtype=int) for n in near])
+	pair_distance = pointTriangleDistance(points[point_idx], *triangles[tri_idx].transpose(1, 0, 2))
+	distance = np.full(len(points), np.inf)
+	np.minimum.at(distance, point_idx, pair_distance)
+	return distance
+
+@pytest.mark.parametrize("level, tolerance", [(1, None), (2, None), (0, 3e-4),
+                                              (0, 3e-3), (1, 1e-3)])
+def test_lod_mesh(rotor, level, tolerance):
+	vertices, quads = rotor.makeLodMesh(level, tolerance)
+	assert len(quads) < len(rotor.quads)
+	if level == 0:
+		# Every full-resolution vertex stays within tolerance of the preview
+		triangles, normals = stl_writer.triangulate(vertices, quads)
+		deviation = surfaceDistance(rotor.vertices, triangles.astype(float), tolerance)
+		assert deviation.max() <= tolerance
+	welded, welded_quads = weld_mesh(vertices, quads, 1e-9)
+	undirected, directed = edgeCounts(welded_quads)
+	assert np.all(undirected == 2)
+	assert directed == 1
+
+def test_lod_tolerance_reduces_faces(rotor):
+	counts = [len(rotor.makeLodMesh(0, tolerance)[1]) for tolerance in (3e-4, 1e-3, 3e-3)]
+	assert counts[0] > counts[1] > counts[2]
+
+def test_weld_tolerance():
+	rng = np.random.default_rng(0)
+	points = rng.random((100, 3))
+	vertices = np.concatenate((points, points + rng.uniform(-4e-10, 4e-10, points.shape),
+	                           points + 1e-6))
+	quads = np.arange(len(vertices)).reshape(-1, 3)[:, [0, 1, 2, 2]]
+	welded, welded_quads = weld_mesh(vertices, quads, 1e-9)
+	assert len(welded) == 200
+	assert np.allclose(welded[welded_quads], vertices[quads], atol=1e-9)
@@ -0,0 +1,76 @@
+# test_field_lookup.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""FieldLookup interpolation against scipy, and its saved copies."""
+
+import numpy as np
+import pytest
+import scipy.interpolate
+import scipy.spatial
+
+from turbokit.FieldLookup import FieldLookup
+
+@pytest.fixture
+def samples():
+	rng = np.random.default_rng(3)
+	points = rng.random((400, 2)) * [10e-3, 7e-3] + [3e-3, 0]
+	values = np.column_stack((np.sin(300 * points[:,0]), points[:,1] * 1e3,
+	                          np.hypot(*points.T)))
+	return points, values
+
+def queries(points, count=2000, margin=2e-3):
+	rng = np.random.default_rng(5)
+	low, high = points.min(axis=0) - margin, points.max(axis=0) + margin
+	return low + rng.random((count, 2)) * (high - low)
+
+def test_matches_scipy(samples):
+	points, values = samples
+	lookup = FieldLookup(points, values)
+	query = queries(points)
+	linear = scipy.interpolate.LinearNDInterpolator(points, values)(query)
+	inside = ~np.isnan(linear[:,0])
+	assert 0 < inside.sum() < len(query)
+
+	result = lookup(query)
+	assert np.allclose(result[inside], linear[inside], rtol=0, atol=1e-12)
+	nearest = scipy.interpolate.NearestNDInterpolator(points, values)(query)
+	assert np.array_equal(result[~inside], nearest[~inside])
+	assert np.array_equal(lookup(query, "nearest"), nearest)
+
+def test_locate_without_walk(samples):
+	points, values = samples
+	lookup = FieldLookup(points, values)
+	query = queries(points)
+	simplex = lookup.locate(query)
+	lookup.max_walk = 0 # every point goes through the full search
+	assert np.array_equal(lookup.locate(query) >= 0, simplex >= 0)
+	assert np.allclose(lookup.linear(query), FieldLookup(points, values).linear(query))
+
+def test_cache_hit(samples, tmp_path, monkeypatch):
+	points, values = samples
+	filename = str(tmp_path / "lookup.npz")
+	built = FieldLookup.cached(filename, points, values)
+	# A hit must not triangulate again
+	monkeypatch.setattr(scipy.spatial, "Delaunay", None)
+	loaded = FieldLookup.cached(filename, points, values)
+	assert loaded is not built and loaded.key == built.key
+	query = queries(points, 200)
+	assert np.array_equal(loaded(query), built(query))
+
+def test_cache_miss(samples, tmp_path):
+	points, values = samples
+	filename = str(tmp_path / "lookup.npz")
+	FieldLookup.cached(filename, points, values)
+	lookup = FieldLookup.cached(filename, points, values * 2)
+	assert np.array_equal(lookup.values, values * 2)
+	assert FieldLookup.load(filename).key == lookup.key
+	assert FieldLookup.load(filename, FieldLookup.makeKey(points, values)) is None
+
+def test_cache_never_unpickles(samples, tmp_path):
+	points, values = samples
+	filename = str(tmp_path / "lookup.npz")
+	with open(filename, "wb") as f:
+		np.savez(f, key=np.array([object()], dtype=object))
+	lookup = FieldLookup.cached(filename, points, values)
+	assert np.array_equal(lookup.values, values)
+	assert FieldLookup.load(filename).key == lookup.key
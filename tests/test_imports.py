@@ -0,0 +1,21 @@
+# test_imports.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Importing turbokit must not pull in the heavy optional dependencies."""
+
+import os, sys
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only specific features need; importing turbokit must not load them
+HEAVY_MODULES = ["scipy", "matplotlib", "PyFoam"]
+
+def test_import_skips_heavy_dependencies():
+	env = dict(os.environ)
+	env["PYTHONPATH"] = os.pathsep.join([REPO_ROOT, env.get("PYTHONPATH", "")])
+	stdout = subprocess.check_output(
+		[sys.executable, "-c", "import sys, turbokit; print(' '.join(sys.modules))"],
+		env=env)
+	loaded = set(stdout.decode("utf-8").split())
+	assert [module for module in HEAVY_MODULES if module in loaded] == []
@@ -0,0 +1,106 @@
+# test_meridional.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Uniform and curvature-adaptive meridional grids."""
+
+import numpy as np
+
+from turbokit import BladeFactoryBase, MeridionalPatchLinear, \
+                     MeridionalPatchSpline, MeridionalPatchMerged
+
+def mixedFlowPatch():
+	"""Axial inlet duct, bend and radial outlet duct."""
+	inlet = MeridionalPatchLinear(np.array([3e-3, 20e-3]), np.array([7.8e-3, 20e-3]),
+	                              np.array([3e-3, 7e-3]), np.array([7.8e-3, 7e-3]))
+	bend = MeridionalPatchSpline(np.array([3e-3, 7e-3]), np.array([7.8e-3, 7e-3]),
+	                             np.array([12.8e-3, 0.0]), np.array([12.8e-3, 2.0e-3]),
+	                             np.array([0.0, -39.6]), np.array([39.63, 0.0]))
+	outlet = MeridionalPatchLinear(np.array([12.8e-3, 0.0]), np.array([12.8e-3, 2e-3]),
+	                               np.array([25e-3, 0.0]), np.array([25e-3, 2e-3]))
+	return MeridionalPatchMerged([inlet, bend, outlet])
+
+def chordDeviation(patch, m_values, s_values=np.linspace(0, 1, 5), samples=33):
+	"""Largest distance of the patch from the straight segments between
+	neighbouring m_values, along each of the s_values grid lines."""
+	deviation = 0
+	for m0, m1 in zip(m_values[:-1], m_values[1:]):
+		r, z = patch.evaluate_grid(np.linspace(m0, m1, samples), s_values)
+		chord_r = r[-1] - r[0]
+		chord_z = z[-1] - z[0]
+		offset = np.abs(chord_r * (z - z[0]) - chord_z * (r - r[0])) / np.hypot(chord_r, chord_z)
+		deviation = max(deviation, offset.max())
+	return deviation
+
+def test_split_meridional():
+	patch = mixedFlowPatch()
+	m = np.array([0, 0.1, 1/3, 0.5, 2/3 - 1e-12, 2/3, 0.9, 1])
+	patch_idx, patch_m = patch.splitMeridional(m)
+	assert np.array_equal(patch_idx, [0, 0, 1, 1, 1, 2, 2, 2])
+	assert np.allclose(patch_m, [0, 0.3, 0, 0.5, 1, 0, 0.7, 1])
+	# m=1 is the end of the last subpatch, not past it
+	assert patch.splitMeridional(1.0) == (2, 1.0)
+	assert np.allclose(patch(1.0, 0.5), patch.patch_list[-1](1.0, 0.5))
+
+def test_evaluate_grid_matches_points():
+	m_values = np.concatenate((np.linspace(0, 1, 13), [0.05, 0.71]))
+	s_values = np.linspace(0, 1, 6)
+	patches = [mixedFlowPatch()] + mixedFlowPatch().patch_list
+	for patch in patches:
+		r, z = patch.evaluate_grid(m_values, s_values)
+		assert r.shape == z.shape == (len(m_values), len(s_values))
+		for i, j in np.ndindex(r.shape):
+			assert np.allclose((r[i,j], z[i,j]), patch(m_values[i], s_values[j]),
+			                   rtol=0, atol=1e-15)
+
+def test_corner_points():
+	# The s=1 corner at the inlet is the one given, not the outlet one
+	for patch in mixedFlowPatch().patch_list:
+		assert np.array_equal(patch.m0_s1, patch.k_array[0,-1])
+		assert np.allclose(patch(0, 1), patch.m0_s1, rtol=0, atol=1e-15)
+
+def test_adaptive_meets_tolerance_with_fewer_points():
+	patch = mixedFlowPatch()
+	tolerance = 2e-6
+	m_values = patch.adaptive_values(0, tolerance)
+	assert m_values[0] == 0 and m_values[-1] == 1
+	assert np.all(np.diff(m_values) > 0)
+	assert chordDeviation(patch, m_values) <= tolerance
+	# The same number of uniform points misses the tolerance by far
+	assert chordDeviation(patch, np.linspace(0, 1, len(m_values))) > 2 * tolerance
+
+def test_adaptive_max_length():
+	patch = mixedFlowPatch()
+	s_values = patch.adaptive_values(1, max_length=5e-4)
+	r, z = patch.evaluate_grid(np.linspace(0, 1, 9), s_values)
+	assert np.hypot(np.diff(r, axis=1), np.diff(z, axis=1)).max() <= 5e-4 * 1.001
+
+def test_adaptive_minimum_points():
+	from turbokit import FreeVortex
+	# The patch is straight from hub to shroud; points_s still applies there
+	fv = FreeVortex(grid_tolerance=5e-6, points_m=40, points_s=20, lazy=True)
+	assert len(fv.m_values) >= 40
+	assert len(fv.s_values) >= 20
+	assert fv.r.shape == (len(fv.m_values), len(fv.s_values))
+	assert np.all(np.diff(fv.s_values) > 0)
+
+def test_uniform_grid_unchanged(rotor):
+	# With the adaptive options off, the grid and blades are as before
+	assert np.array_equal(rotor.m_values, np.arange(15) / 14)
+	assert np.array_equal(rotor.s_values, np.arange(10) / 9)
+	r, z = rotor.meridional_patch.evaluate_grid(np.arange(15) / 14, np.arange(10) / 9)
+	assert np.array_equal(rotor.r, r) and np.array_equal(rotor.z, z)
+	blade = BladeFactoryBase()(rotor.r, rotor.z, rotor.th, rotor.beta)
+	assert np.array_equal(rotor.makeBlade(0).vertices, blade.vertices)
+
+def test_adaptive_thickness_positions(stub_openfoam, tmp_path):
+	from turbokit import FreeVortexBlades
+	thickness = lambda m, s: 1e-3 * m * (1 - m)
+	rotor = FreeVortexBlades(casename=str(tmp_path / "case"), direct_mesh="binary",
+	                         grid_tolerance=2e-6, grid_max_length=5e-4,
+	                         thickness_fn_l=thickness, thickness_fn_t=thickness)
+	assert len(rotor.m_values) != rotor.points_m
+	assert rotor.r.shape == (len(rotor.m_values), len(rotor.s_values))
+	blade = rotor.makeBlade(0)
+	# The taper follows the grid's m values, not its row numbers
+	expected = thickness(rotor.m_values[:, np.newaxis], 0) * np.sin(rotor.beta) / rotor.r
+	assert np.allclose(blade.th_l - rotor.th, expected)
@@ -0,0 +1,81 @@
+# test_pipeline.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Which stages of a lazy FreeVortexBlades rerun after update()."""
+
+import numpy as np
+import pytest
+
+from turbokit import FreeVortexBlades
+
+ALL_STAGES = {"grid", "case", "mesh", "solve", "profile", "factories", "tessellate"}
+
+def thinBlade(m, s):
+	return 5e-4 * np.ones_like(np.asarray(m, dtype=float))
+
+@pytest.fixture
+def rotor(stub_openfoam, tmp_path):
+	"""Lazy rotor logging the stages it runs to rotor.ran."""
+	fv = FreeVortexBlades(casename=str(tmp_path / "case"), points_m=15, points_s=10,
+	                      direct_mesh="binary", lazy=True)
+	fv.ran = []
+	for stage in fv.pipeline.stages.values():
+		def run(method=getattr(fv, stage.run), name=stage.name):
+			fv.ran.append(name)
+			return method()
+		setattr(fv, stage.run, run)
+	return fv
+
+def rerun(fv, **params):
+	"""Stages run to rebuild the mesh after update(**params)."""
+	fv.ran = []
+	fv.update(**params)
+	fv.vertices
+	return set(fv.ran)
+
+def test_first_use_runs_everything(rotor):
+	rotor.vertices
+	assert set(rotor.ran) == ALL_STAGES
+	assert rerun(rotor) == set()
+
+@pytest.mark.parametrize("params, stages", [
+	({"Z": 5}, {"factories", "tessellate"}),
+	({"Omega": 5000.0}, {"profile", "tessellate"}),
+	({"thickness_fn_l": thinBlade}, {"factories", "tessellate"}),
+	({"interblade_faces": 3}, {"tessellate"}),
+	({"points_m": 12}, {"grid", "mesh", "solve", "profile", "tessellate"}),
+])
+def test_update_reruns(rotor, params, stages):
+	rotor.vertices
+	assert rerun(rotor, **params) == stages
+
+def test_update_changes_result(rotor):
+	quads = len(rotor.quads)
+	rotor.update(Z=5)
+	assert len(rotor.quads) * 7 == quads * 5
+	assert len(rotor.blades) == 5
+	rotor.update(points_m=12)
+	assert rotor.r.shape == (12, 10)
+	assert rotor.th.shape == (12, 10)
+
+def test_partial_output_rejected(rotor):
+	r = rotor.r
+	with pytest.raises(ValueError):
+		rotor.update(r=r * 1.1)
+	assert rerun(rotor) == {"case", "mesh", "solve", "profile", "factories", "tessellate"}
+
+def test_supplied_outputs(rotor):
+	rotor.vertices
+	grid = {name: getattr(rotor, name) for name in ("r", "z", "m_values", "s_values")}
+	supplied = dict(grid, r=grid["r"] * 1.1)
+	assert rerun(rotor, **supplied) == {"mesh", "solve", "profile", "tessellate"}
+	assert rotor.r is supplied["r"]
+
+	# Supplied outputs survive changes to the stage's inputs
+	assert rerun(rotor, points_m=12) == {"mesh", "solve", "profile", "tessellate"}
+	assert rotor.r is supplied["r"]
+
+	# Handing one output back reruns the stage for all of them
+	assert "grid" in rerun(rotor, r=None)
+	assert rotor.r.shape == (12, 10)
+	assert np.allclose(rotor.m_values, np.linspace(0, 1, 12))
@@ -0,0 +1,119 @@
+# test_polymesh.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Direct polyMesh output against a reference built from the blockMeshDict
+blocks the way blockMesh meshes them."""
+
+import os
+
+import numpy as np
+import pytest
+
+from turbokit import FreeVortex
+from turbokit.PolyMeshWriter import writePolyMesh, readPolyMesh, comparePolyMesh
+
+POINTS_M = 4
+POINTS_S = 3
+
+# Outward faces of OpenFOAM's hex cell model, by block vertex
+HEX_FACES = [(0, 4, 7, 3), (1, 2, 6, 5), (0, 1, 5, 4),
+             (3, 7, 6, 2), (0, 3, 2, 1), (4, 5, 6, 7)]
+
+def blockMeshPolyMesh(vertices, blocks, boundary):
+	"""polyMesh that blockMesh makes of one-cell hex blocks, independently of
+	wedgePolyMesh: every hex contributes its six faces in the hex model order,
+	cells are numbered in block order, shared faces are internal (owned by the
+	lower cell, in upper-triangular order) and the rest are assigned to the
+	blockMeshDict patches.  boundary is a list of (name, type, faces)."""
+	faces = {}
+	for cell, block in enumerate(blocks):
+		for face in HEX_FACES:
+			labels = tuple(int(block[i]) for i in face)
+			faces.setdefault(tuple(sorted(labels)), []).append((cell, labels))
+	internal = sorted((uses[0][0], uses[1][0], uses[0][1])
+	                  for uses in faces.values() if len(uses) == 2)
+	poly_faces = [labels for owner, neighbour, labels in internal]
+	owner = [owner for owner, neighbour, labels in internal]
+	neighbour = [neighbour for owner, neighbour, labels in internal]
+	patches = []
+	for name, patch_type, patch_faces in boundary:
+		start = len(poly_faces)
+		for face in patch_faces:
+			(cell, labels), = faces[tuple(sorted(int(v) for v in face))]
+			poly_faces.append(labels)
+			owner.append(cell)
+		patches.append((name, patch_type, start, len(poly_faces) - start))
+	return vertices, poly_faces, owner, neighbour, patches
+
+def writeAsciiPolyMesh(directory, points, faces, owner, neighbour, patches):
+	"""Plain ascii polyMesh files, written without PolyMeshWriter."""
+	os.makedirs(directory)
+	def write(name, foam_class, items):
+		with open(os.path.join(directory, name), "w") as f:
+			f.write("FoamFile\n{\n\tformat ascii;\n\tclass %s;\n\tobject %s;\n}\n"
+			        % (foam_class, name))
+			f.write("%d\n(\n%s)\n" % (len(items), "".join(item + "\n" for item in items)))
+	write("points", "vectorField", ["(%r %r %r)" % tuple(p) for p in points.tolist()])
+	write("faces", "faceList", ["4(%d %d %d %d)" % face for face in faces])
+	write("owner", "labelList", ["%d" % cell for cell in owner])
+	write("neighbour", "labelList", ["%d" % cell for cell in neighbour])
+	write("boundary", "polyBoundaryMesh",
+	      ["%s { type %s; nFaces %d; startFace %d; }" % (name, patch_type, count, start)
+	       for name, patch_type, start, count in patches])
+
+@pytest.fixture
+def fv(stub_openfoam, tmp_path):
+	return FreeVortex(casename=str(tmp_path / "case"), points_m=POINTS_M,
+	                  points_s=POINTS_S, direct_mesh="ascii", lazy=True)
+
+@pytest.fixture
+def polymesh_data(fv):
+	return fv.polymesh_data
+
+@pytest.fixture
+def reference(fv, tmp_path):
+	"""Directory of the reference polyMesh for fv's blockMeshDict."""
+	data = fv.blockmesh_data
+	boundary = [(name, patch["type"], patch["faces"])
+	            for name, patch in data["boundary"].items()]
+	directory = str(tmp_path / "reference")
+	writeAsciiPolyMesh(directory, *blockMeshPolyMesh(data["vertices"], data["blocks"],
+	                                                 boundary))
+	return directory
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_matches_reference(polymesh_data, reference, tmp_path, binary):
+	directory = str(tmp_path / "polyMesh")
+	writePolyMesh(directory, binary=binary, **polymesh_data)
+	assert comparePolyMesh(directory, reference) == []
+	assert len(readPolyMesh(reference)["owner"]) == len(polymesh_data["owner"])
+
+def test_formats_read_back_equal(polymesh_data, tmp_path):
+	meshes = []
+	for binary in (False, True):
+		directory = str(tmp_path / ("binary" if binary else "ascii"))
+		writePolyMesh(directory, binary=binary, **polymesh_data)
+		meshes.append(readPolyMesh(directory))
+	ascii, binary = meshes
+	# ascii points are rounded on output
+	assert np.allclose(ascii["points"], binary["points"], rtol=1e-9, atol=0)
+	assert [list(f) for f in ascii["faces"]] == [list(f) for f in binary["faces"]]
+	for name in ("owner", "neighbour"):
+		assert np.array_equal(ascii[name], binary[name])
+	assert ascii["patches"] == binary["patches"]
+
+def test_detects_differences(polymesh_data, reference, tmp_path):
+	directory = str(tmp_path / "polyMesh")
+	data = dict(polymesh_data)
+	data["points"] = polymesh_data["points"].copy()
+	data["points"][0] += 1e-3
+	writePolyMesh(directory, **data)
+	assert comparePolyMesh(directory, reference) != []
+
+	# Reversing internal faces makes them point into their owner cells
+	data = dict(polymesh_data)
+	data["faces"] = polymesh_data["faces"].copy()
+	n_internal = len(polymesh_data["neighbour"])
+	data["faces"][:n_internal] = data["faces"][:n_internal,::-1]
+	writePolyMesh(directory, **data)
+	assert comparePolyMesh(directory, reference) != []
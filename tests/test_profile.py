@@ -0,0 +1,54 @@
+# test_profile.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Vectorized blade profile against the original per-midpoint integration."""
+
+import math
+
+import numpy as np
+import scipy.interpolate
+
+def loopProfile(rotor, interp):
+	"""Blade profile (th, beta) integrated one midpoint at a time, as before it
+	was vectorized.  interp maps a (1, 2) array of (r, z) to (1, 3) velocities."""
+	r, z = rotor.r, rotor.z
+	th = np.zeros(r.shape)
+	beta = np.zeros(r.shape)
+	for s in range(r.shape[1]):
+		for m in range(1, r.shape[0]):
+			midpoint = np.array([[(r[m,s]+r[m-1,s])/2, (z[m,s]+z[m-1,s])/2]])
+			u_midpoint = interp(midpoint)[0]
+			w_m = math.sqrt(u_midpoint[0]**2 + u_midpoint[2]**2)
+			w_th = (u_midpoint[1] - rotor.Omega * r[m,s])
+			x_m = math.sqrt((r[m,s] - r[m-1,s])**2 + (z[m,s] - z[m-1,s])**2)
+			th[m,s] = th[m-1,s] + x_m * w_th / (r[m,s] * w_m)
+			beta[m,s] = math.atan2(w_m, w_th)
+		th[:,s] -= th[-1,s]
+	beta[0,:] = beta[1,:]
+	return th, beta
+
+def test_nearest_matches_loop(rotor):
+	assert rotor.profile_interpolation == "nearest"
+	interp = scipy.interpolate.NearestNDInterpolator(rotor.rz_points, rotor.u_rtz_points)
+	th, beta = loopProfile(rotor, interp)
+	assert np.allclose(rotor.th, th, rtol=0, atol=1e-12)
+	assert np.allclose(rotor.beta, beta, rtol=0, atol=1e-12)
+
+def test_linear_matches_loop(rotor):
+	linear = scipy.interpolate.LinearNDInterpolator(rotor.rz_points, rotor.u_rtz_points)
+	nearest = scipy.interpolate.NearestNDInterpolator(rotor.rz_points, rotor.u_rtz_points)
+	outside = []
+	def interp(midpoint):
+		u = linear(midpoint)
+		outside.append(np.isnan(u[0,0]))
+		return nearest(midpoint) if outside[-1] else u
+	th, beta = loopProfile(rotor, interp)
+	# Hub and shroud midpoints lie outside the hull of the sampled cell centres
+	assert 0 < sum(outside) < len(outside)
+
+	th_nearest = rotor.th
+	rotor.profile_interpolation = "linear"
+	rotor.makeBladeProfile()
+	assert not np.allclose(rotor.th, th_nearest)
+	assert np.allclose(rotor.th, th, rtol=0, atol=1e-9)
+	assert np.allclose(rotor.beta, beta, rtol=0, atol=1e-9)
@@ -0,0 +1,74 @@
+# test_samples.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Raw surface sample loading and its .npy sidecar cache."""
+
+import os
+import glob
+import shutil
+
+import numpy as np
+import pytest
+
+from turbokit.FreeVortex import loadPatchSamples
+from tests.openfoam_stubs import FIXTURE_DIR
+
+RECORDED = os.path.join(FIXTURE_DIR, "U_frontWall.raw")
+
+@pytest.fixture
+def sample_file(tmp_path):
+	filename = str(tmp_path / "U_frontWall.raw")
+	shutil.copy(RECORDED, filename)
+	return filename
+
+def sidecars(filename):
+	return glob.glob(glob.escape(filename) + ".*")
+
+def test_parses_samples(sample_file):
+	points, values = loadPatchSamples(sample_file, cache=False)
+	data = np.loadtxt(RECORDED, comments="#")
+	assert np.array_equal(points, data[:,:3])
+	assert np.array_equal(values, data[:,3:])
+
+def test_scalar_samples(tmp_path):
+	filename = str(tmp_path / "p_frontWall.raw")
+	with open(filename, "w") as f:
+		f.write("# x y z p\n0 0 0 1.5\n1 0 0 2.5\n")
+	points, values = loadPatchSamples(filename)
+	assert points.shape == (2, 3)
+	assert values.tolist() == [1.5, 2.5]
+
+def test_cache_hit(sample_file, monkeypatch):
+	points, values = loadPatchSamples(sample_file)
+	sidecar, = sidecars(sample_file)
+	assert sidecar.endswith(".npy")
+	# A hit memory-maps the sidecar instead of parsing the text
+	monkeypatch.setattr(np, "loadtxt", None)
+	cached_points, cached_values = loadPatchSamples(sample_file)
+	assert isinstance(cached_points.base, np.memmap)
+	assert np.array_equal(cached_points, points)
+	assert np.array_equal(cached_values, values)
+
+def test_rewrite_invalidates(sample_file):
+	loadPatchSamples(sample_file)
+	old_sidecar, = sidecars(sample_file)
+	with open(sample_file) as f:
+		lines = f.readlines()
+	for i in range(3):
+		with open(sample_file, "w") as f:
+			f.writelines(lines[:len(lines) - 1 - i])
+		points, values = loadPatchSamples(sample_file)
+		assert len(points) == len(lines) - 4 - i # three header lines
+		assert sidecars(sample_file) != [old_sidecar]
+		assert len(sidecars(sample_file)) == 1
+
+def test_cache_off(sample_file, monkeypatch):
+	loadPatchSamples(sample_file, cache=False)
+	assert sidecars(sample_file) == []
+	# An existing sidecar is not used either
+	loadPatchSamples(sample_file)
+	sidecar, = sidecars(sample_file)
+	np.save(sidecar, np.zeros((1, 6)))
+	points, values = loadPatchSamples(sample_file, cache=False)
+	assert len(points) > 1
+	assert sidecars(sample_file) == [sidecar]
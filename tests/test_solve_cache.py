@@ -0,0 +1,108 @@
+# test_solve_cache.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Solve cache hits, misses and eviction, against the stub OpenFOAM tools."""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from turbokit import FreeVortex, Instrumentation
+from turbokit.SolveCache import SolveCache
+
+@pytest.fixture
+def records():
+	records = []
+	previous = Instrumentation.setSink(records.append)
+	yield records
+	Instrumentation.setSink(previous)
+
+def solve(casename, cache, **params):
+	return FreeVortex(casename=str(casename), points_m=15, points_s=10,
+	                  solve_cache=cache, **params)
+
+def stages(records, name):
+	return [record for record in records if record["stage"] == name]
+
+def test_hit(stub_openfoam, tmp_path, records):
+	cache = SolveCache(str(tmp_path / "cache"))
+	first = solve(tmp_path / "first", cache)
+	assert [r["hit"] for r in stages(records, "solveCache")] == [False]
+	assert len(stages(records, "solver")) == 1
+
+	del records[:]
+	second = solve(tmp_path / "second", cache)
+	assert [r["hit"] for r in stages(records, "solveCache")] == [True]
+	assert stages(records, "solver") == []
+	assert not os.path.exists(str(tmp_path / "second"))
+	assert second.end_time == first.end_time
+	assert np.array_equal(second.u_rtz_points, first.u_rtz_points)
+	assert np.array_equal(second.rz_points, first.rz_points)
+	assert second.boundaries == first.boundaries
+
+def test_miss_after_parameter_change(stub_openfoam, tmp_path, records):
+	cache = SolveCache(str(tmp_path / "cache"))
+	solve(tmp_path / "first", cache)
+	del records[:]
+	solve(tmp_path / "second", cache, inlet_v=(1.0, 0.0, 0.0))
+	assert [r["hit"] for r in stages(records, "solveCache")] == [False]
+	assert len(stages(records, "solver")) == 1
+	assert len(cache.entries()) == 2
+
+def test_lazy_update_misses(stub_openfoam, tmp_path, records):
+	cache = SolveCache(str(tmp_path / "cache"))
+	fv = FreeVortex(casename=str(tmp_path / "case"), points_m=15, points_s=10,
+	                solve_cache=cache, lazy=True)
+	fv.u_rtz_points
+	fv.update(rho=1.2)
+	fv.u_rtz_points
+	fv.update(rho=1e3)
+	fv.u_rtz_points
+	assert [r["hit"] for r in stages(records, "solveCache")] == [False, False, True]
+
+def test_lazy_hit_sets_boundaries(stub_openfoam, tmp_path, records):
+	cache = SolveCache(str(tmp_path / "cache"))
+	first = solve(tmp_path / "first", cache)
+	fv = FreeVortex(casename=str(tmp_path / "second"), points_m=15, points_s=10,
+	                solve_cache=cache, lazy=True)
+	assert fv.boundaries == first.boundaries
+	assert [r["hit"] for r in stages(records, "solveCache")] == [False, True]
+	assert not os.path.exists(str(tmp_path / "second"))
+
+def store(cache, key, age=0, size=1000):
+	"""Put a size byte entry last used age seconds ago."""
+	cache.put(key, data=np.zeros(size, dtype=np.uint8))
+	used = time.time() - age
+	os.utime(cache.entryPath(key), (used, used))
+
+def keys(cache):
+	return sorted(os.path.basename(path)[:-len(".npz")]
+	              for mtime, size, path in cache.entries())
+
+def test_evicts_least_recently_used(tmp_path):
+	cache = SolveCache(str(tmp_path / "cache"))
+	store(cache, "a", age=30)
+	store(cache, "b", age=20)
+	store(cache, "c", age=10)
+	entry_size = cache.entries()[0][1]
+	cache.max_bytes = 3 * entry_size
+
+	assert cache.get("a") is not None # now the most recently used
+	store(cache, "d")
+	assert keys(cache) == ["a", "c", "d"]
+	store(cache, "e")
+	assert keys(cache) == ["a", "d", "e"]
+
+def test_expires_old_entries(tmp_path):
+	cache = SolveCache(str(tmp_path / "cache"), max_age=60)
+	store(cache, "old", age=120)
+	store(cache, "new", age=30) # expires "old" when stored
+	assert keys(cache) == ["new"]
+	assert cache.get("new") is not None
+
+	used = time.time() - 90
+	os.utime(cache.entryPath("new"), (used, used))
+	assert cache.get("new") is None
+	assert keys(cache) == []
@@ -0,0 +1,84 @@
+# test_splines.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Bernstein-basis Bezier evaluation against De Casteljau and the cubic closed
+form it replaced."""
+
+import numpy as np
+import pytest
+
+from turbokit.Splines import BezierCurve, BezierSurface
+
+U = np.array([0.0, 0.1, 0.25, 0.5, 0.8, 1.0])
+
+def deCasteljau(ctrlpoints, u):
+	"""Point on the Bezier curve at scalar u by repeated linear interpolation."""
+	points = np.array(ctrlpoints, dtype=float)
+	while len(points) > 1:
+		points = (1 - u) * points[:-1] + u * points[1:]
+	return points[0]
+
+def deCasteljauSurface(ctrlpoints, u, v):
+	"""Point on the Bezier surface at scalar (u, v), one curve in v per row."""
+	return deCasteljau([deCasteljau(row, v) for row in ctrlpoints], u)
+
+def cubic(ctrlpoints, u):
+	"""The closed form the cubic BezierCurve used before."""
+	return (1-u)**3 * ctrlpoints[0] + 3*u*((1-u)**2) * ctrlpoints[1] + \
+	       3*(u**2)*(1-u) * ctrlpoints[2] + u**3 * ctrlpoints[3]
+
+def controlPoints(*shape):
+	return np.random.default_rng(sum(shape)).random(shape)
+
+@pytest.mark.parametrize("order", [2, 3, 4, 5, 8, 12])
+def test_curve_matches_de_casteljau(order):
+	curve = BezierCurve(controlPoints(order, 2))
+	expected = np.array([deCasteljau(curve.ctrlpoints, u) for u in U])
+	assert np.allclose(curve(U), expected, rtol=0, atol=1e-14)
+
+def test_curve_matches_cubic_closed_form():
+	ctrlpoints = controlPoints(4, 3)
+	curve = BezierCurve(ctrlpoints)
+	for u in U:
+		assert np.allclose(curve(u), cubic(ctrlpoints, u), rtol=0, atol=1e-15)
+
+def test_curve_argument_shapes():
+	curve = BezierCurve(controlPoints(6, 2))
+	assert curve(0.3).shape == (2,)
+	assert np.array_equal(curve(0.3), curve(np.array([0.3]))[0])
+	u = U.reshape(2, 3)
+	assert curve(u).shape == (2, 3, 2)
+	assert np.array_equal(curve(u).reshape(-1, 2), curve(U))
+	with pytest.raises(AssertionError):
+		curve(1.5)
+
+def test_bicubic_surface_matches_closed_form():
+	# The old surface evaluation: a cubic in u through cubics in v of each row
+	ctrlpoints = controlPoints(4, 4, 2)
+	surface = BezierSurface(ctrlpoints)
+	for u, v in zip(U, U[::-1]):
+		expected = cubic(np.array([cubic(row, v) for row in ctrlpoints]), u)
+		assert np.allclose(surface(u, v), expected, rtol=0, atol=1e-15)
+
+@pytest.mark.parametrize("order_u, order_v", [(2, 2), (4, 4), (5, 3), (7, 6)])
+def test_surface_matches_de_casteljau(order_u, order_v):
+	surface = BezierSurface(controlPoints(order_u, order_v, 2))
+	v = U[::-1]
+	expected = np.array([deCasteljauSurface(surface.ctrlpoints, a, b)
+	                     for a, b in zip(U, v)])
+	assert np.allclose(surface(U, v), expected, rtol=0, atol=1e-14)
+	assert np.allclose(surface(U[2], v[2]), expected[2], rtol=0, atol=1e-14)
+
+@pytest.mark.parametrize("order_u, order_v", [(4, 4), (6, 3)])
+def test_surface_grid(order_u, order_v):
+	surface = BezierSurface(controlPoints(order_u, order_v, 2))
+	v = np.linspace(0, 1, 4)
+	grid = surface.grid(U, v)
+	assert grid.shape == (len(U), len(v), 2)
+	u_n, v_n = np.meshgrid(U, v, indexing="ij")
+	assert np.allclose(grid, surface(u_n, v_n), rtol=0, atol=1e-15)
+	for i, j in np.ndindex(grid.shape[:2]):
+		assert np.allclose(grid[i,j], deCasteljauSurface(surface.ctrlpoints, U[i], v[j]),
+		                   rtol=0, atol=1e-14)
+	# Scalar arguments broadcast against arrays
+	assert np.allclose(surface(U, 0.5), surface.grid(U, [0.5])[:,0], rtol=0, atol=1e-15)
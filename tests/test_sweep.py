@@ -0,0 +1,44 @@
+# test_sweep.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Sweep failure handling, with a stand-in design class instead of OpenFOAM."""
+
+import os
+
+import numpy as np
+
+from turbokit.Sweep import Sweep, parameterGrid
+
+class StubDesign(object):
+	"""Stand-in for FreeVortex that kills its worker process outright when
+	crash is set, and raises for fail."""
+	def __init__(self, casename, value=0, crash=False, fail=False):
+		if crash:
+			os._exit(1)
+		if fail:
+			raise ValueError("bad point")
+		self.xyz_points = np.full((2, 3), value, dtype=float)
+		self.u_xyz_points = np.zeros((2, 3))
+
+def test_dead_worker_fails_only_its_point(tmp_path):
+	grid = [{"value": i, "crash": i == 3, "fail": i == 5} for i in range(8)]
+	sweep = Sweep(grid, base_dir=str(tmp_path / "sweep"), cls=StubDesign,
+	              processes=2, write_stl=False)
+	table = sweep.run()
+	assert [row["index"] for row in table] == list(range(8))
+	status = dict((row["index"], row["status"]) for row in table)
+	assert status == dict((i, "failed" if i in (3, 5) else "ok") for i in range(8))
+	assert table[3]["error"].startswith("BrokenProcessPool")
+	assert table[5]["error"] == "ValueError: bad point"
+	for row in table:
+		if row["status"] == "ok":
+			samples = np.load(row["samples"])
+			assert np.all(samples["xyz_points"] == row["index"])
+
+	# Recorded failures are not rerun unless asked to
+	assert Sweep(grid, base_dir=str(tmp_path / "sweep"), cls=StubDesign,
+	             processes=2, write_stl=False).run() == table
+
+def test_parameter_grid():
+	grid = parameterGrid(Z=[5, 7], Omega=[1.0])
+	assert grid == [{"Omega": 1.0, "Z": 5}, {"Omega": 1.0, "Z": 7}]
@@ -2,45 +2,170 @@
 # Copyright (c) 2015 Peter Hokanson
 # Vertical Limit Labs
 
-import math
+import copy
 
 import numpy as np
-import scipy.interpolate
-import matplotlib.pyplot as plt
 
-from Splines import *
+from .Splines import *
+
+def default_thickness(m, s):
+	"""Default blade half-thickness: 1mm, tapering to zero at inlet and outlet.
+	Accepts scalar or array m, s."""
+	return np.where((np.asarray(m) == 0) | (np.asarray(m) == 1), 0, 0.001)
+
+def merge_meshes(meshes):
+	"""Concatenate a sequence of (vertices, quads) pairs into one indexed mesh,
+	offsetting each part's indices into the combined vertex array."""
+	vertices = []
+	quads = []
+	offset = 0
+	for v, q in meshes:
+		vertices.append(v)
+		quads.append(q + offset)
+		offset += len(v)
+	if not vertices:
+		return np.zeros((0, 3)), np.zeros((0, 4), dtype=int)
+	return np.concatenate(vertices), np.concatenate(quads)
+
+WELD_HASH = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9],
+                     dtype=np.uint64)
+
+def weld_cells(points, shift):
+	"""Sort points into the cells of the unit grid offset by shift.  Returns
+	(cell, order, starts): the cell number of each point, the points in cell
+	order, and where each cell starts in that order."""
+	keys = np.floor(points + shift).astype(np.int64).view(np.uint64)
+	# Spatial hash of the cell indices, much faster to sort than the indices
+	# themselves.  Multiplying by large odd constants modulo 2**64 keeps the
+	# hashes of distinct cells apart.
+	hashed = keys[:,0] * WELD_HASH[0] + keys[:,1] * WELD_HASH[1] + keys[:,2] * WELD_HASH[2]
+	order = np.argsort(hashed)
+	new_cell = np.diff(hashed[order]) != 0
+	same = ~new_cell
+	if np.any(keys[order[1:][same]] != keys[order[:-1][same]]):
+		# Colliding cells may be interleaved; sort by the indices instead
+		order = np.lexsort(keys.T[::-1])
+		new_cell = np.any(np.diff(keys[order].astype(np.int64), axis=0) != 0, axis=1)
+	cell = np.empty(len(points), dtype=np.int64)
+	cell[order] = np.cumsum(np.concatenate(([0], new_cell)))
+	return cell, order, np.flatnonzero(np.concatenate(([True], new_cell)))
+
+def weld_mesh(vertices, quads, tolerance):
+	"""Merge the vertices of an indexed mesh that lie within tolerance of each
+	other, such as the nodes that blades, hub spans and shroud edges share but
+	each store separately.  Returns (vertices, quads) with one shared vertex
+	table; each merged vertex keeps the position of its first copy.
+	
+	Vertices are hashed into cells of size 2 * tolerance on eight grids, offset
+	by half a cell along each combination of axes.  Two vertices closer than
+	tolerance along every axis share a cell on at least one of the grids, and
+	vertices sharing a cell on any grid are merged, transitively."""
+	vertices = np.asarray(vertices, dtype=float)
+	if len(vertices) == 0:
+		return vertices, quads
+	points = vertices / (2 * tolerance)
+	cells = []
+	for shift in np.array(np.meshgrid([0, .5], [0, .5], [0, .5])).T.reshape(-1, 3):
+		cells.append(weld_cells(points, shift))
+	# Label each vertex with the lowest index it is connected to
+	labels = np.arange(len(vertices))
+	while True:
+		previous = labels
+		for cell, order, starts in cells:
+			labels = np.minimum(labels, np.minimum.reduceat(labels[order], starts)[cell])
+		labels = labels[labels]
+		if np.array_equal(labels, previous):
+			break
+	first, index = np.unique(labels, return_inverse=True)
+	return vertices[first], index.ravel()[quads]
+
+def rotate_z(vertices, angles):
+	"""Rotate an (N, 3) vertex array about the z axis by each of the given
+	angles in one batched rotation-matrix product.  Returns (len(angles), N, 3)."""
+	angles = np.asarray(angles, dtype=float)
+	c = np.cos(angles)
+	s = np.sin(angles)
+	zero = np.zeros_like(angles)
+	one = np.ones_like(angles)
+	rotations = np.stack((np.stack((c, -s, zero), axis=-1),
+	                      np.stack((s, c, zero), axis=-1),
+	                      np.stack((zero, zero, one), axis=-1)), axis=-2)
+	return np.matmul(vertices, rotations.transpose(0, 2, 1))
+
+def instance_mesh(mesh, angles):
+	"""Copy a (vertices, quads) mesh once per angle, rotated about the z axis,
+	and return the copies merged into one indexed mesh."""
+	vertices, quads = mesh
+	offsets = np.arange(len(angles)) * len(vertices)
+	return (rotate_z(vertices, angles).reshape(-1, 3),
+	        (quads[np.newaxis] + offsets[:, np.newaxis, np.newaxis]).reshape(-1, 4))
+
+class IndexedMeshBase(object):
+	"""Geometry stored as an indexed quad mesh: self.vertices is an (N, 3) array
+	of Cartesian points and self.quads an (F, 4) integer array of indices into
+	it.  Triangles are stored as quads with the last index repeated."""
+
+	@property
+	def faces(self):
+		"""Faces as nested lists of xyz vertices, for consumers of the old
+		list-based interface.  Prefer the vertices/quads arrays."""
+		triangle = self.quads[:,3] == self.quads[:,2]
+		return [face[:3] if tri else face for face, tri in
+		        zip(self.vertices[self.quads].tolist(), triangle.tolist())]
 
 class BladeFactoryBase(object):
 	"""Base class for blades in the turbine flow.  Presents as a factory object
 	capable of returning all of the blade faces at a given angular offset.  This
-	is then called repeatedly to make all of the matching blades."""
+	is then called repeatedly to make all of the matching blades.
+
+	Thickness functions are called as f(m, s) with normalized m and s.  When
+	array_thickness is set they are first called once with whole (m, s) grids;
+	functions that only handle scalars (raising on array input or returning the
+	wrong shape) automatically fall back to one call per grid node."""
 
 	def __init__(self,
-	             thickness_fn_l=lambda m,s: 0 if m == 0 or m == 1 else 0.001,
-	             thickness_fn_t=lambda m,s: 0 if m == 0 or m == 1 else 0.001,
+	             thickness_fn_l=default_thickness,
+	             thickness_fn_t=default_thickness,
 	             m_min = 0,
-	             m_max = 1):
+	             m_max = 1,
+	             array_thickness = True):
 		self.thickness_fn_l = thickness_fn_l
 		self.thickness_fn_t = thickness_fn_t
 		self.m_min = m_min # TODO: not implemented
 		self.m_max = m_max # TODO: not implemented
+		self.array_thickness = array_thickness
+
+	def evaluateThickness(self, thickness_fn, m_n, s_n):
+		"""Evaluate a thickness function over the normalized grids m_n, s_n."""
+		if self.array_thickness:
+			try:
+				thickness = np.asarray(thickness_fn(m_n, s_n), dtype=float)
+				return np.broadcast_to(thickness, m_n.shape)
+			except (TypeError, ValueError):
+				pass # scalar-only function, fall back to per-node calls
+		thickness = np.zeros(m_n.shape)
+		for idx in np.ndindex(m_n.shape):
+			thickness[idx] = thickness_fn(float(m_n[idx]), float(s_n[idx]))
+		return thickness
 
-	def __call__(self, r, z, th, beta):
-		th_l = np.copy(th)
-		th_t = np.copy(th)
-		for s in range(0, r.shape[1]):
-			for m in range(0, r.shape[0]):
-				s_n = s / (r.shape[1]-1)
-				m_n = m / (r.shape[0]-1)
-				thickness_l = self.thickness_fn_l(m_n,s_n)
-				thickness_t = self.thickness_fn_t(m_n,s_n)
-				dth_l = (thickness_l) * math.sin(beta[m,s]) / r[m,s]
-				dth_t = -(thickness_t) * math.sin(beta[m,s]) / r[m,s]
-				th_l[m,s] += dth_l
-				th_t[m,s] += dth_t
+	def __call__(self, r, z, th, beta, m_values=None, s_values=None):
+		"""Make a blade on the (M, S) grid r, z with centerline angles th and
+		blade angles beta.  m_values and s_values are the patch parameters of
+		the grid lines, used for the thickness functions; by default the grid
+		is taken to be uniform in m and s."""
+		if m_values is None:
+			m_values = np.arange(r.shape[0]) / (r.shape[0]-1)
+		if s_values is None:
+			s_values = np.arange(r.shape[1]) / (r.shape[1]-1)
+		m_n, s_n = np.meshgrid(m_values, s_values, indexing="ij")
+		thickness_l = self.evaluateThickness(self.thickness_fn_l, m_n, s_n)
+		thickness_t = self.evaluateThickness(self.thickness_fn_t, m_n, s_n)
+		sin_beta_r = np.sin(beta) / r
+		th_l = th + thickness_l * sin_beta_r
+		th_t = th - thickness_t * sin_beta_r
 		return BladeBase(r, z, th_l, th_t)
 
-class BladeBase(object):
+class BladeBase(IndexedMeshBase):
 	"""Class for representing blade geometry.  Calculates faces and stores
 	geometry.  Generally meant to be produced by below factory type.  Blade
 	may or may not encompass entire flow region (as in a splitter blade in a
@@ -62,89 +187,140 @@ class BladeBase(object):
 
 		self.makeBladeFaces()
 
+	def rotated(self, dth, vertices=None):
+		"""Copy of this blade rotated by dth about the axis.  The rotated vertices
+		may be passed in when they were already computed in a batch."""
+		blade = copy.copy(self)
+		blade.th_l = self.th_l + dth
+		blade.th_t = self.th_t + dth
+		if vertices is None:
+			vertices = rotate_z(self.vertices, [dth])[0]
+		blade.vertices = vertices
+		return blade
+
+	def edges(self):
+		"""BladeEdges of this blade, for completers built without the mesh."""
+		return BladeEdges(self.th_l, self.th_t)
+
+	def makeBladeVertices(self):
+		"""Convert the leading side and trailing side grids to Cartesian points in
+		one step.  Leading side node (m, s) is vertex self.idx_l[m,s], trailing
+		side node is self.idx_t[m,s]."""
+		points_m, points_s = self.r.shape
+		self.idx_l = np.arange(points_m * points_s).reshape(points_m, points_s)
+		self.idx_t = self.idx_l + points_m * points_s
+		self.vertices = rtz_to_xyz_array(np.concatenate((self.r, self.r)),
+		                                 np.concatenate((self.th_l, self.th_t)),
+		                                 np.concatenate((self.z, self.z))).reshape(-1, 3)
+
 	def makeBladeLeadingEdge(self):
-		for s in range(1, self.r.shape[1]):
-			self.faces.append([rtz_to_xyz([self.r[0,s-1], self.th_l[0,s-1], self.z[0,s-1]]),
-			                   rtz_to_xyz([self.r[0,s-1], self.th_t[0,s-1], self.z[0,s-1]]),
-			                   rtz_to_xyz([self.r[0,s  ], self.th_t[0,s  ], self.z[0,s  ]]),
-			                   rtz_to_xyz([self.r[0,s  ], self.th_l[0,s  ], self.z[0,s  ]])])
+		l, t = self.idx_l[0], self.idx_t[0]
+		return np.stack((l[:-1], t[:-1], t[1:], l[1:]), axis=-1)
 
 	def makeBladeTrailingEdge(self):
-		for s in range(1, self.r.shape[1]):
-			self.faces.append([rtz_to_xyz([self.r[-1,s-1], self.th_l[-1,s-1], self.z[-1,s-1]]),
-			                   rtz_to_xyz([self.r[-1,s  ], self.th_l[-1,s  ], self.z[-1,s  ]]),
-			                   rtz_to_xyz([self.r[-1,s  ], self.th_t[-1,s  ], self.z[-1,s  ]]),
-			                   rtz_to_xyz([self.r[-1,s-1], self.th_t[-1,s-1], self.z[-1,s-1]])])
+		l, t = self.idx_l[-1], self.idx_t[-1]
+		return np.stack((l[:-1], l[1:], t[1:], t[:-1]), axis=-1)
 
 	def makeBladeLeadingSide(self):
-		for m in range(1, self.r.shape[0]):
-			for s in range(1, self.r.shape[1]):
-				self.faces.append([rtz_to_xyz([self.r[m-1,s-1], self.th_l[m-1,s-1], self.z[m-1,s-1]]),
-				                   rtz_to_xyz([self.r[m-1,s  ], self.th_l[m-1,s  ], self.z[m-1,s  ]]),
-				                   rtz_to_xyz([self.r[m  ,s  ], self.th_l[m  ,s  ], self.z[m  ,s  ]]),
-				                   rtz_to_xyz([self.r[m  ,s-1], self.th_l[m  ,s-1], self.z[m  ,s-1]])])
+		l = self.idx_l
+		return np.stack((l[:-1,:-1], l[:-1,1:], l[1:,1:], l[1:,:-1]), axis=-1).reshape(-1, 4)
 
 	def makeBladeTrailingSide(self):
-		for m in range(1, self.r.shape[0]):
-			for s in range(1, self.r.shape[1]):
-				self.faces.append([rtz_to_xyz([self.r[m-1,s-1], self.th_t[m-1,s-1], self.z[m-1,s-1]]),
-				                   rtz_to_xyz([self.r[m  ,s-1], self.th_t[m  ,s-1], self.z[m  ,s-1]]),
-				                   rtz_to_xyz([self.r[m  ,s  ], self.th_t[m  ,s  ], self.z[m  ,s  ]]),
-				                   rtz_to_xyz([self.r[m-1,s  ], self.th_t[m-1,s  ], self.z[m-1,s  ]])])
+		t = self.idx_t
+		return np.stack((t[:-1,:-1], t[1:,:-1], t[1:,1:], t[:-1,1:]), axis=-1).reshape(-1, 4)
 
 	def makeBladeFaces(self):
-		self.faces = []
-		self.makeBladeLeadingEdge()
-		self.makeBladeTrailingEdge()
-		self.makeBladeLeadingSide()
-		self.makeBladeTrailingSide()
-		return self.faces
-
-class BladeCompleterBase(object):
-	def __init__(self, blades, r, z, s):
+		"""Build the blade as an indexed quad mesh.  Returns (vertices, quads)."""
+		self.makeBladeVertices()
+		self.quads = np.concatenate((self.makeBladeLeadingEdge(),
+		                             self.makeBladeTrailingEdge(),
+		                             self.makeBladeLeadingSide(),
+		                             self.makeBladeTrailingSide()))
+		return self.vertices, self.quads
+
+class BladeEdges(object):
+	"""The hub and shroud columns of a blade's th_l and th_t, which is all of
+	a blade the completers use.  Stands in for a BladeBase whose mesh is not
+	kept, e.g. while streaming the rotor."""
+	def __init__(self, th_l, th_t):
+		self.th_l = th_l[:,[0,-1]]
+		self.th_t = th_t[:,[0,-1]]
+
+	def rotated(self, dth):
+		return BladeEdges(self.th_l + dth, self.th_t + dth)
+
+class BladeCompleterBase(IndexedMeshBase):
+	"""Base class for the geometry between blades at the hub (s=0) or shroud
+	(s=1).  Subclasses implement iterParts(), generating the geometry as a
+	sequence of (vertices, quads) parts.  With lazy=True the merged mesh is not
+	built on construction, so the parts can be streamed instead."""
+	def __init__(self, blades, r, z, s, lazy=False):
 		self.s = s
 		self.r = r
 		self.z = z
 		assert self.s == 0 or self.s == 1, "BladeCompleterBase called for neither hub nor shroud"
 		self.blades = blades
-		self.makeFaces()
+		if not lazy:
+			self.makeFaces()
 
-class BladeEdgeCompleter(BladeCompleterBase):
 	def makeFaces(self):
-		self.faces = []
+		self.vertices, self.quads = merge_meshes(self.iterParts())
+		return self.vertices, self.quads
+
+class BladeEdgeCompleter(BladeCompleterBase):
+	def iterParts(self):
 		for blade in self.blades:
-			self.makeBladeEdge(blade)
+			yield self.makeBladeEdge(blade)
 
 	def makeBladeEdge(self, b):
-		for m in range(1, self.r.shape[0]):
-			if self.s == 0:
-				# Faces at blade hub ends
-				self.faces.append([rtz_to_xyz([self.r[m-1,0], b.th_l[m-1,0], self.z[m-1,0]]),
-				                   rtz_to_xyz([self.r[m  ,0], b.th_l[m  ,0], self.z[m  ,0]]),
-				                   rtz_to_xyz([self.r[m  ,0], b.th_t[m  ,0], self.z[m  ,0]]),
-				                   rtz_to_xyz([self.r[m-1,0], b.th_t[m-1,0], self.z[m-1,0]])])
-			elif self.s == 1:
-				# Faces at blade shroud ends
-				self.faces.append([rtz_to_xyz([self.r[m-1,-1], b.th_t[m-1,-1], self.z[m-1,-1]]),
-				                   rtz_to_xyz([self.r[m  ,-1], b.th_t[m  ,-1], self.z[m  ,-1]]),
-				                   rtz_to_xyz([self.r[m  ,-1], b.th_l[m  ,-1], self.z[m  ,-1]]),
-				                   rtz_to_xyz([self.r[m-1,-1], b.th_l[m-1,-1], self.z[m-1,-1]])])
+		col = 0 if self.s == 0 else -1
+		r = self.r[:,col]
+		z = self.z[:,col]
+		vertices = rtz_to_xyz_array(np.concatenate((r, r)),
+		                            np.concatenate((b.th_l[:,col], b.th_t[:,col])),
+		                            np.concatenate((z, z)))
+		l = np.arange(len(r))
+		t = l + len(r)
+		if self.s == 0:
+			# Faces at blade hub ends
+			quads = np.stack((l[:-1], l[1:], t[1:], t[:-1]), axis=-1)
+		else:
+			# Faces at blade shroud ends
+			quads = np.stack((t[:-1], t[1:], l[1:], l[:-1]), axis=-1)
+		return vertices, quads
 
 class BladeHubCompleter(BladeCompleterBase):
-	def __init__(self, blades, r, z, s, interblade_faces = 6):
+	def __init__(self, blades, r, z, s, interblade_faces = 6, lazy=False):
 		self.interblade_faces = interblade_faces
-		super(BladeHubCompleter, self).__init__(blades, r, z, s)
+		super(BladeHubCompleter, self).__init__(blades, r, z, s, lazy)
 
-	def makeFaces(self):
-		self.faces = []
-		self.makeBladeSpans()
-		self.makeInletCap()
-		self.makeOutletCap()
+	def iterParts(self):
+		for part in self.makeBladeSpans():
+			yield part
+		for part in self.makeInletCap():
+			yield part
+		for part in self.makeOutletCap():
+			yield part
 
 	def makeInletCap(self):
+		caps = []
 		for i in range(1, len(self.blades)):
-			self.makeInletCapSingleBlade(self.blades[i-1], self.blades[i])
-		self.makeInletCapSingleBlade(self.blades[-1], self.blades[0], wrapBlade=True)
+			caps.append(self.makeInletCapSingleBlade(self.blades[i-1], self.blades[i]))
+		caps.append(self.makeInletCapSingleBlade(self.blades[-1], self.blades[0], wrapBlade=True))
+		return caps
+
+	def makeCapFan(self, th, m, reverse):
+		"""Triangle fan from the hub ring at meridional index m to the axis.  The
+		ring is vertices 0..len(th)-1, the axis point is the last vertex."""
+		vertices = np.concatenate((rtz_to_xyz_array(self.r[m,0], th, self.z[m,0]),
+		                           [[0, 0, self.z[m,0]]]))
+		j = np.arange(len(th) - 1)
+		center = np.full_like(j, len(th))
+		if reverse:
+			quads = np.stack((j+1, j, center, center), axis=-1)
+		else:
+			quads = np.stack((j, j+1, center, center), axis=-1)
+		return vertices, quads
 
 	def makeInletCapSingleBlade(self, b0, b1, wrapBlade = False):
 		# wrapBlade indicates whether to subtract 2*pi from the blade pair,
@@ -152,48 +328,41 @@ class BladeHubCompleter(BladeCompleterBase):
 		th_ma = np.linspace(b0.th_l[0,0],
 		                    b1.th_t[0,0] + wrapBlade * 2 * np.pi,
 		                    num=self.interblade_faces+1)
-		for j in range(self.interblade_faces):
-			# Cap at inlet
-			self.faces.append([rtz_to_xyz([self.r[0,0], th_ma[j]  , self.z[0,0]]),
-			                   rtz_to_xyz([self.r[0,0], th_ma[j+1]  , self.z[0,0]]),
-			                   rtz_to_xyz([0, 0, self.z[0,0]])])
+		# Cap at inlet
+		return self.makeCapFan(th_ma, 0, reverse=False)
 
 	def makeOutletCap(self):
+		caps = []
 		for i in range(1, len(self.blades)):
-			self.makeOutletCapSingleBlade(self.blades[i-1], self.blades[i])
-		self.makeOutletCapSingleBlade(self.blades[-1], self.blades[0], wrapBlade=True)
+			caps.append(self.makeOutletCapSingleBlade(self.blades[i-1], self.blades[i]))
+		caps.append(self.makeOutletCapSingleBlade(self.blades[-1], self.blades[0], wrapBlade=True))
+		return caps
 
 	def makeOutletCapSingleBlade(self, b0, b1, wrapBlade = False):
-		pass
 		th_mb = np.linspace(b0.th_l[-1,0],
 		                    b1.th_t[-1,0] + wrapBlade * 2 * np.pi,
 		                    num=self.interblade_faces+1)
-		for j in range(self.interblade_faces):
-			# Cap at outlet
-			self.faces.append([rtz_to_xyz([self.r[-1,0], th_mb[j+1]  , self.z[-1,0]]),
-			                   rtz_to_xyz([self.r[-1,0], th_mb[j]  , self.z[-1,0]]),
-			                   rtz_to_xyz([0, 0, self.z[-1,0]])])
+		# Cap at outlet
+		return self.makeCapFan(th_mb, -1, reverse=True)
 
 	def makeBladeSpans(self):
+		spans = []
 		for i in range(1, len(self.blades)):
-			self.makeBladeSpan(self.blades[i-1].th_l, self.blades[i].th_t)
+			spans.append(self.makeBladeSpan(self.blades[i-1].th_l, self.blades[i].th_t))
 		# Finally a little black magic to make the last inter-blade span work
 		# correctly.  The 2*pi offset ensures that they don't wrap the linear
 		# interpolation.
-		self.makeBladeSpan(self.blades[-1].th_l - 2 * np.pi, self.blades[0].th_t)
+		spans.append(self.makeBladeSpan(self.blades[-1].th_l - 2 * np.pi, self.blades[0].th_t))
+		return spans
 
 	def makeBladeSpan(self, th_l0, th_t1):
 		"""Given the leading edge profile of the current blade, and the trailing
 		edge of the next blade, create the junction between them."""
-		for m in range(1, self.r.shape[0]):
-			# Faces between blades
-			# theta points on upstream/downstream side of each face
-			th_ma = np.linspace(th_l0[m,0], th_t1[m,0], num=self.interblade_faces+1)
-			th_mb = np.linspace(th_l0[m-1,0], th_t1[m-1,0], num=self.interblade_faces+1)
-			for j in range(self.interblade_faces):
-				# We want to produce a mesh that interpolates between th_l[m0,0]+th_i and th_t[m0,0]+th_next
-				# and the same for m0
-				self.faces.append([rtz_to_xyz([self.r[m-1,0], th_mb[j]  , self.z[m-1,0]]),
-				                   rtz_to_xyz([self.r[m  ,0], th_ma[j]  , self.z[m  ,0]]),
-				                   rtz_to_xyz([self.r[m  ,0], th_ma[j+1], self.z[m  ,0]]),
-				                   rtz_to_xyz([self.r[m-1,0], th_mb[j+1], self.z[m-1,0]])])
+		# theta points across the span at each meridional station, interpolating
+		# between th_l0[m,0] and th_t1[m,0]
+		th = np.linspace(th_l0[:,0], th_t1[:,0], num=self.interblade_faces+1, axis=1)
+		vertices = rtz_to_xyz_array(self.r[:,0,np.newaxis], th,
+		                            self.z[:,0,np.newaxis]).reshape(-1, 3)
+		g = np.arange(th.size).reshape(th.shape)
+		quads = np.stack((g[:-1,:-1], g[1:,:-1], g[1:,1:], g[:-1,1:]), axis=-1).reshape(-1, 4)
+		return vertices, quads
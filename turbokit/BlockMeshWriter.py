@@ -0,0 +1,85 @@
+# BlockMeshWriter.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import numpy as np
+
+FOAM_BANNER = """/*--------------------------------*- C++ -*----------------------------------*\\
+| =========                 |                                                 |
+| \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |
+|  \\\\    /   O peration     | Version:  2.3.0                                 |
+|   \\\\  /    A nd           | Web:      www.OpenFOAM.org                      |
+|    \\\\/     M anipulation  |                                                 |
+\\*---------------------------------------------------------------------------*/
+"""
+
+def foamHeader(foam_class, foam_object, location=None, fmt="ascii", extra=()):
+	"""Banner and FoamFile header for an OpenFOAM file.  extra is a sequence of
+	(keyword, value) entries added after the standard ones."""
+	entries = [("version", "2.0"), ("format", fmt), ("class", foam_class)]
+	if location is not None:
+		entries.append(("location", '"%s"' % location))
+	entries.append(("object", foam_object))
+	entries.extend(extra)
+	return (FOAM_BANNER + "FoamFile\n{\n" +
+	        "".join("\t%-11s %s;\n" % entry for entry in entries) + "}\n\n")
+
+BLOCKMESH_HEADER = foamHeader("dictionary", "blockMeshDict")
+
+# Rows formatted per write; bounds the size of the intermediate strings
+CHUNK_ROWS = 1 << 16
+
+def writeRows(f, fmt, rows):
+	"""Write each row of a 2D array with the printf-style format fmt, in chunks
+	formatted with a single % operation each."""
+	rows = np.asarray(rows)
+	for start in range(0, len(rows), CHUNK_ROWS):
+		chunk = rows[start:start+CHUNK_ROWS]
+		f.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+def writeBlockMeshDict(f, vertices, blocks, cells, grading, boundary,
+                       edges=(), convertToMeters=1):
+	"""Write a blockMeshDict to the open text file f straight from arrays.
+	Every list is written with its length, as OpenFOAM list syntax allows.
+
+	Arguments:
+	vertices -- (N, 3) float array of vertex coordinates
+	blocks -- (B, 8) integer array of hex block corner indices
+	cells -- (B, 3) integer array of cell counts per block, or one (3,) row
+	grading -- (B, 3) array of simpleGrading expansion ratios, or one (3,) row
+	boundary -- sequence of (name, type, faces) with faces an (F, 4) array
+	edges -- sequence of (edge type, start vertex, end vertex, (P, 3) array of
+	         interpolation points), e.g. ("spline", 0, 1, points)
+	convertToMeters -- scale applied to all vertex coordinates"""
+	blocks = np.asarray(blocks, dtype=int)
+	cells = np.broadcast_to(np.asarray(cells, dtype=int), (len(blocks), 3))
+	grading = np.broadcast_to(np.asarray(grading, dtype=float), (len(blocks), 3))
+
+	f.write(BLOCKMESH_HEADER)
+	f.write("convertToMeters %.15g;\n\n" % convertToMeters)
+
+	f.write("vertices\n%d\n(\n" % len(vertices))
+	writeRows(f, "\t(%.15g %.15g %.15g)\n", vertices)
+	f.write(");\n\n")
+
+	f.write("blocks\n%d\n(\n" % len(blocks))
+	writeRows(f, "\thex (%d %d %d %d %d %d %d %d) (%d %d %d) simpleGrading (%.15g %.15g %.15g)\n",
+	          np.column_stack((blocks, cells, grading)))
+	f.write(");\n\n")
+
+	f.write("edges\n%d\n(\n" % len(edges))
+	for edge_type, start, end, points in edges:
+		f.write("\t%s %d %d\n\t%d\n\t(\n" % (edge_type, start, end, len(points)))
+		writeRows(f, "\t\t(%.15g %.15g %.15g)\n", points)
+		f.write("\t)\n")
+	f.write(");\n\n")
+
+	f.write("boundary\n%d\n(\n" % len(boundary))
+	for name, patch_type, faces in boundary:
+		f.write("\t%s\n\t{\n\t\ttype %s;\n\t\tfaces\n\t\t%d\n\t\t(\n" %
+		        (name, patch_type, len(faces)))
+		writeRows(f, "\t\t\t(%d %d %d %d)\n", faces)
+		f.write("\t\t);\n\t}\n")
+	f.write(");\n\n")
+
+	f.write("mergePatchPairs\n0\n(\n);\n")
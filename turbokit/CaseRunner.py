@@ -0,0 +1,119 @@
+# CaseRunner.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os
+import time
+import signal
+import asyncio
+import weakref
+import subprocess
+
+from . import Instrumentation
+
+# Per-tool timeouts in seconds; None waits indefinitely
+DEFAULT_TIMEOUTS = {
+	"blockMesh": 600,
+	"checkMesh": 600,
+	"simpleFoam": None,
+	"sample": 600,
+	"foamListTimes": 60,
+}
+
+class AsyncCaseRunner(object):
+	"""Runs the OpenFOAM toolchain for prepared FreeVortex cases (constructed
+	with run_solver=False) from an asyncio event loop.  Each tool runs as a
+	subprocess with its own timeout, writing stdout/stderr to log.<tool> in the
+	case directory.  At most max_concurrent cases are in flight at once.
+
+	A tool that exits with an error raises subprocess.CalledProcessError, one
+	that runs past its timeout is killed and raises subprocess.TimeoutExpired,
+	and cancelling the task running a case kills its current tool.  A runner
+	can be reused from several event loops, e.g. successive asyncio.run calls;
+	the max_concurrent limit applies per loop."""
+
+	def __init__(self, max_concurrent=None, timeouts=None):
+		"""Keyword arguments:
+		max_concurrent -- cases to run at once, defaults to the CPU count
+		timeouts -- dict of tool name to timeout, overriding DEFAULT_TIMEOUTS"""
+		self.max_concurrent = max_concurrent if max_concurrent is not None else os.cpu_count()
+		self.timeouts = dict(DEFAULT_TIMEOUTS)
+		if timeouts is not None:
+			self.timeouts.update(timeouts)
+		self.semaphores = weakref.WeakKeyDictionary()
+
+	def semaphore(self):
+		"""Semaphore limiting the cases in flight on the running event loop.
+		asyncio primitives are bound to the loop they are first used from, so
+		there is one per loop."""
+		loop = asyncio.get_running_loop()
+		if loop not in self.semaphores:
+			self.semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+		return self.semaphores[loop]
+
+	async def runStep(self, casename, args, capture=False):
+		"""Run one tool in the case directory.  Returns its stdout if capture is
+		set, otherwise stdout goes to the log with stderr.  Sends an
+		Instrumentation record with the tool's wall time only, since CPU time
+		is shared with the other cases in flight."""
+		timeout = self.timeouts.get(args[0])
+		start = time.perf_counter()
+		with open(os.path.join(casename, "log." + args[0]), "wb") as log:
+			proc = await asyncio.create_subprocess_exec(
+				*args, cwd=casename,
+				stdout=asyncio.subprocess.PIPE if capture else log,
+				stderr=log,
+				start_new_session=True)
+			try:
+				stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+			except asyncio.TimeoutError:
+				raise subprocess.TimeoutExpired(args, timeout)
+			finally:
+				# Reached with returncode unset on timeout or cancellation.  Kill the
+				# whole process group, in case the tool was started by a wrapper.
+				if proc.returncode is None:
+					try:
+						os.killpg(proc.pid, signal.SIGKILL)
+					except ProcessLookupError:
+						pass
+					await proc.wait()
+		Instrumentation.record(args[0], case=casename, wall=time.perf_counter() - start,
+		                       returncode=proc.returncode)
+		if proc.returncode != 0:
+			raise subprocess.CalledProcessError(proc.returncode, args)
+		return stdout
+
+	async def mesh(self, fv):
+		"""Run blockMesh and checkMesh on the case's blockMeshDict.  Cases that
+		wrote their polyMesh directly (direct_mesh) only run checkMesh."""
+		if fv.direct_mesh is None:
+			await self.runStep(fv.casename, ["blockMesh"])
+		await self.runStep(fv.casename, ["checkMesh"])
+
+	async def solve(self, fv):
+		"""Run the solver and sampling, then read back the solution."""
+		await self.runStep(fv.casename, ["simpleFoam"])
+		await self.runStep(fv.casename, ["sample", "-latestTime"])
+		end_time = await self.runStep(fv.casename, ["foamListTimes", "-latestTime"],
+		                              capture=True)
+		fv.readSolution(end_time.decode('utf-8')[:-1])
+
+	async def runCase(self, fv):
+		"""Mesh and solve one prepared case, then run its postSolve step (blade
+		profile and mesh for FreeVortexBlades) in a worker thread so the event
+		loop stays responsive.  Cases restored from a solve cache skip straight
+		to postSolve.  Returns fv."""
+		# Checked in __dict__, since on a lazy object the attribute lookup would
+		# run the solve stage synchronously on the event loop
+		if "xyz_points" not in fv.__dict__:
+			async with self.semaphore():
+				await self.mesh(fv)
+				await self.solve(fv)
+		await asyncio.get_running_loop().run_in_executor(None, fv.postSolve)
+		return fv
+
+	async def runCases(self, cases):
+		"""Run many prepared cases concurrently.  Returns a list matching cases,
+		holding either the finished case or the exception it failed with."""
+		return await asyncio.gather(*[self.runCase(fv) for fv in cases],
+		                            return_exceptions=True)
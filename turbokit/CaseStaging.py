@@ -0,0 +1,85 @@
+# CaseStaging.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os
+import shutil
+
+def isTimeDirectory(name):
+	"""Whether a case directory entry name is an OpenFOAM time directory."""
+	try:
+		float(name)
+		return True
+	except ValueError:
+		return False
+
+def writeIfChanged(filename, text):
+	"""Write text to filename unless the file already holds exactly that text.
+	The new file replaces the old one rather than being written into it, so a
+	hard link to a template file is broken instead of modifying the template.
+	Returns whether the file was written."""
+	data = text.encode("utf-8") if isinstance(text, str) else text
+	try:
+		if os.path.getsize(filename) == len(data):
+			with open(filename, "rb") as f:
+				if f.read() == data:
+					return False
+	except OSError:
+		pass
+	tmp = "%s.%d.tmp" % (filename, os.getpid())
+	with open(tmp, "wb") as f:
+		f.write(data)
+	os.replace(tmp, filename)
+	return True
+
+def linkTemplate(template, casename, keep=()):
+	"""Mirror the files of template into casename as hard links, falling back
+	to copies where the filesystem can't link.  Files already linked to the
+	template are left alone, as are existing files named (relative to the case)
+	in keep, which the caller rewrites itself.  Returns the number of files
+	linked or copied."""
+	keep = set(os.path.normpath(name) for name in keep)
+	staged = 0
+	for root, dirs, files in os.walk(template):
+		rel_dir = os.path.relpath(root, template)
+		os.makedirs(os.path.join(casename, rel_dir), exist_ok=True)
+		for name in files:
+			rel = os.path.normpath(os.path.join(rel_dir, name))
+			src = os.path.join(root, name)
+			dst = os.path.join(casename, rel)
+			if os.path.lexists(dst):
+				if rel in keep:
+					continue
+				try:
+					if os.path.samefile(src, dst):
+						continue
+				except OSError:
+					pass
+				os.remove(dst)
+			try:
+				os.link(src, dst)
+			except OSError:
+				shutil.copy2(src, dst)
+			staged += 1
+	return staged
+
+def cleanCase(casename, initial_time="0"):
+	"""Remove solver output left by an earlier run: time directories other than
+	the initial one, postProcessing and processor directories."""
+	for name in os.listdir(casename):
+		path = os.path.join(casename, name)
+		if not os.path.isdir(path):
+			continue
+		if (isTimeDirectory(name) and name != initial_time) or \
+		   name == "postProcessing" or name.startswith("processor"):
+			shutil.rmtree(path, ignore_errors=True)
+
+def stageCase(template, casename, keep=()):
+	"""Prepare casename from template for a new run, reusing what is already
+	there: template files are hard-linked (see linkTemplate) and stale solver
+	output is removed (see cleanCase).  Writers of case files must replace
+	them (e.g. with writeIfChanged) rather than edit them in place, since that
+	would edit the template through the link."""
+	staged = linkTemplate(template, casename, keep)
+	cleanCase(casename)
+	return staged
@@ -0,0 +1,155 @@
+# FieldLookup.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os
+import hashlib
+
+import numpy as np
+
+class FieldLookup(object):
+	"""Spatial index over a field sampled at scattered 2D points, such as the
+	solved (r, z) velocity samples of a FreeVortex case.  Builds a KD-tree and a
+	Delaunay triangulation once, then answers batched nearest-neighbour and
+	linear interpolation queries.  Lookups can be saved next to the case output
+	and reloaded by later runs against the same solution.  They are saved as
+	plain arrays (.npz, read without pickle), since case directories are shared
+	and copied around; loading rebuilds only the KD-tree."""
+
+	# Triangulation arrays, as scipy.spatial.Delaunay attributes of the same names
+	tri_arrays = ("simplices", "neighbors", "transform", "vertex_to_simplex")
+
+	# Barycentric tolerance for a point to count as inside a triangle
+	eps = 1e-10
+	# Steps of the triangulation walk before handing over to qhull's search
+	max_walk = 64
+
+	def __init__(self, points, values):
+		"""Construct from an (N, 2) array of sample points and an (N, ...) array
+		of field values at those points."""
+		self.points = np.ascontiguousarray(points, dtype=float)
+		self.values = np.ascontiguousarray(values, dtype=float)
+		self.key = FieldLookup.makeKey(self.points, self.values)
+		# Imported here so loading turbokit doesn't pay for scipy
+		import scipy.spatial
+		tri = scipy.spatial.Delaunay(self.points)
+		for name in self.tri_arrays:
+			setattr(self, name, getattr(tri, name))
+		self.makeTree()
+
+	def makeTree(self):
+		import scipy.spatial
+		self.tree = scipy.spatial.cKDTree(self.points)
+
+	@staticmethod
+	def makeKey(points, values):
+		"""Digest identifying the samples a lookup was built from."""
+		h = hashlib.sha1()
+		for a in (points, values):
+			a = np.ascontiguousarray(a, dtype=float)
+			h.update(str(a.shape).encode("utf-8"))
+			h.update(a.tobytes())
+		return h.hexdigest()
+
+	def save(self, filename):
+		"""Save the samples and triangulation to filename as .npz data."""
+		arrays = dict((name, getattr(self, name)) for name in self.tri_arrays)
+		with open(filename, "wb") as f:
+			np.savez(f, key=np.array(self.key), points=self.points,
+			         values=self.values, **arrays)
+
+	@staticmethod
+	def load(filename, key=None):
+		"""Load a lookup saved with save().  With key given, returns None without
+		reading the rest of the file if it was built from other samples."""
+		with np.load(filename, allow_pickle=False) as data:
+			if key is not None and str(data["key"]) != key:
+				return None
+			lookup = FieldLookup.__new__(FieldLookup)
+			for name in ("points", "values") + FieldLookup.tri_arrays:
+				setattr(lookup, name, data[name])
+			lookup.key = str(data["key"])
+		lookup.makeTree()
+		return lookup
+
+	@staticmethod
+	def cached(filename, points, values):
+		"""Load the lookup saved in filename if it was built from the same points
+		and values, otherwise build it and save it there."""
+		key = FieldLookup.makeKey(points, values)
+		if os.path.exists(filename):
+			try:
+				lookup = FieldLookup.load(filename, key)
+				if lookup is not None:
+					return lookup
+			except Exception as e:
+				print("Ignoring unreadable field lookup %s: %s" % (filename, e))
+		lookup = FieldLookup(points, values)
+		try:
+			lookup.save(filename)
+		except OSError as e:
+			print("Could not save field lookup %s: %s" % (filename, e))
+		return lookup
+
+	def nearest(self, query):
+		"""Values at the sample points nearest to each row of an (M, 2) array."""
+		_, idx = self.tree.query(np.asarray(query, dtype=float))
+		return self.values[idx]
+
+	def barycentric(self, simplices, query):
+		"""Barycentric coordinates of each query point in the matching simplex."""
+		transform = self.transform[simplices]
+		b = np.einsum("aij,aj->ai", transform[:,:2], query - transform[:,2])
+		return np.column_stack((b, 1 - b.sum(axis=1)))
+
+	def locate(self, query):
+		"""Index of the triangle containing each query point, or -1 outside the
+		convex hull.  Each search starts from a triangle touching the nearest
+		sample point and walks towards the query, so it only takes a few steps."""
+		query = np.asarray(query, dtype=float)
+		_, nearest = self.tree.query(query)
+		simplex = self.vertex_to_simplex[nearest]
+		result = np.full(len(query), -1)
+		active = np.arange(len(query))
+		for i in range(self.max_walk):
+			if len(active) == 0:
+				break
+			bary = self.barycentric(simplex[active], query[active])
+			inside = np.all(bary >= -self.eps, axis=1)
+			result[active[inside]] = simplex[active[inside]]
+			# Step across the edge opposite the most negative coordinate.  Leaving
+			# through a hull edge means the point is outside the hull.
+			step = self.neighbors[simplex[active], np.argmin(bary, axis=1)]
+			walking = ~inside & (step >= 0)
+			simplex[active[walking]] = step[walking]
+			active = active[walking]
+		for i in active:
+			# Rare: search every triangle for points the walk did not reach
+			bary = self.barycentric(np.arange(len(self.simplices)),
+			                        np.broadcast_to(query[i], (len(self.simplices), 2)))
+			inside = np.flatnonzero(np.all(bary >= -self.eps, axis=1))
+			result[i] = inside[0] if len(inside) else -1
+		return result
+
+	def linear(self, query):
+		"""Piecewise-linear interpolation over the Delaunay triangulation, with
+		nearest-neighbour values for points outside the convex hull."""
+		query = np.asarray(query, dtype=float)
+		simplex = self.locate(query)
+		result = np.empty((len(query),) + self.values.shape[1:])
+		inside = simplex >= 0
+		vertices = self.simplices[simplex[inside]]
+		bary = self.barycentric(simplex[inside], query[inside])
+		v = self.values[vertices].reshape(vertices.shape + (-1,))
+		result[inside] = np.einsum("ai,aik->ak", bary, v).reshape((-1,) + self.values.shape[1:])
+		if not np.all(inside):
+			result[~inside] = self.nearest(query[~inside])
+		return result
+
+	def __call__(self, query, method="linear"):
+		if method == "linear":
+			return self.linear(query)
+		elif method == "nearest":
+			return self.nearest(query)
+		else:
+			raise ValueError("Unknown interpolation method %r" % method)
@@ -3,39 +3,85 @@
 # Vertical Limit Labs
 
 import os, sys, shutil
+import glob
 import math
-import csv
 import io
 from subprocess import call, check_call, check_output
 
 import numpy as np
-import scipy
-try:
-	import matplotlib.pyplot as plt
-	MATPLOTLIB_DISABLED = False
-except:
-	MATPLOTLIB_DISABLED = True
 
-import PyFoam as pf
-from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
+from .Splines import *
+from .MeridionalPatchSpline import MeridionalPatchSpline
+from .FieldLookup import FieldLookup
+from .SolveCache import SolveCache
+from .BlockMeshWriter import writeBlockMeshDict
+from .PolyMeshWriter import wedgePolyMesh, writePolyMesh
+from .CaseStaging import stageCase, cleanCase, writeIfChanged
+from .Pipeline import Stage, Pipeline
+from . import Instrumentation
 
-from Splines import *
-from MeridionalPatchSpline import MeridionalPatchSpline
+# The bundled OpenFOAM case template
+CASE_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "case_templates", "freevortex")
 
-def loadPatchVectorSamples(sampleFile):
-	with open(sampleFile) as csvfile:
-		datareader = csv.reader(csvfile, delimiter=' ')
-		next(datareader)
-		next(datareader)
-		
-		data = [row for row in datareader]
-		points = np.array([[float(r[0]), float(r[1]), float(r[2])] for r in data])
-		field_vals = np.array([[float(r[3]), float(r[4]), float(r[5])] for r in data])
-		return points, field_vals
+def loadPatchSamples(sampleFile, cache=True):
+	"""Load an OpenFOAM raw surface sample file (x y z followed by the field
+	components on each line, with #-prefixed header lines).  Returns (points,
+	field_vals): an (N, 3) array and an (N,) array for scalar fields such as p,
+	k or epsilon, or (N, k) for vector fields.
+	
+	With cache set, the parsed data is also saved as a .npy sidecar keyed on the
+	sample file's size and modification time, and later loads of the unchanged
+	file memory-map that instead of parsing the text again."""
+	stat = os.stat(sampleFile)
+	sidecar = "%s.%d-%d.npy" % (sampleFile, stat.st_size, stat.st_mtime_ns)
+	if cache and os.path.exists(sidecar):
+		data = np.load(sidecar, mmap_mode="r")
+	else:
+		data = np.loadtxt(sampleFile, comments="#", ndmin=2)
+		if cache:
+			try:
+				for stale in glob.glob(glob.escape(sampleFile) + ".*.npy"):
+					os.remove(stale)
+				tmp = sidecar + ".tmp"
+				with open(tmp, "wb") as f:
+					np.save(f, data)
+				os.replace(tmp, sidecar)
+			except OSError as e:
+				print("Could not write sample cache %s: %s" % (sidecar, e))
+	points = data[:,:3]
+	field_vals = data[:,3] if data.shape[1] == 4 else data[:,3:]
+	return points, field_vals
+
+def loadPatchVectorSamples(sampleFile, cache=True):
+	"""Load a vector field sample file, see loadPatchSamples."""
+	return loadPatchSamples(sampleFile, cache)
 
 class FreeVortex(object):
 	"""Representation of a free-vortex region of flow.  This is used as a base
 	for both rotor and stator segments."""
+	
+	# Case files written for every case, relative to the case directory
+	generated_files = ["constant/polyMesh/blockMeshDict", "0/U", "0/p"]
+	
+	# Stages of a lazy FreeVortex, see Pipeline
+	stages = [
+		Stage("grid", "makeMeridionalPatch",
+		      inputs=("meridional_patch", "points_m", "points_s",
+		              "grid_tolerance", "grid_max_length"),
+		      outputs=("r", "z", "m_values", "s_values")),
+		Stage("case", "makeOFCase", inputs=("casename", "reuse_case")),
+		Stage("mesh", "makeOFMesh",
+		      inputs=("direct_mesh", "mesh_blocks", "mesh_edge_points", "mesh_edge_type"),
+		      outputs=("blockmesh_data", "polymesh_data"),
+		      requires=("grid", "case")),
+		Stage("solve", "makeSolution",
+		      inputs=("inlet_v", "outlet_v", "rho", "compressible", "solve_cache"),
+		      outputs=("boundaries", "end_time", "xyz_points", "u_xyz_points",
+		               "rz_points", "th_points", "u_rtz_points"),
+		      requires=("grid",), depends=("case", "mesh")),
+	]
+	
 	def __init__(self, 
 	              casename="cases/freevortex",
 	              compressible=False,
@@ -49,7 +95,18 @@ class FreeVortex(object):
 	              inlet_v=np.array([0.0, 0.0, -39.6]),
 	              outlet_v=np.array([39.63, -19.15, 0.0]),
 	              points_m = 40,
-	              points_s = 20):
+	              points_s = 20,
+	              grid_tolerance = None,
+	              grid_max_length = None,
+	              solve_cache = None,
+	              velocity_lookup = None,
+	              run_solver = True,
+	              direct_mesh = None,
+	              mesh_blocks = None,
+	              mesh_edge_points = 8,
+	              mesh_edge_type = "spline",
+	              reuse_case = False,
+	              lazy = False):
 		"""Create a representation of free-vortex flow through a region.
 		
 		Keyword arguments:
@@ -60,15 +117,46 @@ class FreeVortex(object):
 		outlet_v -- numpy array specifying (r, th, z) velocity (uniform) at outlet
 		points_m -- number of vertices in the meridional direction (inlet to outlet)
 		points_s -- number of vertices in the shroud direction (hub to shroud)
+		grid_tolerance -- if set, distribute grid points by curvature instead of
+		                  uniformly, so that grid lines deviate from the patch by
+		                  at most this distance (m).  More points are added
+		                  where needed to meet the tolerances, with points_m and
+		                  points_s the minimum counts, see
+		                  MeridionalPatch.adaptive_values.
+		grid_max_length -- if set, the longest allowed grid segment (m), also
+		                   adding points beyond points_m and points_s.
+		solve_cache -- SolveCache to restore the solution from when an identical
+		               case was solved before, skipping the OpenFOAM run
+		velocity_lookup -- FieldLookup over the solved velocity field to reuse,
+		                   e.g. from another object built on the same case
+		run_solver -- run the OpenFOAM tools and postSolve during construction.
+		              If False, the case is only prepared, to be run later by
+		              CaseRunner.AsyncCaseRunner.
+		direct_mesh -- None to mesh the case with blockMesh, or "ascii" or
+		               "binary" to write constant/polyMesh directly in that
+		               format instead
+		mesh_blocks -- None to write one blockMesh block per grid cell, or the
+		               number of graded blocks to split the passage into along
+		               m, with curved hub and shroud edges
+		mesh_edge_points -- interior points sampled on each curved block edge
+		mesh_edge_type -- blockMesh edge type for curved edges, "spline" or
+		                  "polyLine"
+		reuse_case -- stage the case in place when casename already exists,
+		              instead of deleting and copying it, see makeOFCase
+		lazy -- build nothing on construction.  Each stage (grid, case, mesh,
+		        solve) runs when its results are first used, and update()
+		        changes parameters, rerunning only the affected stages.
 		"""
 		
 		# Case directory
 		self.casename = casename
-		self.case_template = "case_templates/freevortex"
+		self.case_template = CASE_TEMPLATE
 		
 		# Simulation properties
 		self.points_m = points_m
 		self.points_s = points_s
+		self.grid_tolerance = grid_tolerance
+		self.grid_max_length = grid_max_length
 		
 		# Flow properties
 		self.rho = rho
@@ -78,165 +166,327 @@ class FreeVortex(object):
 		self.meridional_patch = meridional_patch
 		self.inlet_v = inlet_v
 		self.outlet_v = outlet_v
-		
-		# set up folder structure
-		self.makeOFCase()
+		self.velocity_lookup = velocity_lookup
+		self.solve_cache = solve_cache
+		self.direct_mesh = direct_mesh
+		assert direct_mesh in (None, "ascii", "binary"), \
+		       "direct_mesh must be None, 'ascii' or 'binary'"
+		self.mesh_blocks = mesh_blocks
+		self.mesh_edge_points = mesh_edge_points
+		self.mesh_edge_type = mesh_edge_type
+		self.reuse_case = reuse_case
+		
+		if lazy:
+			self.pipeline = Pipeline(self, self.stages)
+			return
 		self.makeMeridionalPatch()
-		self.makeOFMesh()
-		self.setOFBoundaries()
-		self.solve()
+		if not self.loadCachedSolution():
+			# set up folder structure
+			self.makeOFCase()
+			self.makeOFMesh(runBlockMesh=run_solver)
+			self.setOFBoundaries()
+			if run_solver:
+				self.solve()
+		if run_solver:
+			self.postSolve()
+	
+	def __getattr__(self, name):
+		# Only called for missing attributes: a lazy object runs the stage that
+		# produces the attribute, if any.
+		pipeline = self.__dict__.get("pipeline")
+		if pipeline is None or not pipeline.produces(name):
+			raise AttributeError(name)
+		pipeline.require(pipeline.producers[name])
+		try:
+			return self.__dict__[name]
+		except KeyError:
+			raise AttributeError(name)
+	
+	def update(self, **params):
+		"""Change constructor parameters of a lazy object, invalidating the stages
+		that depend on them."""
+		assert hasattr(self, "pipeline"), "update() needs a lazy object"
+		self.pipeline.update(**params)
+	
+	def makeSolution(self):
+		"""Solve stage of a lazy object: restore the solution from the solve cache,
+		or mesh and solve the case.  Output of an earlier solve in the same case
+		directory is removed first, since the solver resumes from the latest
+		time."""
+		if not self.loadCachedSolution():
+			self.pipeline.require("mesh")
+			cleanCase(self.casename)
+			self.setOFBoundaries()
+			self.solve()
 	
 	def makeOFCase(self):
-		"""Remove target case directory and copy OpenFOAM case template."""
-		print("Copying OpenFOAM case %s from template %s" % 
-		       (self.casename, self.case_template))
-		shutil.rmtree(self.casename, ignore_errors=True)
-		shutil.copytree(self.case_template, self.casename)
+		"""Remove target case directory and copy OpenFOAM case template.
+		
+		With reuse_case set, the case directory is kept instead: template files
+		are hard-linked into it, the generated_files from an earlier run are left
+		to be rewritten only if they change, and old solver output is removed
+		(see CaseStaging.stageCase)."""
+		with Instrumentation.stage("case", case=self.casename) as counters:
+			if self.reuse_case:
+				staged = stageCase(self.case_template, self.casename, self.generated_files)
+				counters["files"] = staged
+				print("Staged OpenFOAM case %s from template %s (%d files linked)" %
+				      (self.casename, self.case_template, staged))
+				return
+			print("Copying OpenFOAM case %s from template %s" % 
+			       (self.casename, self.case_template))
+			shutil.rmtree(self.casename, ignore_errors=True)
+			shutil.copytree(self.case_template, self.casename)
 	
 	def makeMeridionalPatch(self):
-		"""Generates the grid points for a meridional patch in the given patch area."""
-		
-		# Grid points
-		self.r = np.zeros((self.points_m, self.points_s))
-		self.z = np.zeros((self.points_m, self.points_s))
-		for m in range(self.points_m):
-			for s in range(self.points_s):
-				pt_rz = self.meridional_patch(m/(self.points_m-1), s/(self.points_s-1))
-				self.r[m][s] = pt_rz[0]
-				self.z[m][s] = pt_rz[1]
+		"""Generates the grid points for a meridional patch in the given patch area,
+		uniformly spaced in m and s or, with grid_tolerance or grid_max_length
+		set, adapted to the patch's arc length and curvature."""
+		
+		with Instrumentation.stage("grid") as counters:
+			# Grid points
+			if self.grid_tolerance is None and self.grid_max_length is None:
+				self.m_values = np.arange(self.points_m) / (self.points_m-1)
+				self.s_values = np.arange(self.points_s) / (self.points_s-1)
+			else:
+				self.m_values = self.meridional_patch.adaptive_values(
+					0, self.grid_tolerance, self.grid_max_length, self.points_m)
+				self.s_values = self.meridional_patch.adaptive_values(
+					1, self.grid_tolerance, self.grid_max_length, self.points_s)
+			self.r, self.z = self.meridional_patch.evaluate_grid(self.m_values, self.s_values)
+			counters["points"] = self.r.size
 		return (self.r, self.z)
 	
-	def makeOFMesh(self, runBlockMesh=True):
+	@staticmethod
+	def wedgeVertices(r, z):
+		"""Vertices of the wedge over an (M, S) grid of (r, z) points, numbered in
+		a single array: the front side, then the back side mirrored in z.  Returns
+		(vertices, idx1, idx2), with idx1 and idx2 (M, S) arrays indexing the
+		different sides' vertices by (m, s)."""
+		points_m, points_s = r.shape
+		n = points_m * points_s
+		idx1 = np.arange(n).reshape(points_s, points_m).T
+		idx2 = idx1 + n
+		front_vertices = np.column_stack((r.T.ravel(), z.T.ravel(), r.T.ravel() * 0.01))
+		return np.concatenate((front_vertices, front_vertices * [1, 1, -1])), idx1, idx2
+	
+	def makeOFMesh(self, runBlockMesh=True, echo=False):
 		"""Update the blockMeshDict file in the OpenFOAM case to represent our new
-		mesh.  Optionally runs blockMesh."""
-		
-		# The points are numbered in a single array, front and back.  These
-		# functions index the different sides' points.
-		idx1 = lambda m, s: s * self.points_m + m
-		idx2 = lambda m, s: self.points_m * self.points_s + s * self.points_m + m
-		
-		vertices = {}
-		for m in range(self.points_m):
-			for s in range(self.points_s):
-				vertex = [self.r[m][s], self.z[m][s], self.r[m][s] * 0.01]
-				vertices[idx1(m, s)] = vertex
-				#vertex[2] *= -1
-				vertices[idx2(m, s)] = [vertex[0], vertex[1], -vertex[2]]
-		
-		blocks = []
-		for m in range(self.points_m-1):
-			for s in range(self.points_s-1):
-				corners = [idx2(m,s), idx2(m+1,s), idx2(m+1,s+1), idx2(m,s+1),
-				           idx1(m,s), idx1(m+1,s), idx1(m+1,s+1), idx1(m,s+1)]
-				cells = [1,1,1]
-				simpleGrading = [1,1,1]
-				blocks.append({"corners" : corners, "cells" : cells, "simpleGrading" : simpleGrading})
-		
-		edges = {}
-		# We don't do anything interesting with the edges in this case
+		mesh, or the polyMesh itself with direct_mesh set.  Optionally runs
+		blockMesh, and echoes the dictionary (see writeOFMesh).
+		
+		By default every grid cell is its own block.  With mesh_blocks set, the
+		passage is split into that many blocks along m instead, see
+		makeBlockResolution and makeBlockEdges."""
+		
+		if self.mesh_blocks is None:
+			vertices, idx1, idx2 = FreeVortex.wedgeVertices(self.r, self.z)
+			cells = np.array([1, 1, 1])
+			grading = np.array([1, 1, 1])
+			edges = []
+		else:
+			nodes = self.blockNodes()
+			vertices, idx1, idx2 = FreeVortex.wedgeVertices(self.r[nodes][:,[0,-1]],
+			                                                self.z[nodes][:,[0,-1]])
+			cells, grading = self.makeBlockResolution(nodes)
+			edges = self.makeBlockEdges(nodes, idx1, idx2)
+		
+		# Corners of each cell in (m, s) order: a quad of m, m+1 and s, s+1
+		def quads(idx_a, idx_b, idx_c, idx_d):
+			return np.stack((idx_a, idx_b, idx_c, idx_d), axis=-1).reshape(-1, 4)
+		m0s0 = np.s_[:-1,:-1]
+		m1s0 = np.s_[1:,:-1]
+		m1s1 = np.s_[1:,1:]
+		m0s1 = np.s_[:-1,1:]
+		
+		blocks = np.concatenate((quads(idx2[m0s0], idx2[m1s0], idx2[m1s1], idx2[m0s1]),
+		                         quads(idx1[m0s0], idx1[m1s0], idx1[m1s1], idx1[m0s1])),
+		                        axis=1)
 		
 		# boundary faces are listed CW from within the block
-		front = {"type":"wedge"}
-		faces = []
-		for m in range(self.points_m-1):
-			for s in range(self.points_s-1):
-				faces.append([idx1(m,s), idx1(m+1,s), idx1(m+1,s+1), idx1(m,s+1)])
-		front["faces"] = faces
-		
-		back = {"type":"wedge"}
-		faces = []
-		for m in range(self.points_m-1):
-			for s in range(self.points_s-1):
-				faces.append([idx2(m,s), idx2(m,s+1), idx2(m+1,s+1), idx2(m+1,s)])
-		back["faces"] = faces
-		
-		inlet = {"type":"patch"}
-		faces = []
-		m = 0
-		for s in range(self.points_s-1):
-			faces.append([idx1(m,s), idx1(m,s+1), idx2(m,s+1), idx2(m,s)])
-		inlet["faces"] = faces
-		
-		outlet = {"type":"patch"}
-		faces = []
-		m = self.points_m-1
-		for s in range(self.points_s-1):
-			faces.append([idx1(m,s), idx2(m,s), idx2(m,s+1), idx1(m,s+1)])
-		outlet["faces"] = faces
-		
-		wallShroud = {"type":"wall"}
-		faces = []
-		s = self.points_s-1
-		for m in range(self.points_m-1):
-			faces.append([idx1(m,s), idx1(m+1,s), idx2(m+1,s), idx2(m,s)])
-		wallShroud["faces"] = faces
-		
-		wallHub = {"type":"wall"}
-		faces = []
-		s = 0
-		for m in range(self.points_m-1):
-			faces.append([idx1(m,s), idx2(m,s), idx2(m+1,s), idx1(m+1,s)])
-		wallHub["faces"] = faces
-		
-		boundary = {"front":front, 
-		            "back":back, 
-		            "inlet":inlet, 
-		            "wallShroud":wallShroud, 
-		            "wallHub":wallHub,
-		            "outlet":outlet}
+		inlet = np.s_[0,:]
+		outlet = np.s_[-1,:]
+		shroud = np.s_[:,-1]
+		hub = np.s_[:,0]
+		boundary = {
+			"front": {"type": "wedge",
+			          "faces": quads(idx1[m0s0], idx1[m1s0], idx1[m1s1], idx1[m0s1])},
+			"back": {"type": "wedge",
+			         "faces": quads(idx2[m0s0], idx2[m0s1], idx2[m1s1], idx2[m1s0])},
+			"inlet": {"type": "patch",
+			          "faces": quads(idx1[inlet][:-1], idx1[inlet][1:],
+			                         idx2[inlet][1:], idx2[inlet][:-1])},
+			"wallShroud": {"type": "wall",
+			               "faces": quads(idx1[shroud][:-1], idx1[shroud][1:],
+			                              idx2[shroud][1:], idx2[shroud][:-1])},
+			"wallHub": {"type": "wall",
+			            "faces": quads(idx1[hub][:-1], idx2[hub][:-1],
+			                           idx2[hub][1:], idx1[hub][1:])},
+			"outlet": {"type": "patch",
+			           "faces": quads(idx1[outlet][:-1], idx2[outlet][:-1],
+			                          idx2[outlet][1:], idx1[outlet][1:])},
+		}
 		
 		self.blockmesh_data = {
 			"vertices" : vertices,
 			"blocks" : blocks,
+			"cells" : cells,
+			"simpleGrading" : grading,
 			"edges" : edges,
 			"boundary" : boundary
 		}
-		self.writeOFMesh(runBlockMesh)
-		
-	def writeOFMesh(self, runBlockMesh=True):
-		"""Write OpenFOAM mesh data to the blockMeshDict file.  Optionally run blockMesh."""
-		bm = ParsedParameterFile(os.path.join(self.casename, 
-		                                      "constant/polyMesh/blockMeshDict"),
-		                         longListOutputThreshold=0)
-		
-		#TODO: Fix PyFoam bug that writes incorrect list length
-		
-		vertex_keys = sorted(self.blockmesh_data["vertices"].keys(), key=lambda x: int(x))
-		vertices = [self.blockmesh_data["vertices"][key] for key in vertex_keys]
-		bm["vertices"] = vertices
-		
-		blocks = []
-		for b in self.blockmesh_data["blocks"]:
-			#print(b)
-			blocks += ["hex"]
-			blocks += [b["corners"]]
-			blocks += [b["cells"]]
-			blocks += ["simpleGrading"]
-			blocks += [b["simpleGrading"]]
-		#print(blocks)
-		bm["blocks"] = blocks
-		
+		if self.direct_mesh is not None:
+			# The polyMesh is written cell by cell, from the full grid
+			if self.mesh_blocks is not None:
+				vertices, idx1, idx2 = FreeVortex.wedgeVertices(self.r, self.z)
+			self.polymesh_data = wedgePolyMesh(vertices, idx1, idx2)
+			self.polymesh_data["points"] = vertices
+		self.writeOFMesh(runBlockMesh, echo)
+	
+	def blockNodes(self):
+		"""Indices along m of the grid nodes where the mesh_blocks blocks start
+		and end, splitting the grid's cells as evenly as possible."""
+		points_m = len(self.m_values)
+		assert 1 <= self.mesh_blocks < points_m, \
+		       "mesh_blocks must be between 1 and points_m - 1"
+		return np.round(np.linspace(0, points_m - 1, self.mesh_blocks + 1)).astype(int)
+	
+	def makeBlockResolution(self, nodes):
+		"""Cell counts and simpleGrading expansion ratios for the blocks between
+		the given m nodes, reproducing the grid's resolution.  Each ratio is the
+		length of a block's last cell over its first along m (averaged over hub
+		and shroud) or along s (averaged over the block's m nodes)."""
+		cells = []
+		grading = []
+		for start, end in zip(nodes[:-1], nodes[1:]):
+			r = self.r[start:end+1]
+			z = self.z[start:end+1]
+			dm = np.hypot(np.diff(r[:,[0,-1]], axis=0), np.diff(z[:,[0,-1]], axis=0))
+			ds = np.hypot(np.diff(r, axis=1), np.diff(z, axis=1))
+			cells.append((end - start, len(self.s_values) - 1, 1))
+			grading.append((np.mean(dm[-1] / dm[0]), np.mean(ds[:,-1] / ds[:,0]), 1))
+		return np.array(cells), np.array(grading)
+	
+	def makeBlockEdges(self, nodes, idx1, idx2):
+		"""Curved edges for the blocks between the given m nodes, on both wedge
+		sides.  Hub and shroud edges, and any curved block edges along s, are
+		sampled from the meridional patch at mesh_edge_points interior points,
+		independent of the grid resolution.  idx1 and idx2 index the block
+		vertices as returned by wedgeVertices."""
 		edges = []
-		for e in self.blockmesh_data["edges"]:
-			pass # TODO: implement when necessary
-		
-		boundaries = []
-		#print(bm["boundary"])
-		for key in self.blockmesh_data["boundary"].keys():
-			boundaries.append(key)
-			boundaries.append(self.blockmesh_data["boundary"][key])
-		#print(boundaries)
-		bm["boundary"] = boundaries
-		
-		print(bm.content)
-		bm.writeFile()
-		
-		if runBlockMesh:
-			check_call(["blockMesh"], cwd=self.casename)
-			check_call(["checkMesh"], cwd=self.casename)
-		
-	def setOFBoundaries(self):
-		"""Set up boundary conditions"""
+		n = self.mesh_edge_points
+		
+		def addEdges(rz, node_a, node_b):
+			for idx, sign in ((idx1, 1), (idx2, -1)):
+				points = np.column_stack((rz[:,0], rz[:,1], rz[:,0] * 0.01 * sign))
+				edges.append((self.mesh_edge_type, idx[node_a], idx[node_b], points))
+		
+		m_nodes = self.m_values[nodes]
+		s_ends = self.s_values[[0, -1]]
+		for i in range(len(nodes) - 1):
+			m_samples = np.linspace(m_nodes[i], m_nodes[i+1], n + 2)[1:-1]
+			r, z = self.meridional_patch.evaluate_grid(m_samples, s_ends)
+			addEdges(np.column_stack((r[:,0], z[:,0])), (i, 0), (i+1, 0))
+			addEdges(np.column_stack((r[:,1], z[:,1])), (i, 1), (i+1, 1))
+		
+		s_samples = np.linspace(s_ends[0], s_ends[1], n + 2)
+		r, z = self.meridional_patch.evaluate_grid(m_nodes, s_samples)
+		for i in range(len(nodes)):
+			rz = np.column_stack((r[i], z[i]))
+			# Leave straight edges out of the dictionary
+			chord = rz[-1] - rz[0]
+			d = rz - rz[0]
+			offset = (chord[0] * d[:,1] - chord[1] * d[:,0]) / np.hypot(*chord)
+			if np.abs(offset).max() > 1e-9 * np.hypot(*chord):
+				addEdges(rz[1:-1], (i, 0), (i, 1))
+		return edges
+	
+	def writeOFMesh(self, runBlockMesh=True, echo=False):
+		"""Write OpenFOAM mesh data to the blockMeshDict file.  Optionally run
+		blockMesh, and echo the written dictionary for debugging.  The file is
+		streamed straight to the freshly copied case, or with reuse_case set,
+		only written if it changed (see CaseStaging.writeIfChanged); the tools
+		are then skipped if blockMesh already meshed the unchanged dictionary.
+		
+		With direct_mesh set, the polyMesh files are written instead and only
+		checkMesh is run."""
+		if self.direct_mesh is not None:
+			directory = os.path.join(self.casename, "constant/polyMesh")
+			with Instrumentation.stage("writeMesh", case=self.casename,
+			                           format=self.direct_mesh) as counters:
+				n_cells = writePolyMesh(directory, binary=(self.direct_mesh == "binary"),
+				                        **self.polymesh_data)
+				counters["cells"] = n_cells
+				counters["faces"] = len(self.polymesh_data["faces"])
+				if Instrumentation.enabled():
+					counters["bytes"] = sum(os.path.getsize(os.path.join(directory, name))
+					                        for name in ("points", "faces", "owner",
+					                                     "neighbour", "boundary"))
+			if runBlockMesh:
+				self.runTool(["checkMesh"])
+			return
+		
+		filename = os.path.join(self.casename, "constant/polyMesh/blockMeshDict")
+		
+		with Instrumentation.stage("writeMesh", case=self.casename,
+		                           format="blockMeshDict") as counters:
+			boundary = [(name, patch["type"], patch["faces"])
+			            for name, patch in self.blockmesh_data["boundary"].items()]
+			def write(f):
+				writeBlockMeshDict(f, self.blockmesh_data["vertices"],
+				                   self.blockmesh_data["blocks"],
+				                   self.blockmesh_data["cells"],
+				                   self.blockmesh_data["simpleGrading"],
+				                   boundary,
+				                   self.blockmesh_data["edges"])
+			
+			if self.reuse_case:
+				# The staged file may be hard-linked to the template, and is left
+				# untouched when unchanged, so blockMesh and checkMesh need not
+				# run again (see blockMeshCurrent)
+				f = io.StringIO()
+				write(f)
+				text = f.getvalue()
+				written = writeIfChanged(filename, text)
+				size = len(text)
+			else:
+				# A freshly copied case: stream straight to the file
+				with open(filename, "w") as f:
+					write(f)
+					size = f.tell()
+				written = True
+			counters["written"] = written
+			counters["blocks"] = len(self.blockmesh_data["blocks"])
+			counters["cells"] = self.blockMeshCells()
+			counters["bytes"] = size
+		if echo:
+			with open(filename) as f:
+				print(f.read())
+		
+		if runBlockMesh and (written or not self.blockMeshCurrent()):
+			self.runTool(["blockMesh"])
+			self.runTool(["checkMesh"])
+		
+	def blockMeshCells(self):
+		"""Number of cells blockMesh makes of blockmesh_data: the product of each
+		block's resolution, summed over the blocks."""
+		blocks = self.blockmesh_data["blocks"]
+		cells = np.broadcast_to(self.blockmesh_data["cells"], (len(blocks), 3))
+		return int(np.prod(cells, axis=1).sum())
+	
+	def blockMeshCurrent(self):
+		"""Whether the case's polyMesh was generated by blockMesh from its current
+		blockMeshDict, i.e. the points file is at least as new as the dictionary."""
+		directory = os.path.join(self.casename, "constant/polyMesh")
+		try:
+			return (os.path.getmtime(os.path.join(directory, "points")) >=
+			        os.path.getmtime(os.path.join(directory, "blockMeshDict")))
+		except OSError:
+			return False
+	
+	def setOFBoundaries(self, write=True):
+		"""Set up boundary conditions, and write them to the case directory
+		unless write is False (for a solution restored from the solve cache)."""
 		self.boundaries = {
 			"U": {
 				"inlet": {
@@ -256,39 +506,144 @@ class FreeVortex(object):
 				},
 			"p": {}
 		}
-		self.writeOFBoundaries()
+		if write:
+			with Instrumentation.stage("boundaries", case=self.casename):
+				self.writeOFBoundaries()
 	
 	def writeOFBoundaries(self):
-		"""Write boundary conditions to 0/<field> file in case directory."""
+		"""Write boundary conditions to 0/<field> file in case directory.  Files
+		whose contents don't change are left untouched."""
+		# PyFoam is only needed here, so geometry-only users don't need it
+		from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
 		for field in self.boundaries:
-			f = ParsedParameterFile(os.path.join(self.casename, "0/" + field))
+			filename = os.path.join(self.casename, "0/" + field)
+			f = ParsedParameterFile(filename)
 			for boundary in self.boundaries[field]:
 				f["boundaryField"][boundary] = self.boundaries[field][boundary]
-			f.writeFile()
+			writeIfChanged(filename, str(f))
 	
 	def solve(self):
 		"""Call OpenFOAM solver for case, then read back solved data and convert
 		it to cylindrical coordinates."""
-		check_call(["simpleFoam"], cwd=self.casename)
+		self.runTool(["simpleFoam"])
 		
 		# Get velocity figures at grid points:
-		check_call(["sample", "-latestTime"], cwd=self.casename)
-		end_time = check_output(["foamListTimes", "-latestTime"], cwd=self.casename)
+		self.runTool(["sample", "-latestTime"])
+		end_time = self.runTool(["foamListTimes", "-latestTime"], capture=True)
 		end_time = end_time.decode('utf-8')[:-1]
-		xyz_points, u_xyz_points = loadPatchVectorSamples(os.path.join(self.casename, "postProcessing/surfaces", end_time, "U_frontWall.raw"))
-		
+		if Instrumentation.enabled():
+			Instrumentation.record("solver", case=self.casename, end_time=end_time,
+			                       time_steps=self.solverTimeSteps(end_time))
+		self.readSolution(end_time)
+	
+	def runTool(self, args, capture=False):
+		"""Run an OpenFOAM tool in the case directory, timed as an Instrumentation
+		stage named after the tool.  Returns its output if capture is set."""
+		with Instrumentation.stage(args[0], case=self.casename):
+			if capture:
+				return check_output(args, cwd=self.casename)
+			check_call(args, cwd=self.casename)
+	
+	def solverTimeSteps(self, end_time):
+		"""Number of time steps to reach end_time at the deltaT set in the case's
+		controlDict.  This is an upper bound on the solver iterations, since
+		simpleFoam may stop early on its residual controls."""
+		delta_t = 1.0
+		with open(os.path.join(self.casename, "system/controlDict")) as f:
+			for line in f:
+				words = line.split()
+				if len(words) == 2 and words[0] == "deltaT":
+					delta_t = float(words[1].rstrip(";"))
+		return int(round(float(end_time) / delta_t))
+	
+	def readSolution(self, end_time):
+		"""Read back the sampled solution at the given time, convert it to
+		cylindrical coordinates and store it in the solve cache."""
+		self.end_time = end_time
+		with Instrumentation.stage("readSamples", case=self.casename) as counters:
+			xyz_points, u_xyz_points = self.loadSampledField("U")
+			counters["samples"] = len(xyz_points)
+			self.setSamples(xyz_points, u_xyz_points)
+		
+		if self.solve_cache is not None:
+			self.solve_cache.put(self.solveCacheKey(),
+			                     end_time=np.array(self.end_time),
+			                     xyz_points=self.xyz_points,
+			                     u_xyz_points=self.u_xyz_points)
+	
+	def postSolve(self):
+		"""Hook run once the solution is available, either solved or restored
+		from the cache.  Subclasses build geometry derived from the flow here."""
+		pass
+	
+	def setSamples(self, xyz_points, u_xyz_points):
+		"""Store sampled velocities and convert them to cylindrical coordinates."""
 		self.xyz_points = xyz_points
 		self.u_xyz_points = u_xyz_points
 		
-		self.rz_points = np.array([[np.sqrt(xyz[0]**2 + xyz[2]**2), xyz[1]] for xyz in xyz_points])
-		self.th_points = np.array([math.atan2(xyz[2], xyz[0]) for xyz in xyz_points])
-		self.u_rtz_points = np.array([[math.cos(th) * xyz[0] + math.sin(th) * xyz[2], 
-		                               -math.sin(th) * xyz[0] + math.cos(th) * xyz[2], 
-		                               xyz[1]] for (xyz, th) in zip(u_xyz_points, self.th_points)])
+		# The case axis is y; the wedge lies around theta = 0 in the x-z plane
+		self.rz_points = np.column_stack((np.hypot(xyz_points[:,0], xyz_points[:,2]),
+		                                  xyz_points[:,1]))
+		self.th_points = np.arctan2(xyz_points[:,2], xyz_points[:,0])
+		cos_th = np.cos(self.th_points)
+		sin_th = np.sin(self.th_points)
+		self.u_rtz_points = np.column_stack((cos_th * u_xyz_points[:,0] + sin_th * u_xyz_points[:,2],
+		                                     -sin_th * u_xyz_points[:,0] + cos_th * u_xyz_points[:,2],
+		                                     u_xyz_points[:,1]))
+	
+	def solveCacheKey(self):
+		"""Digest of everything that affects the solved flow: the meridional grid
+		(and so the patch shape and resolution), the blockMesh block layout if
+		not one block per cell, boundary velocities, fluid properties and the
+		case template contents."""
+		parts = [np.asarray(self.r), np.asarray(self.z),
+		         np.asarray(self.inlet_v, dtype=float),
+		         np.asarray(self.outlet_v, dtype=float),
+		         self.rho, self.compressible,
+		         SolveCache.hashTree(self.case_template)]
+		if self.mesh_blocks is not None and self.direct_mesh is None:
+			parts += [self.mesh_blocks, self.mesh_edge_points, self.mesh_edge_type]
+		return SolveCache.makeKey(*parts)
+	
+	def loadCachedSolution(self):
+		"""Restore the sampled solution, and set up the boundary conditions, from
+		self.solve_cache if this case was solved before.  Returns whether it was."""
+		if self.solve_cache is None:
+			return False
+		entry = self.solve_cache.get(self.solveCacheKey())
+		if entry is None:
+			Instrumentation.record("solveCache", case=self.casename, hit=False)
+			return False
+		print("Using cached solution for OpenFOAM case %s" % self.casename)
+		Instrumentation.record("solveCache", case=self.casename, hit=True)
+		self.setOFBoundaries(write=False)
+		self.end_time = str(entry["end_time"])
+		self.setSamples(entry["xyz_points"], entry["u_xyz_points"])
+		return True
+	
+	def loadSampledField(self, field, surface="frontWall"):
+		"""Load a field sampled on a surface (as set up in system/sampleDict) at
+		the latest solved time.  Returns (xyz_points, values), see
+		loadPatchSamples."""
+		return loadPatchSamples(os.path.join(self.casename, "postProcessing/surfaces",
+		                                     self.end_time, "%s_%s.raw" % (field, surface)))
+	
+	def velocityLookup(self):
+		"""Spatial index (FieldLookup) over the solved (r, z) velocity samples.
+		Reuses self.velocity_lookup, or the copy saved in the case directory, when
+		it was built from the current solution; otherwise builds and saves one."""
+		key = FieldLookup.makeKey(self.rz_points, self.u_rtz_points)
+		if self.velocity_lookup is None or self.velocity_lookup.key != key:
+			if os.path.isdir(self.casename):
+				self.velocity_lookup = FieldLookup.cached(
+					os.path.join(self.casename, "velocityLookup.npz"),
+					self.rz_points, self.u_rtz_points)
+			else: # solution restored from a SolveCache without a case directory
+				self.velocity_lookup = FieldLookup(self.rz_points, self.u_rtz_points)
+		return self.velocity_lookup
 
 
 if __name__=="__main__":
-	from MeridionalPatchSpline import MeridionalPatchSpline
 	mp = MeridionalPatchSpline(np.array([3e-3, 7e-3]), 
 	                           np.array([7.8e-3, 7e-3]),
 	                           np.array([12.8e-3, 0.0]),
@@ -4,46 +4,100 @@
 
 import os, sys, shutil
 import math
+import gzip
+import inspect
 from subprocess import call, check_call, check_output
 
 import numpy as np
-import scipy.interpolate
-import matplotlib.pyplot as plt
-
-import PyFoam as pf
-from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
-from PyFoam.Basics.STLFile import STLFile
-
-from Splines import *
-from FreeVortex import FreeVortex
-from BladeFactoryBase import BladeFactoryBase, BladeBase, BladeCompleterBase,\
-                             BladeEdgeCompleter, BladeHubCompleter
-import stl_writer
-
-def condense_face(face):
-	"""Remove consecutive duplicate vertices from a face, so we don't have extra
-	triangles in the STL file."""
-	if len(face) == 3:
-		return face
-	if len(face) == 4:
-		for i in range(len(face)):
-			if face[i] == face[i-1]:
-				del face[i]
-				#print("removed vertex")
-				return face
-		return face
-	else:
-		raise Exception("Face %s has incorrect number of vertices" % face)
-
-class FreeVortexBlades(FreeVortex):
+
+from .Splines import *
+from .FreeVortex import FreeVortex
+from .Pipeline import Stage
+from .BladeFactoryBase import BladeFactoryBase, BladeBase, BladeCompleterBase,\
+                              BladeEdgeCompleter, BladeHubCompleter, \
+                              IndexedMeshBase, default_thickness, merge_meshes, \
+                              instance_mesh, weld_mesh
+from . import stl_writer
+from .IndexedMeshWriter import writePly, writeObj
+from . import Instrumentation
+
+def lod_indices(n, step):
+	"""Every step-th of n grid indices, always including the last."""
+	return np.unique(np.append(np.arange(0, n, step), n - 1))
+
+def decimate_rows(points, tolerance):
+	"""Rows to keep of points, an (M, K, 3) array of K polylines sampled at the
+	same M stations, so that every polyline stays within tolerance of the
+	dropped points.  Rows are dropped greedily from the first one on, merging
+	the quads on either side of them; the first and last rows are kept."""
+	keep = [0]
+	start = 0
+	for end in range(2, len(points)):
+		a = points[start]
+		chord = points[end] - a
+		inner = points[start+1:end] - a
+		length2 = np.einsum("ij,ij->i", chord, chord)
+		t = np.einsum("mij,ij->mi", inner, chord) / np.where(length2 > 0, length2, 1)
+		offset = inner - np.clip(t, 0, 1)[..., np.newaxis] * chord
+		if np.max(np.einsum("mij,mij->mi", offset, offset)) > tolerance**2:
+			start = end - 1
+			keep.append(start)
+	keep.append(len(points) - 1)
+	return np.array(keep)
+
+def twisted_cells(grid, tolerance):
+	"""(row, col) indices of the quads of grid, an (R, C, K, 3) array of K
+	meshes sampled at the same grid points, whose split into two triangles
+	leaves the bilinear surface through their corners by more than tolerance.
+	That gap is largest at the quad centre, a quarter of its twist."""
+	twist = grid[:-1,:-1] - grid[1:,:-1] + grid[1:,1:] - grid[:-1,1:]
+	return np.nonzero(np.max(np.einsum("...k,...k->...", twist, twist), axis=-1) >
+	                  (4 * tolerance)**2)
+
+def midpoints(indices, cells):
+	"""Grid lines halfway through the intervals cells of indices, skipping
+	intervals with no lines left between their ends."""
+	mid = (indices[cells] + indices[cells + 1]) // 2
+	return mid[mid > indices[cells]]
+
+def accepts_grid_values(factory):
+	"""Whether a blade factory takes the m_values and s_values keywords of
+	BladeFactoryBase.__call__.  Older factories only take (r, z, th, beta)."""
+	try:
+		parameters = inspect.signature(factory).parameters.values()
+	except (TypeError, ValueError):
+		return False
+	names = set(p.name for p in parameters)
+	return ({"m_values", "s_values"} <= names or
+	        any(p.kind == p.VAR_KEYWORD for p in parameters))
+
+class FreeVortexBlades(FreeVortex, IndexedMeshBase):
 	"""Subclass of FreeVortex meant to implement bladed flow shapes"""
+	
+	stages = FreeVortex.stages + [
+		Stage("profile", "makeBladeProfile",
+		      inputs=("Omega", "profile_interpolation"),
+		      outputs=("th", "beta"),
+		      requires=("grid", "solve")),
+		Stage("factories", "makeBladeFactories",
+		      inputs=("Z", "thickness_fn_l", "thickness_fn_t"),
+		      outputs=("bladeFactories",)),
+		Stage("tessellate", "makeMesh",
+		      inputs=("interblade_faces", "symmetric"),
+		      outputs=("vertices", "quads", "blades", "hubCompleter", "shroudCompleter"),
+		      requires=("grid", "profile", "factories")),
+	]
+	
 	def __init__(self,
 	             Z=7,
 	             bladeFactories = None,
 	             Omega=7330.0,
-	             thickness_fn_l=lambda m,s: 0 if m == 0 or m == 1 else 0.001,
-	             thickness_fn_t=lambda m,s: 0 if m == 0 or m == 1 else 0.001,
+	             thickness_fn_l=default_thickness,
+	             thickness_fn_t=default_thickness,
 	             interblade_faces = 6,
+	             build_mesh = True,
+	             symmetric = None,
+	             profile_interpolation = "nearest",
 	             **kwargs):
 		"""Create a representation of free-vortex flow through a bladed region.
 
@@ -55,75 +109,380 @@ class FreeVortexBlades(FreeVortex):
 		thickness_fn_l -- function for leading edge offset from blade centerline
 		thickness_fn_t -- function for trailing edge offset from blade centerline
 		interblade_faces -- number of faces between blades
+		build_mesh -- build the full rotor mesh in memory on construction; turn
+		              off when only streaming with writeStlStream.  Lazy objects
+		              (lazy=True, see FreeVortex) instead run their profile,
+		              factories and tessellate stages on first use.
+		symmetric -- whether all blades are identical, so the rotor can be built
+		             by rotating copies of one blade sector.  None detects this
+		             from bladeFactories all being the same object.
+		profile_interpolation -- how to interpolate the solved velocity field
+		                         for the blade profile: "nearest", or "linear"
+		                         with nearest-neighbour values outside the
+		                         convex hull of the sample points
 		hub_solid -- whether to make a solid region on the hub
 		shroud_solid -- whether to make a solid region for the shroud"""
-		super(FreeVortexBlades, self).__init__(**kwargs)
 		self.Z = Z
-
-		if bladeFactories is not None:
-			self.bladeFactories = bladeFactories
-		else:
-			self.bladeFactories = [BladeFactoryBase() for i in range(self.Z)]
-
 		self.Omega = Omega
 		self.thickness_fn_l = thickness_fn_l
 		self.thickness_fn_t = thickness_fn_t
 		self.interblade_faces = interblade_faces
+		self.symmetric = symmetric
+		self.profile_interpolation = profile_interpolation
+		self.build_mesh = build_mesh
+
+		if bladeFactories is not None:
+			self.bladeFactories = bladeFactories
+		elif not kwargs.get("lazy"):
+			self.makeBladeFactories()
+
+		super(FreeVortexBlades, self).__init__(**kwargs)
+		if bladeFactories is not None and kwargs.get("lazy"):
+			self.pipeline.supplied.add("bladeFactories")
 
+	def makeBladeFactories(self):
+		"""Default blade factories: the same BladeFactoryBase for every blade."""
+		self.bladeFactories = [BladeFactoryBase(self.thickness_fn_l,
+		                                        self.thickness_fn_t)] * self.Z
+
+	def postSolve(self):
+		"""Build the blade profile, and the mesh if requested, from the flow."""
 		self.makeBladeProfile()
-		self.makeMesh()
+		if self.build_mesh:
+			self.makeMesh()
+
+	def makeVelocityInterpolator(self):
+		"""Return a function mapping an (N, 2) array of (r, z) points to (N, 3)
+		cylindrical velocities, according to self.profile_interpolation."""
+		# This is a bit of a hack, but we only have midpoint values and we need
+		# to interpolate points outside the convex hull; FieldLookup falls back
+		# to nearest-neighbour values there.
+		if self.profile_interpolation not in ("nearest", "linear"):
+			raise ValueError("Unknown profile interpolation %r" % self.profile_interpolation)
+		lookup = self.velocityLookup()
+		return lambda points: lookup(points, self.profile_interpolation)
 
 	def makeBladeProfile(self):
 		"""Calculate the angular position of the blade at each point (m, s).  This
 		is done by numerically integrating the relative velocity."""
-		# This is a bit of a hack, but we only have midpoint values and we need
-		# to interpolate points outside the convex hull
-		interp = scipy.interpolate.NearestNDInterpolator(self.rz_points, self.u_rtz_points)
-
-		th = np.zeros(self.r.shape)
-		beta = np.zeros(self.r.shape)
-		for s in range(self.r.shape[1]):
-			for m in range(1, self.r.shape[0]):
-				midpoint = np.array([[(self.r[m,s]+self.r[m-1,s])/2, (self.z[m,s]+self.z[m-1,s])/2]])
-				u_midpoint = interp(midpoint)[0] # Have to pass in an array
-				# Relative velocity terms:
-				w_m = math.sqrt(u_midpoint[0]**2 + u_midpoint[2]**2)
-				w_th = (u_midpoint[1] - self.Omega * self.r[m,s])
-				# Linear displacement from previous grid point
-				x_m = math.sqrt((self.r[m,s] - self.r[m-1,s])**2 + (self.z[m,s] - self.z[m-1,s])**2)
-				# Final blade angular position and angle
-				th[m,s] = th[m-1,s] + x_m * w_th / (self.r[m,s] * w_m)
-				beta[m,s] = math.atan2(w_m, w_th)
-			th[:,s] -= th[-1,s] # readjust the columns so the outlet side is aligned at 0
-		self.th = th
-		self.beta = beta
-		self.beta[0,:] = self.beta[1,:] # slightly better than using zero, still not perfect
+		with Instrumentation.stage("profile") as counters:
+			counters["points"] = self.r.size
+			interp = self.makeVelocityInterpolator()
+
+			# Velocity at the midpoint of each meridional grid segment, in one query
+			r_mid = (self.r[1:] + self.r[:-1]) / 2
+			z_mid = (self.z[1:] + self.z[:-1]) / 2
+			u_mid = interp(np.column_stack((r_mid.ravel(), z_mid.ravel())))
+			u_mid = u_mid.reshape(r_mid.shape + (3,))
+			# Relative velocity terms:
+			w_m = np.sqrt(u_mid[...,0]**2 + u_mid[...,2]**2)
+			w_th = u_mid[...,1] - self.Omega * self.r[1:]
+			# Linear displacement from previous grid point
+			x_m = np.sqrt(np.diff(self.r, axis=0)**2 + np.diff(self.z, axis=0)**2)
+			# Final blade angular position and angle
+			th = np.zeros(self.r.shape)
+			th[1:] = np.cumsum(x_m * w_th / (self.r[1:] * w_m), axis=0)
+			th -= th[-1] # readjust the columns so the outlet side is aligned at 0
+			beta = np.zeros(self.r.shape)
+			beta[1:] = np.arctan2(w_m, w_th)
+			self.th = th
+			self.beta = beta
+			self.beta[0,:] = self.beta[1,:] # slightly better than using zero, still not perfect
+
+	def isUniformGrid(self):
+		"""Whether the grid is spaced uniformly in m and s, as blade factories
+		assume when not given the grid's m_values and s_values."""
+		return all(np.array_equal(values, np.arange(len(values)) / (len(values)-1))
+		           for values in (self.m_values, self.s_values))
+
+	def makeBlade(self, i):
+		"""Call the i-th blade factory at its angular offset.  On an adaptive grid
+		the grid's m_values and s_values are passed too, if the factory takes
+		them (see accepts_grid_values)."""
+		th_i = i * 2 * np.pi / self.Z
+		factory = self.bladeFactories[i]
+		args = (self.r, self.z, self.th + th_i, self.beta)
+		if self.isUniformGrid() or not accepts_grid_values(factory):
+			return factory(*args)
+		return factory(*args, m_values=self.m_values, s_values=self.s_values)
+
+	def isSymmetric(self):
+		"""Whether every blade is a rotated copy of the first one."""
+		if self.symmetric is not None:
+			return self.symmetric
+		return all(f is self.bladeFactories[0] for f in self.bladeFactories)
+
+	def iterMeshParts(self):
+		"""Generate the rotor mesh as (vertices, quads) parts, one blade or
+		completer piece at a time, without building the merged mesh.  Of each
+		blade only its BladeEdges are retained for the completers (and the first
+		blade of a symmetric rotor, which the others are rotated from)."""
+		edges = []
+		for i in range(0, self.Z):
+			if i == 0:
+				blade = blade0 = self.makeBlade(0)
+			elif self.isSymmetric():
+				blade = blade0.rotated(i * 2 * np.pi / self.Z)
+			else:
+				blade = self.makeBlade(i)
+			yield blade.vertices, blade.quads
+			edges.append(blade.edges())
+
+		hubCompleter = BladeHubCompleter(edges, self.r, self.z, 0,
+		                                 self.interblade_faces, lazy=True)
+		for part in hubCompleter.iterParts():
+			yield part
+		shroudCompleter = BladeEdgeCompleter(edges, self.r, self.z, 1, lazy=True)
+		for part in shroudCompleter.iterParts():
+			yield part
+
+	def iterSectorParts(self):
+		"""Parts of one sector of a symmetric rotor: the first blade, the hub
+		span and caps up to the second blade, and the first blade's shroud edge.
+		The rotor is Z rotated copies of these."""
+		blade0 = self.makeBlade(0)
+		yield blade0.vertices, blade0.quads
+		edges = (blade0.edges(), blade0.edges().rotated(2 * np.pi / self.Z))
+		hubCompleter = BladeHubCompleter(edges, self.r, self.z, 0,
+		                                 self.interblade_faces, lazy=True)
+		yield hubCompleter.makeBladeSpan(edges[0].th_l, edges[1].th_t)
+		yield hubCompleter.makeInletCapSingleBlade(*edges)
+		yield hubCompleter.makeOutletCapSingleBlade(*edges)
+		shroudCompleter = BladeEdgeCompleter(edges, self.r, self.z, 1, lazy=True)
+		yield shroudCompleter.makeBladeEdge(edges[0])
+
+	def hasMesh(self):
+		"""Whether self.vertices/self.quads hold (or, for a lazy object, will
+		produce) the full rotor mesh.  With build_mesh off they are only there
+		after an explicit makeMesh()."""
+		return self.build_mesh or "vertices" in self.__dict__
 
 	def makeMesh(self):
-		"""Enumerate all of the faces required to make a mesh."""
+		"""Enumerate all of the faces required to make a mesh.  The combined mesh
+		is stored as self.vertices/self.quads, see IndexedMeshBase."""
 		# NOTE: Probably swaps thickness functions when Omega is negative
-		self.faces = []
+		with Instrumentation.stage("tessellate", blades=self.Z) as counters:
+			if self.isSymmetric():
+				self.makeSymmetricMesh()
+			else:
+				self.makeAsymmetricMesh()
+			counters["vertices"] = len(self.vertices)
+			counters["quads"] = len(self.quads)
+	
+	def makeAsymmetricMesh(self):
+		"""makeMesh for blades from different factories: every blade, hub and
+		shroud sector is built separately."""
 		self.blades = []
 
 		for i in range(0, self.Z):
-			th_i = i * 2 * np.pi / self.Z
-			blade = self.bladeFactories[i](self.r, self.z, self.th + th_i, self.beta)
-			self.faces.extend(blade.makeBladeFaces())
-			self.blades.append(blade)
+			self.blades.append(self.makeBlade(i))
 
-		self.hubCompleter = BladeHubCompleter(self.blades, self.r, self.z, 0)
-		self.faces.extend(self.hubCompleter.faces)
+		self.hubCompleter = BladeHubCompleter(self.blades, self.r, self.z, 0,
+		                                      self.interblade_faces)
 		self.shroudCompleter = BladeEdgeCompleter(self.blades, self.r, self.z, 1)
-		self.faces.extend(self.shroudCompleter.faces)
-
-	def writeStlMesh(self, outfilename):
-		"""Write out an STL file from the face data."""
-		stl_f = open(outfilename, "wb")
-		stl = stl_writer.Binary_STL_Writer(stl_f)
-		print("Writing STL with %d faces" % len(self.faces))
-		for quad in self.faces:
-			stl.add_face(condense_face(quad))
-		stl.close()
+		self.vertices, self.quads = merge_meshes(
+			[(blade.vertices, blade.quads) for blade in self.blades] +
+			[(self.hubCompleter.vertices, self.hubCompleter.quads),
+			 (self.shroudCompleter.vertices, self.shroudCompleter.quads)])
+
+	def makeSymmetricMesh(self):
+		"""Same result as makeMesh for identical blades, but only one blade and
+		one sector of hub and shroud geometry are built; the other Z-1 copies are
+		made with a batched rotation."""
+		angles = np.arange(self.Z) * 2 * np.pi / self.Z
+		blade0 = self.makeBlade(0)
+		blade_mesh = instance_mesh((blade0.vertices, blade0.quads), angles)
+		blade_vertices = blade_mesh[0].reshape(self.Z, -1, 3)
+		self.blades = [blade0.rotated(angle, vertices)
+		               for angle, vertices in zip(angles, blade_vertices)]
+		blades = (blade0, blade0.rotated(2 * np.pi / self.Z))
+
+		self.hubCompleter = BladeHubCompleter(self.blades, self.r, self.z, 0,
+		                                      self.interblade_faces, lazy=True)
+		self.hubCompleter.vertices, self.hubCompleter.quads = merge_meshes(
+			[instance_mesh(self.hubCompleter.makeBladeSpan(blades[0].th_l, blades[1].th_t), angles),
+			 instance_mesh(self.hubCompleter.makeInletCapSingleBlade(*blades), angles),
+			 instance_mesh(self.hubCompleter.makeOutletCapSingleBlade(*blades), angles)])
+		self.shroudCompleter = BladeEdgeCompleter(self.blades, self.r, self.z, 1, lazy=True)
+		self.shroudCompleter.vertices, self.shroudCompleter.quads = \
+			instance_mesh(self.shroudCompleter.makeBladeEdge(blade0), angles)
+
+		self.vertices, self.quads = merge_meshes(
+			[blade_mesh,
+			 (self.hubCompleter.vertices, self.hubCompleter.quads),
+			 (self.shroudCompleter.vertices, self.shroudCompleter.quads)])
+
+	def makeLodMesh(self, level=0, tolerance=None):
+		"""Coarse rotor mesh for previews, built from the blade profile without
+		the full-resolution mesh.  Returns (vertices, quads).
+		
+		Each level takes every other m and s grid line of the previous one and
+		halves the faces between blades.  With tolerance set, grid lines whose
+		removal moves no blade or hub point by more than tolerance are dropped
+		as well, merging the near-coplanar quads on either side, and the hub
+		span is divided into no more faces than keep each arc within tolerance
+		of its chords.  Lines are put back where a merged quad is too twisted
+		to split into two triangles within tolerance."""
+		with Instrumentation.stage("lod", level=level, tolerance=tolerance) as counters:
+			step = 2 ** level
+			rows = lod_indices(self.r.shape[0], step)
+			cols = lod_indices(self.r.shape[1], step)
+			spans = max(1, self.interblade_faces // step)
+			
+			if self.isSymmetric():
+				blade0 = self.makeBlade(0)
+				angles = np.arange(self.Z) * 2 * np.pi / self.Z
+				profiles = [(blade0.th_l + angle, blade0.th_t + angle) for angle in angles]
+			else:
+				profiles = [(blade.th_l, blade.th_t)
+				            for blade in map(self.makeBlade, range(self.Z))]
+			# Hub span angles from each blade to the next, see BladeHubCompleter
+			th_hub = []
+			for i in range(self.Z):
+				th_next = profiles[(i + 1) % self.Z][1][:,0]
+				th_hub.append((profiles[i][0][:,0], th_next + 2 * np.pi * (i + 1 == self.Z)))
+			
+			if tolerance is not None:
+				# Dropping rows, dropping columns (or hub span faces) and splitting
+				# the merged quads into triangles each move points, so each gets a
+				# third of the tolerance
+				part = tolerance / 3
+				# Longest span arc, over the cap fans and spans at every m
+				th_max = max(np.max(np.abs(th_1 - th_0)) for th_0, th_1 in th_hub)
+				r_max = np.max(self.r[:,0])
+				if part < r_max:
+					spans = min(spans, max(1, int(np.ceil(
+						th_max / (2 * np.arccos(1 - part / r_max))))))
+				else:
+					spans = 1
+				
+				rz = (self.r[:,:,np.newaxis], self.z[:,:,np.newaxis])
+				sides = rtz_to_xyz_array(rz[0], np.stack([th for profile in profiles
+				                                          for th in profile], axis=-1), rz[1])
+				hub = rtz_to_xyz_array(self.r[:,0,np.newaxis],
+				                       np.concatenate([np.linspace(th_0, th_1, spans + 1, axis=1)
+				                                       for th_0, th_1 in th_hub], axis=1),
+				                       self.z[:,0,np.newaxis])
+				# sides is (M, S, 2Z, 3), hub (M, K, 3)
+				m_lines = np.concatenate((sides[:,cols].reshape(len(self.r), -1, 3), hub), axis=1)
+				rows = rows[decimate_rows(m_lines[rows], part)]
+				s_lines = sides[rows].transpose(1, 0, 2, 3).reshape(self.r.shape[1], -1, 3)
+				cols = cols[decimate_rows(s_lines[cols], part)]
+				
+				# Put back grid lines through quads twisted too far to triangulate
+				hub_grid = hub.reshape(len(self.r), self.Z, spans + 1, 3).transpose(0, 2, 1, 3)
+				while True:
+					side_rows, side_cols = twisted_cells(sides[np.ix_(rows, cols)], part)
+					hub_rows, _ = twisted_cells(hub_grid[rows], part)
+					added_rows = midpoints(rows, np.concatenate((side_rows, hub_rows)))
+					added_cols = midpoints(cols, side_cols)
+					if len(added_rows) == 0 and len(added_cols) == 0:
+						break
+					rows = np.union1d(rows, added_rows)
+					cols = np.union1d(cols, added_cols)
+			
+			grid = np.ix_(rows, cols)
+			r = self.r[grid]
+			z = self.z[grid]
+			blades = [BladeBase(r, z, th_l[grid], th_t[grid]) for th_l, th_t in profiles]
+			hubCompleter = BladeHubCompleter(blades, r, z, 0, spans)
+			shroudCompleter = BladeEdgeCompleter(blades, r, z, 1)
+			vertices, quads = merge_meshes(
+				[(blade.vertices, blade.quads) for blade in blades] +
+				[(hubCompleter.vertices, hubCompleter.quads),
+				 (shroudCompleter.vertices, shroudCompleter.quads)])
+			counters["rows"] = len(rows)
+			counters["cols"] = len(cols)
+			counters["quads"] = len(quads)
+		return vertices, quads
+	
+	def writeStlMesh(self, outfilename, level=0, tolerance=None):
+		"""Write out an STL file from the face data.  Filenames ending in .gz are
+		streamed through gzip with writeStlStream.  A level or tolerance writes
+		the coarser preview mesh from makeLodMesh instead."""
+		if level == 0 and tolerance is None:
+			if outfilename.endswith(".gz"):
+				with gzip.open(outfilename, "wb") as stl_f:
+					self.writeStlStream(stl_f)
+				return
+			if not self.hasMesh():
+				with open(outfilename, "wb") as stl_f:
+					self.writeStlStream(stl_f, count_first=False)
+				return
+			vertices, quads = self.vertices, self.quads
+		else:
+			vertices, quads = self.makeLodMesh(level, tolerance)
+		with Instrumentation.stage("writeStl", filename=outfilename) as counters:
+			if outfilename.endswith(".gz"):
+				stl_f = gzip.open(outfilename, "wb")
+				count = stl_writer.count_triangles(vertices, quads)
+			else:
+				stl_f = open(outfilename, "wb")
+				count = None
+			stl = stl_writer.Binary_STL_Writer(stl_f, count)
+			print("Writing STL with %d faces" % len(quads))
+			stl.add_mesh(vertices, quads)
+			stl.close()
+			counters["triangles"] = stl.counter
+			counters["bytes"] = stl.bytes_written
+			stl_f.close()
+
+	def writeIndexedMesh(self, outfilename, level=0, tolerance=None, weld_tolerance=1e-9):
+		"""Write the rotor with one shared vertex table, as binary PLY or as OBJ
+		depending on the extension of outfilename (.ply or .obj).  Vertices
+		closer than weld_tolerance (m) are merged first, joining the blades, hub
+		spans and shroud edges into one connected mesh, see weld_mesh.  As for
+		writeStlMesh, a level or tolerance writes the preview mesh from
+		makeLodMesh instead of the full one.  Returns the numbers of vertices
+		and faces written."""
+		writers = {".ply": (writePly, "wb"), ".obj": (writeObj, "w")}
+		ext = os.path.splitext(outfilename)[1].lower()
+		if ext not in writers:
+			raise ValueError("unsupported mesh format %r, expected one of %s" %
+			                 (ext, ", ".join(sorted(writers))))
+		writer, mode = writers[ext]
+		if level == 0 and tolerance is None and self.hasMesh():
+			vertices, quads = self.vertices, self.quads
+		elif level == 0 and tolerance is None:
+			vertices, quads = merge_meshes(self.iterMeshParts())
+		else:
+			vertices, quads = self.makeLodMesh(level, tolerance)
+		with Instrumentation.stage("weld") as counters:
+			counters["vertices"] = len(vertices)
+			vertices, quads = weld_mesh(vertices, quads, weld_tolerance)
+			counters["welded"] = len(vertices)
+		with Instrumentation.stage("writeIndexed", filename=outfilename) as counters:
+			with open(outfilename, mode) as f:
+				vertex_count, face_count = writer(f, vertices, quads)
+				counters["bytes"] = f.tell()
+				counters["vertices"] = vertex_count
+				counters["faces"] = face_count
+		return vertex_count, face_count
+	
+	def writeStlStream(self, stream, count_first=True):
+		"""Tessellate and write the rotor to a binary stream one part at a time,
+		with memory bounded by the largest part rather than the whole rotor.
+
+		With count_first (needed for non-seekable streams such as pipes or gzip
+		files) the triangles are counted before writing the header: Z times the
+		count of one sector for a symmetric rotor, otherwise by generating the
+		parts twice.  Otherwise the header count is patched in at the end, which
+		requires seeking.  Returns the number of triangles written."""
+		with Instrumentation.stage("writeStlStream", count_first=count_first) as counters:
+			count = None
+			if count_first and self.isSymmetric():
+				count = self.Z * sum(stl_writer.count_triangles(vertices, quads)
+				                     for vertices, quads in self.iterSectorParts())
+			elif count_first:
+				count = sum(stl_writer.count_triangles(vertices, quads)
+				            for vertices, quads in self.iterMeshParts())
+			stl = stl_writer.Binary_STL_Writer(stream, count)
+			for vertices, quads in self.iterMeshParts():
+				stl.add_mesh(vertices, quads)
+			stl.close()
+			counters["triangles"] = stl.counter
+			counters["bytes"] = stl.bytes_written
+		return stl.counter
 
 if __name__ == "__main__":
 	fvb_rotor = FreeVortexBlades(points_m=15, points_s = 10)
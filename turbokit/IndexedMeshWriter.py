@@ -0,0 +1,59 @@
+# IndexedMeshWriter.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import numpy as np
+
+from .BlockMeshWriter import writeRows
+
+# Vertex coordinates as written, in the single precision STL also uses
+VERTEX_DTYPE = np.dtype("<f4")
+INDEX_DTYPE = np.dtype("<i4")
+
+def splitFaces(quads):
+	"""Sort the faces of a quad mesh (triangles stored as quads with an index
+	repeated, see IndexedMeshBase) into (triangles, quads) index arrays.
+	Repeated indices, e.g. left by weld_mesh, are removed; faces left with
+	fewer than three distinct vertices are dropped."""
+	quads = np.asarray(quads)
+	# Drop each index equal to the one before it, cyclically
+	keep = quads != np.roll(quads, 1, axis=1)
+	count = keep.sum(axis=1)
+	whole = (count == 4) & (quads[:,0] != quads[:,2]) & (quads[:,1] != quads[:,3])
+	triangles = quads[count == 3][keep[count == 3]].reshape(-1, 3)
+	return triangles, quads[whole]
+
+def writePly(f, vertices, quads):
+	"""Write an indexed mesh to the open binary file f as binary (little endian)
+	PLY, with triangles and quads as faces of a shared vertex table.  Returns
+	(vertex count, face count)."""
+	triangles, quads = splitFaces(quads)
+	f.write(("ply\n"
+	         "format binary_little_endian 1.0\n"
+	         "comment turbokit\n"
+	         "element vertex %d\n"
+	         "property float x\n"
+	         "property float y\n"
+	         "property float z\n"
+	         "element face %d\n"
+	         "property list uchar int vertex_indices\n"
+	         "end_header\n" % (len(vertices), len(triangles) + len(quads))).encode("ascii"))
+	f.write(np.ascontiguousarray(vertices, dtype=VERTEX_DTYPE).tobytes())
+	for faces in (triangles, quads):
+		records = np.empty(len(faces), dtype=[("count", "u1"),
+		                                      ("indices", INDEX_DTYPE, (faces.shape[1],))])
+		records["count"] = faces.shape[1]
+		records["indices"] = faces
+		f.write(records.tobytes())
+	return len(vertices), len(triangles) + len(quads)
+
+def writeObj(f, vertices, quads):
+	"""Write an indexed mesh to the open text file f as Wavefront OBJ.  Returns
+	(vertex count, face count)."""
+	triangles, quads = splitFaces(quads)
+	f.write("# turbokit\n")
+	writeRows(f, "v %.9g %.9g %.9g\n", vertices)
+	# OBJ indices count from 1
+	writeRows(f, "f %d %d %d\n", triangles + 1)
+	writeRows(f, "f %d %d %d %d\n", quads + 1)
+	return len(vertices), len(triangles) + len(quads)
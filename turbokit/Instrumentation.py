@@ -0,0 +1,106 @@
+# Instrumentation.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Optional timing and counter records for the stages of a design run.
+
+Nothing is recorded until a sink is installed with setSink().  A sink is any
+callable taking one record, a dict such as
+
+	{"stage": "blockMesh", "case": "cases/freevortex", "wall": 1.93,
+	 "cpu": 0.001, "cpu_children": 1.87}
+
+with wall and CPU seconds (cpu_children covers subprocesses, such as the
+OpenFOAM tools, that finished during the stage) and any counters the stage
+reports, e.g. cells, faces, triangles or bytes.  JsonLinesSink appends records
+to a file.  While no sink is installed, stage() costs one function call.
+
+CPU times are per process, so they overlap for stages running concurrently in
+threads or coroutines (AsyncCaseRunner records wall time only)."""
+
+import os
+import time
+import json
+import threading
+
+_sink = None
+
+def setSink(sink):
+	"""Install sink to receive records, or None to stop recording.  Returns the
+	previously installed sink."""
+	global _sink
+	previous = _sink
+	_sink = sink
+	return previous
+
+def enabled():
+	return _sink is not None
+
+def record(stage_name, **counters):
+	"""Send a record with no timing, e.g. for a cache hit."""
+	if _sink is not None:
+		counters["stage"] = stage_name
+		_sink(counters)
+
+class _Stage(object):
+	"""Context manager timing one stage.  Counters can be added to the dict it
+	returns on entry, or passed to stage()."""
+	def __init__(self, name, counters):
+		self.name = name
+		self.counters = counters
+
+	def __enter__(self):
+		self.wall = time.perf_counter()
+		self.cpu = time.process_time()
+		self.children = os.times()
+		return self.counters
+
+	def __exit__(self, exc_type, exc, tb):
+		sink = _sink
+		if sink is None:
+			return False
+		children = os.times()
+		result = {"stage": self.name,
+		          "wall": time.perf_counter() - self.wall,
+		          "cpu": time.process_time() - self.cpu,
+		          "cpu_children": round(children.children_user + children.children_system -
+		                                self.children.children_user -
+		                                self.children.children_system, 6)}
+		if exc_type is not None:
+			result["error"] = exc_type.__name__
+		result.update(self.counters)
+		sink(result)
+		return False
+
+class _NullStage(object):
+	"""Stand-in for _Stage while recording is off.  Counters set on the dict it
+	returns are discarded, so cheap ones can be set unconditionally."""
+	def __enter__(self):
+		return {}
+
+	def __exit__(self, exc_type, exc, tb):
+		return False
+
+_NULL_STAGE = _NullStage()
+
+def stage(name, **counters):
+	"""Context manager timing the block as stage name, e.g.
+
+		with Instrumentation.stage("profile", case=self.casename) as counters:
+			...
+			counters["points"] = n"""
+	if _sink is None:
+		return _NULL_STAGE
+	return _Stage(name, counters)
+
+class JsonLinesSink(object):
+	"""Sink appending each record as a line of JSON to filename.  Safe to share
+	between threads; processes should use separate files."""
+	def __init__(self, filename):
+		self.filename = filename
+		self.lock = threading.Lock()
+
+	def __call__(self, record):
+		line = json.dumps(record, default=str) + "\n"
+		with self.lock:
+			with open(self.filename, "a") as f:
+				f.write(line)
@@ -2,6 +2,8 @@
 # Copyright (c) 2015 Peter Hokanson
 # Vertical Limit Labs
 
+import numpy as np
+
 class MeridionalPatch(object):
 	"""Abstract base class for defining meridional flowfield.  When called as a 
 	function, this takes two arguments: m and s, for the inlet-to-outlet and 
@@ -12,4 +14,93 @@ class MeridionalPatch(object):
 		assert False
 		
 	def __call__(self, m, s):
-		assert False
\ No newline at end of file
+		assert False
+	
+	def evaluate_grid(self, m_values, s_values):
+		"""Evaluate the patch over the grid of 1D parameter vectors m_values and
+		s_values.  Returns (r, z) arrays of shape (len(m_values), len(s_values)).
+		
+		Subclasses should override this with a vectorized implementation; this
+		fallback calls the patch once per grid point."""
+		r = np.zeros((len(m_values), len(s_values)))
+		z = np.zeros((len(m_values), len(s_values)))
+		for i, m in enumerate(m_values):
+			for j, s in enumerate(s_values):
+				pt_rz = self(m, s)
+				r[i, j] = pt_rz[0]
+				z[i, j] = pt_rz[1]
+		return r, z
+	
+	def adaptive_values(self, axis, tolerance=None, max_length=None, min_points=2,
+	                    samples=513, lines=5):
+		"""Parameter values from 0 to 1 along axis (0 for m, 1 for s), spaced so
+		that the straight segments between neighbouring values deviate from the
+		patch by at most tolerance, and are at most max_length long, on each of
+		lines grid lines spread across the other axis (lengths in the units of
+		r and z).  Points are concentrated where the patch bends: they are
+		placed by equidistributing the density sqrt(curvature / (8 * tolerance)),
+		the inverse of the longest chord with that sag, or 1 / max_length if
+		greater, along the arc length of a dense sampling of the patch.  Any
+		segment still deviating by more than tolerance from the samples, e.g. a
+		long one running from a straight part into a bend, is then halved.
+		
+		At least min_points values are returned: the density is at least that
+		of min_points spaced evenly along each line's arc length, so straight
+		directions get min_points - 1 segments rather than a single one."""
+		if tolerance is None and max_length is None:
+			raise ValueError("adaptive_values needs a tolerance or a max_length")
+		across = np.linspace(0, 1, lines)
+		def grid(values):
+			# (lines, len(values)) arrays of r and z
+			if axis == 0:
+				r, z = self.evaluate_grid(values, across)
+				return r.T, z.T
+			return self.evaluate_grid(across, values)
+		t = np.linspace(0, 1, samples)
+		r, z = grid(t)
+		# Segments of the sampled lines, shape (lines, samples - 1)
+		dr = np.diff(r, axis=1)
+		dz = np.diff(z, axis=1)
+		length = np.hypot(dr, dz)
+		
+		density = np.zeros(length.shape)
+		if tolerance is not None:
+			# Curvature at interior samples from the turning angle between
+			# segments; each segment takes the larger value of its ends
+			turn = np.abs(np.arctan2(dr[:,:-1] * dz[:,1:] - dz[:,:-1] * dr[:,1:],
+			                         dr[:,:-1] * dr[:,1:] + dz[:,:-1] * dz[:,1:]))
+			curvature = turn / ((length[:,:-1] + length[:,1:]) / 2)
+			curvature = np.maximum(np.pad(curvature, ((0, 0), (1, 0)), mode="edge"),
+			                       np.pad(curvature, ((0, 0), (0, 1)), mode="edge"))
+			density = np.sqrt(curvature / (8 * tolerance))
+		if max_length is not None:
+			density = np.maximum(density, 1 / max_length)
+		density = np.maximum(density, (min_points - 1) / length.sum(axis=1, keepdims=True))
+		
+		# Segments needed up to each sample, on the most demanding line
+		needed = np.concatenate(([0], np.cumsum(np.max(length * density, axis=0))))
+		if needed[-1] == 0:
+			return np.array([0., 1.])
+		count = int(np.ceil(needed[-1]))
+		values = np.interp(np.linspace(0, needed[-1], count + 1), needed, t)
+		values[[0, -1]] = 0, 1
+		if tolerance is None:
+			return values
+		
+		while True:
+			ends_r, ends_z = grid(values)
+			bounds = np.searchsorted(t, values)
+			errors = np.zeros(len(values) - 1)
+			for i in range(len(values) - 1):
+				inside = np.s_[:, bounds[i]:bounds[i+1]]
+				chord_r = ends_r[:, i+1:i+2] - ends_r[:, i:i+1]
+				chord_z = ends_z[:, i+1:i+2] - ends_z[:, i:i+1]
+				offset = np.abs(chord_r * (z[inside] - ends_z[:, i:i+1]) -
+				                chord_z * (r[inside] - ends_r[:, i:i+1]))
+				if offset.size:
+					errors[i] = np.max(offset / np.hypot(chord_r, chord_z))
+			split = errors > tolerance
+			if not split.any():
+				return values
+			values = np.sort(np.concatenate((values,
+			                                 (values[:-1][split] + values[1:][split]) / 2)))
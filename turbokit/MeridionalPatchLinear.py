@@ -3,11 +3,9 @@
 # Vertical Limit Labs
 
 import numpy as np
-import scipy.interpolate
-import matplotlib.pyplot as plt
 
-from MeridionalPatch import MeridionalPatch
-from Splines import *
+from .MeridionalPatch import MeridionalPatch
+from .Splines import *
 
 class MeridionalPatchLinear(MeridionalPatch):
 	
@@ -20,12 +18,16 @@ class MeridionalPatchLinear(MeridionalPatch):
 		m1_s0 -- vector at m=1, s=0
 		m1_s1 -- vector at m=1, s=1"""
 		self.m0_s0 = m0_s0
-		self.m0_s1 = m1_s1
+		self.m0_s1 = m0_s1
 		self.m1_s0 = m1_s0
 		self.m1_s1 = m1_s1
 		self.k_array = np.array([[m0_s0, m0_s1],
 		                         [m1_s0, m1_s1]])
-		self.b = BezierPatch(self.k_array)
+		self.b = BezierSurface(self.k_array)
 		
 	def __call__(self, m, s):
 		return self.b(m, s)
+	
+	def evaluate_grid(self, m_values, s_values):
+		rz = self.b.grid(m_values, s_values)
+		return rz[..., 0], rz[..., 1]
@@ -3,11 +3,9 @@
 # Vertical Limit Labs
 
 import numpy as np
-import scipy.interpolate
-import matplotlib.pyplot as plt
 
-from MeridionalPatch import MeridionalPatch
-from Splines import *
+from .MeridionalPatch import MeridionalPatch
+from .Splines import *
 
 class MeridionalPatchMerged(MeridionalPatch):
 	"""Meridional patch composed of other meridional patch shapes merged on the 
@@ -24,7 +22,23 @@ class MeridionalPatchMerged(MeridionalPatch):
 	def __call__(self, m, s):
 		
 		# Figure out which subpatch to call with what meridional parameter
-		patch_idx = int(math.floor(m * self.patch_count))
-		patch_m = m * self.patch_count - patch_idx
-		patch = self.patch_list[patch_idx]
+		patch_idx, patch_m = self.splitMeridional(m)
+		patch = self.patch_list[int(patch_idx)]
 		return patch(patch_m, s)
+	
+	def splitMeridional(self, m):
+		"""Map merged meridional parameter(s) m onto (subpatch index, subpatch m).
+		m=1 belongs to the end of the last subpatch rather than past it."""
+		m_scaled = np.asarray(m, dtype=float) * self.patch_count
+		patch_idx = np.minimum(np.floor(m_scaled), self.patch_count - 1).astype(int)
+		return patch_idx, m_scaled - patch_idx
+	
+	def evaluate_grid(self, m_values, s_values):
+		patch_idx, patch_m = self.splitMeridional(m_values)
+		r = np.zeros((len(patch_m), len(s_values)))
+		z = np.zeros((len(patch_m), len(s_values)))
+		for i, patch in enumerate(self.patch_list):
+			rows = (patch_idx == i)
+			if np.any(rows):
+				r[rows], z[rows] = patch.evaluate_grid(patch_m[rows], s_values)
+		return r, z
@@ -3,11 +3,9 @@
 # Vertical Limit Labs
 
 import numpy as np
-import scipy.interpolate
-import matplotlib.pyplot as plt
 
-from MeridionalPatch import MeridionalPatch
-from Splines import *
+from .MeridionalPatch import MeridionalPatch
+from .Splines import *
 
 class MeridionalPatchSpline(MeridionalPatch):
 	
@@ -23,7 +21,7 @@ class MeridionalPatchSpline(MeridionalPatch):
 		v_m0 -- 2D velocity vector at m=0 (inlet)
 		v_m1 -- 2D velocity vector at m=1 (outlet)"""
 		self.m0_s0 = m0_s0
-		self.m0_s1 = m1_s1
+		self.m0_s1 = m0_s1
 		self.m1_s0 = m1_s0
 		self.m1_s1 = m1_s1
 		
@@ -37,3 +35,7 @@ class MeridionalPatchSpline(MeridionalPatch):
 		
 	def __call__(self, m, s):
 		return self.b(m, s)
+	
+	def evaluate_grid(self, m_values, s_values):
+		rz = self.b.grid(m_values, s_values)
+		return rz[..., 0], rz[..., 1]
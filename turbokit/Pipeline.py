@@ -0,0 +1,95 @@
+# Pipeline.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+class Stage(object):
+	"""One memoized step of a Pipeline.
+
+	Arguments:
+	name -- stage name, e.g. "mesh"
+	run -- name of the method of the pipeline's object that runs the stage
+	inputs -- object attributes the stage reads as parameters
+	outputs -- object attributes the stage sets
+	requires -- stages to run before this one
+	depends -- stages this one may run itself, e.g. only on a cache miss;
+	           like requires, they invalidate this stage when they rerun"""
+	def __init__(self, name, run, inputs=(), outputs=(), requires=(), depends=()):
+		self.name = name
+		self.run = run
+		self.inputs = tuple(inputs)
+		self.outputs = tuple(outputs)
+		self.requires = tuple(requires)
+		self.depends = tuple(depends)
+
+class Pipeline(object):
+	"""Runs the stages of an object (such as a lazy FreeVortex) on demand and
+	remembers which have run.  Stage outputs are plain attributes of the
+	object; the object's __getattr__ calls require() for the stage producing a
+	missing one.  Changing inputs with update() invalidates the stages that
+	read them and everything downstream, deleting their outputs so they are
+	rebuilt on next use."""
+
+	def __init__(self, obj, stages):
+		self.obj = obj
+		self.stages = dict((stage.name, stage) for stage in stages)
+		self.producers = dict((output, stage.name)
+		                      for stage in stages for output in stage.outputs)
+		self.done = set()
+		self.supplied = set()
+
+	def require(self, name):
+		"""Run stage name, and the stages it requires, unless already done."""
+		stage = self.stages[name]
+		if name in self.done or (stage.outputs and self.supplied.issuperset(stage.outputs)):
+			return
+		for upstream in stage.requires:
+			self.require(upstream)
+		getattr(self.obj, stage.run)()
+		self.done.add(name)
+
+	def produces(self, attribute):
+		return attribute in self.producers
+
+	def downstream(self, name):
+		"""Stages that require or depend on stage name."""
+		return [stage.name for stage in self.stages.values()
+		        if name in stage.requires or name in stage.depends]
+
+	def invalidate(self, name):
+		"""Forget the results of stage name and every stage downstream of it."""
+		if name in self.done:
+			self.done.discard(name)
+			for output in self.stages[name].outputs:
+				if output not in self.supplied:
+					self.obj.__dict__.pop(output, None)
+		for downstream in self.downstream(name):
+			self.invalidate(downstream)
+
+	def update(self, **params):
+		"""Set object attributes and invalidate the stages that read them.
+		Setting stage outputs supplies them directly, so that stage no longer
+		runs; since it would overwrite them otherwise, all of its outputs must
+		be supplied together (ValueError if not).  Setting an output to None
+		hands all of the stage's outputs back to it."""
+		for attribute, value in params.items():
+			producer = self.producers.get(attribute)
+			if producer is not None and value is not None:
+				missing = [output for output in self.stages[producer].outputs
+				           if output not in self.supplied and params.get(output) is None]
+				if missing:
+					raise ValueError("supplying %s replaces stage %s, which also "
+					                 "needs %s" % (attribute, producer, ", ".join(missing)))
+		for attribute, value in params.items():
+			for stage in self.stages.values():
+				if attribute in stage.inputs:
+					self.invalidate(stage.name)
+			producer = self.producers.get(attribute)
+			if producer is not None:
+				self.invalidate(producer)
+				if value is None:
+					for output in self.stages[producer].outputs:
+						self.supplied.discard(output)
+						self.obj.__dict__.pop(output, None)
+					continue
+				self.supplied.add(attribute)
+			setattr(self.obj, attribute, value)
@@ -0,0 +1,280 @@
+# PolyMeshWriter.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os
+import re
+
+import numpy as np
+
+from .BlockMeshWriter import foamHeader, writeRows
+
+# Binary OpenFOAM files as written by a default (32-bit label, double) build
+BINARY_ARCH = "LSB;label=32;scalar=64"
+LABEL_DTYPE = np.dtype("<i4")
+SCALAR_DTYPE = np.dtype("<f8")
+# Length and opening parenthesis of a binary list, after any comments
+BINARY_LIST_START = re.compile(rb"(?:\s|//[^\n]*)*(\d+)\s*\(")
+
+def faceAreas(points, faces):
+	"""Area vectors of quad faces, pointing along the right-hand rule normal."""
+	p = points[faces]
+	return 0.5 * np.cross(p[:,2] - p[:,0], p[:,3] - p[:,1])
+
+def wedgePolyMesh(points, idx1, idx2):
+	"""Build the polyMesh of a structured wedge: one layer of hex cells between
+	the front and back sides of an (m, s) grid.  idx1 and idx2 are (M, S) arrays
+	indexing points for the front and back side vertices at each grid node.
+
+	Cells are numbered m-major, as blockMesh numbers one-cell blocks listed in
+	that order.  Internal faces are in upper-triangular order (by owner, then
+	neighbour) and each boundary face is oriented out of its cell, whatever the
+	handedness of the grid.  Returns a dict of faces (F, 4), owner (F,),
+	neighbour (internal faces only) and patches, a list of (name, type, start
+	face, face count) in the same order as the blockMeshDict boundary."""
+	points_m, points_s = idx1.shape
+	cm, cs = points_m - 1, points_s - 1
+	cell = np.arange(cm * cs).reshape(cm, cs)
+
+	def quads(a, b, c, d):
+		return np.stack((a, b, c, d), axis=-1).reshape(-1, 4)
+
+	# Internal faces across constant s (between s and s+1) and constant m
+	s_faces = quads(idx1[:-1,1:-1], idx1[1:,1:-1], idx2[1:,1:-1], idx2[:-1,1:-1])
+	s_owner, s_neighbour = cell[:,:-1].ravel(), cell[:,1:].ravel()
+	m_faces = quads(idx1[1:-1,:-1], idx2[1:-1,:-1], idx2[1:-1,1:], idx1[1:-1,1:])
+	m_owner, m_neighbour = cell[:-1,:].ravel(), cell[1:,:].ravel()
+
+	internal = np.concatenate((s_faces, m_faces))
+	owner = np.concatenate((s_owner, m_owner))
+	neighbour = np.concatenate((s_neighbour, m_neighbour))
+	order = np.lexsort((neighbour, owner))
+	internal, owner, neighbour = internal[order], owner[order], neighbour[order]
+
+	boundary = [
+		("front", "wedge", quads(idx1[:-1,:-1], idx1[1:,:-1], idx1[1:,1:], idx1[:-1,1:]),
+		 cell.ravel()),
+		("back", "wedge", quads(idx2[:-1,:-1], idx2[:-1,1:], idx2[1:,1:], idx2[1:,:-1]),
+		 cell.ravel()),
+		("inlet", "patch", quads(idx1[0,:-1], idx1[0,1:], idx2[0,1:], idx2[0,:-1]),
+		 cell[0,:]),
+		("wallShroud", "wall", quads(idx1[:-1,-1], idx1[1:,-1], idx2[1:,-1], idx2[:-1,-1]),
+		 cell[:,-1]),
+		("wallHub", "wall", quads(idx1[:-1,0], idx2[:-1,0], idx2[1:,0], idx1[1:,0]),
+		 cell[:,0]),
+		("outlet", "patch", quads(idx1[-1,:-1], idx2[-1,:-1], idx2[-1,1:], idx1[-1,1:]),
+		 cell[-1,:]),
+	]
+
+	faces = np.concatenate([internal] + [b[2] for b in boundary])
+	all_owner = np.concatenate([owner] + [b[3] for b in boundary])
+
+	# Orient every face out of its owner cell, towards the neighbour
+	corners = np.concatenate((quads(idx1[:-1,:-1], idx1[1:,:-1], idx1[1:,1:], idx1[:-1,1:]),
+	                          quads(idx2[:-1,:-1], idx2[1:,:-1], idx2[1:,1:], idx2[:-1,1:])),
+	                         axis=1)
+	centres = points[corners].mean(axis=1)
+	outward = points[faces].mean(axis=1) - centres[all_owner]
+	outward[:len(internal)] = centres[neighbour] - centres[owner]
+	flip = np.einsum("ij,ij->i", faceAreas(points, faces), outward) < 0
+	faces[flip] = faces[flip][:,::-1]
+
+	patches = []
+	start = len(internal)
+	for name, patch_type, patch_faces, patch_owner in boundary:
+		patches.append((name, patch_type, start, len(patch_faces)))
+		start += len(patch_faces)
+
+	return {"faces": faces, "owner": all_owner, "neighbour": neighbour,
+	        "patches": patches}
+
+def writeBinaryList(f, array, dtype):
+	"""Write an OpenFOAM binary list: its length, then the raw items in
+	parentheses.  Vector items count once each."""
+	array = np.ascontiguousarray(array, dtype=dtype)
+	f.write(b"%d\n(" % len(array))
+	f.write(array.tobytes())
+	f.write(b")\n")
+
+def writePolyMesh(directory, points, faces, owner, neighbour, patches, binary=False):
+	"""Write a polyMesh (points, faces, owner, neighbour and boundary files) to
+	directory, normally <case>/constant/polyMesh, in OpenFOAM's ascii or
+	binary format.  The arguments are as returned by wedgePolyMesh, with points
+	an (N, 3) array; all faces must have four vertices.  Returns the number of
+	cells, which the owner and neighbour headers note."""
+	os.makedirs(directory, exist_ok=True)
+	location = "constant/polyMesh"
+	n_cells = int(owner.max()) + 1 if len(owner) else 0
+	note = [("note", '"nPoints:%d  nCells:%d  nFaces:%d  nInternalFaces:%d"' %
+	         (len(points), n_cells, len(faces), len(neighbour)))]
+
+	if binary:
+		def header(foam_class, foam_object, extra=()):
+			return foamHeader(foam_class, foam_object, location, "binary",
+			                  list(extra) + [("arch", '"%s"' % BINARY_ARCH)]).encode("ascii")
+		with open(os.path.join(directory, "points"), "wb") as f:
+			f.write(header("vectorField", "points"))
+			writeBinaryList(f, points, SCALAR_DTYPE)
+		# Binary faces are stored compactly, as vertex offsets then vertex labels
+		with open(os.path.join(directory, "faces"), "wb") as f:
+			f.write(header("faceCompactList", "faces"))
+			writeBinaryList(f, np.arange(len(faces) + 1) * 4, LABEL_DTYPE)
+			f.write(b"\n")
+			writeBinaryList(f, np.ravel(faces), LABEL_DTYPE)
+		for name, labels in (("owner", owner), ("neighbour", neighbour)):
+			with open(os.path.join(directory, name), "wb") as f:
+				f.write(header("labelList", name, note))
+				writeBinaryList(f, labels, LABEL_DTYPE)
+	else:
+		def writeList(name, foam_class, fmt, rows, extra=()):
+			with open(os.path.join(directory, name), "w") as f:
+				f.write(foamHeader(foam_class, name, location, "ascii", extra))
+				f.write("%d\n(\n" % len(rows))
+				writeRows(f, fmt, rows)
+				f.write(")\n")
+		writeList("points", "vectorField", "(%.15g %.15g %.15g)\n", points)
+		writeList("faces", "faceList", "4(%d %d %d %d)\n", faces)
+		writeList("owner", "labelList", "%d\n", np.reshape(owner, (-1, 1)), note)
+		writeList("neighbour", "labelList", "%d\n", np.reshape(neighbour, (-1, 1)), note)
+
+	# The boundary holds no bulk data, so it is always written as text
+	with open(os.path.join(directory, "boundary"), "w") as f:
+		f.write(foamHeader("polyBoundaryMesh", "boundary", location))
+		f.write("%d\n(\n" % len(patches))
+		for name, patch_type, start, count in patches:
+			f.write("\t%s\n\t{\n\t\ttype            %s;\n" % (name, patch_type))
+			if patch_type in ("wedge", "wall"):
+				f.write("\t\tinGroups        1(%s);\n" % patch_type)
+			f.write("\t\tnFaces          %d;\n\t\tstartFace       %d;\n\t}\n" %
+			        (count, start))
+		f.write(")\n")
+	return n_cells
+
+def readFoamList(filename):
+	"""Read the list data of an OpenFOAM points, faces, owner or neighbour file
+	in ascii or binary format.  Returns an (N, 3) float array for points, a list
+	of vertex label arrays for faces, or a label array otherwise."""
+	with open(filename, "rb") as f:
+		data = f.read()
+	header_end = data.index(b"}", data.index(b"FoamFile")) + 1
+	header = data[:header_end].decode("ascii")
+	binary = re.search(r"format\s+binary", header) is not None
+	foam_class = re.search(r"class\s+(\w+)", header).group(1)
+	body = data[header_end:]
+
+	if binary:
+		def lists(dtype, count, width=1):
+			pos = 0
+			for i in range(count):
+				match = BINARY_LIST_START.match(body, pos)
+				n = int(match.group(1)) * width
+				yield np.frombuffer(body, dtype, n, match.end())
+				pos = match.end() + n * dtype.itemsize + 1
+		if foam_class == "vectorField":
+			return next(lists(SCALAR_DTYPE, 1, 3)).reshape(-1, 3)
+		if foam_class == "faceCompactList":
+			offsets, labels = lists(LABEL_DTYPE, 2)
+			return np.split(labels, offsets[1:-1])
+		return next(lists(LABEL_DTYPE, 1)).copy()
+
+	text = re.sub(r"//[^\n]*", " ", body.decode("ascii"))
+	tokens = text.replace("(", " ").replace(")", " ").split()
+	n = int(tokens[0])
+	if foam_class == "vectorField":
+		return np.array(tokens[1:1 + 3*n], dtype=float).reshape(-1, 3)
+	if foam_class == "faceList":
+		labels = np.array(tokens[1:], dtype=int)
+		faces, pos = [], 0
+		for i in range(n):
+			faces.append(labels[pos+1:pos+1+labels[pos]])
+			pos += labels[pos] + 1
+		return faces
+	return np.array(tokens[1:1 + n], dtype=int)
+
+def readPolyMesh(directory):
+	"""Read a polyMesh directory written by blockMesh or writePolyMesh.  Returns
+	a dict like the one wedgePolyMesh returns, plus points; faces is a list of
+	vertex label arrays."""
+	with open(os.path.join(directory, "boundary")) as f:
+		boundary = re.sub(r"//[^\n]*", " ", f.read())
+	boundary = boundary[boundary.index("}", boundary.index("FoamFile")) + 1:]
+	patches = []
+	for match in re.finditer(r"(\w+)\s*\{([^}]*)\}", boundary):
+		entries = dict(re.findall(r"(\w+)\s+([^;]+);", match.group(2)))
+		patches.append((match.group(1), entries["type"], int(entries["startFace"]),
+		                int(entries["nFaces"])))
+	return {"points": readFoamList(os.path.join(directory, "points")),
+	        "faces": readFoamList(os.path.join(directory, "faces")),
+	        "owner": readFoamList(os.path.join(directory, "owner")),
+	        "neighbour": readFoamList(os.path.join(directory, "neighbour")),
+	        "patches": patches}
+
+def comparePolyMesh(directory, reference, tol=1e-9):
+	"""Compare the polyMesh in directory with a reference polyMesh directory,
+	e.g. one blockMesh produced for the same grid.  Point and cell numbering
+	may differ, so faces are matched by their centres and compared by area
+	vector, up to sign for internal faces.  Each mesh's faces must also point
+	out of their owner cell.  Returns a list of differences, empty if none."""
+	meshes = [readPolyMesh(directory), readPolyMesh(reference)]
+	differences = []
+
+	def canonical(mesh, label):
+		points = mesh["points"]
+		if any(len(face) != 4 for face in mesh["faces"]):
+			raise ValueError("Only quad meshes can be compared")
+		faces = np.array(mesh["faces"])
+		owner, neighbour = mesh["owner"], mesh["neighbour"]
+		n_internal = len(neighbour)
+		n_cells = owner.max() + 1
+		face_centres = points[faces].mean(axis=1)
+		areas = faceAreas(points, faces)
+
+		# Mean of the face centres, enough to tell which side a face points to
+		cell_sum = np.zeros((n_cells, 3))
+		np.add.at(cell_sum, owner, face_centres)
+		np.add.at(cell_sum, neighbour, face_centres[:n_internal])
+		counts = np.bincount(owner, minlength=n_cells) + \
+		         np.bincount(neighbour, minlength=n_cells)
+		cell_centres = cell_sum / counts[:,None]
+		outward = face_centres - cell_centres[owner]
+		outward[:n_internal] = cell_centres[neighbour] - cell_centres[owner[:n_internal]]
+		inward = np.count_nonzero(np.einsum("ij,ij->i", areas, outward) <= 0)
+		if inward:
+			differences.append("%s: %d faces point into their owner cell" % (label, inward))
+
+		groups = {"internal": np.arange(n_internal)}
+		for name, patch_type, start, count in mesh["patches"]:
+			groups[name] = np.arange(start, start + count)
+		result = {}
+		for name, idx in groups.items():
+			centres = face_centres[idx]
+			order = np.lexsort(np.round(centres / tol).T[::-1])
+			a = areas[idx][order]
+			if name == "internal":
+				largest = np.argmax(np.abs(a), axis=1)
+				a = a * np.sign(a[np.arange(len(a)), largest])[:,None]
+			result[name] = (centres[order], a)
+		return len(points), n_cells, result
+
+	(n_points, n_cells, groups), (ref_points, ref_cells, ref_groups) = \
+		[canonical(mesh, label) for mesh, label in zip(meshes, ("mesh", "reference"))]
+	if n_points != ref_points:
+		differences.append("%d points, reference has %d" % (n_points, ref_points))
+	if n_cells != ref_cells:
+		differences.append("%d cells, reference has %d" % (n_cells, ref_cells))
+	names = [p[0] for p in meshes[0]["patches"]]
+	ref_names = [p[0] for p in meshes[1]["patches"]]
+	if names != ref_names:
+		differences.append("patches %s, reference has %s" % (names, ref_names))
+	for name in groups:
+		if name not in ref_groups:
+			continue
+		if len(groups[name][0]) != len(ref_groups[name][0]):
+			differences.append("%s: %d faces, reference has %d" %
+			                   (name, len(groups[name][0]), len(ref_groups[name][0])))
+			continue
+		for label, a, b in zip(("face centres", "face area vectors"),
+		                       groups[name], ref_groups[name]):
+			if len(a) and not np.allclose(a, b, rtol=0, atol=tol * max(1, np.abs(b).max())):
+				differences.append("%s: %s differ" % (name, label))
+	return differences
@@ -0,0 +1,123 @@
+# SolveCache.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os
+import time
+import hashlib
+
+import numpy as np
+
+class SolveCache(object):
+	"""Content-addressed store of solved case results.  Each entry is a .npz
+	file named by a digest of everything that affects the solution (see
+	FreeVortex.solveCacheKey), holding the sampled arrays needed to skip the
+	solver on a later run.  Entries are evicted oldest-first once the cache
+	exceeds max_bytes, and dropped when not used for max_age seconds."""
+
+	def __init__(self, directory, max_bytes=None, max_age=None):
+		"""Keyword arguments:
+		directory -- where to keep cache entries (created on first store)
+		max_bytes -- total size to trim the cache to after each store, or None
+		max_age -- seconds since last use after which entries expire, or None"""
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.max_age = max_age
+
+	@staticmethod
+	def makeKey(*parts):
+		"""Digest of a sequence of numpy arrays, numbers and strings."""
+		h = hashlib.sha1()
+		for part in parts:
+			if isinstance(part, np.ndarray):
+				h.update(str(part.dtype).encode("utf-8"))
+				h.update(str(part.shape).encode("utf-8"))
+				h.update(np.ascontiguousarray(part).tobytes())
+			else:
+				h.update(repr(part).encode("utf-8"))
+			h.update(b"\0")
+		return h.hexdigest()
+
+	@staticmethod
+	def hashTree(path):
+		"""Digest of the names and contents of all files under path."""
+		h = hashlib.sha1()
+		for root, dirs, files in os.walk(path):
+			dirs.sort()
+			for name in sorted(files):
+				filename = os.path.join(root, name)
+				h.update(os.path.relpath(filename, path).encode("utf-8") + b"\0")
+				with open(filename, "rb") as f:
+					h.update(f.read())
+		return h.hexdigest()
+
+	def entryPath(self, key):
+		return os.path.join(self.directory, key + ".npz")
+
+	def get(self, key):
+		"""Return a dict of the arrays stored under key, or None on a miss."""
+		path = self.entryPath(key)
+		try:
+			age = time.time() - os.path.getmtime(path)
+		except OSError:
+			return None
+		if self.max_age is not None and age > self.max_age:
+			self.remove(path)
+			return None
+		try:
+			with np.load(path) as entry:
+				arrays = {name: entry[name] for name in entry.files}
+		except Exception as e:
+			print("Discarding unreadable solve cache entry %s: %s" % (path, e))
+			self.remove(path)
+			return None
+		os.utime(path) # mark as recently used for eviction
+		return arrays
+
+	def put(self, key, **arrays):
+		"""Store arrays under key, then trim the cache."""
+		os.makedirs(self.directory, exist_ok=True)
+		path = self.entryPath(key)
+		tmp = "%s.%d.tmp" % (path, os.getpid())
+		with open(tmp, "wb") as f:
+			np.savez(f, **arrays)
+		os.replace(tmp, path)
+		self.evict()
+
+	def remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+	def entries(self):
+		"""List of (mtime, size, path) for all entries, oldest first."""
+		entries = []
+		if not os.path.isdir(self.directory):
+			return entries
+		for name in os.listdir(self.directory):
+			if name.endswith(".npz"):
+				path = os.path.join(self.directory, name)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				entries.append((st.st_mtime, st.st_size, path))
+		return sorted(entries)
+
+	def evict(self):
+		"""Remove expired entries, then the least recently used ones until the
+		cache fits in max_bytes."""
+		entries = self.entries()
+		if self.max_age is not None:
+			now = time.time()
+			for entry in [e for e in entries if now - e[0] > self.max_age]:
+				self.remove(entry[2])
+				entries.remove(entry)
+		if self.max_bytes is not None:
+			total = sum(size for mtime, size, path in entries)
+			for mtime, size, path in entries:
+				if total <= self.max_bytes:
+					break
+				self.remove(path)
+				total -= size
@@ -19,52 +19,82 @@ def intersection_2d(a1, a2, b1, b2):
 def rtz_to_xyz(rtz):
 	return [rtz[0] * math.cos(rtz[1]), rtz[0] * math.sin(rtz[1]), rtz[2]]
 
+def rtz_to_xyz_array(r, th, z):
+	"""Vectorized rtz_to_xyz: convert arrays of cylindrical coordinates to an
+	array of Cartesian points with shape broadcast(r, th, z).shape + (3,)."""
+	r, th, z = np.broadcast_arrays(r, th, z)
+	return np.stack((r * np.cos(th), r * np.sin(th), z), axis=-1)
+
+
+def binomial(n, k):
+	"""Binomial coefficient n choose k."""
+	return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+def bernstein_basis(degree, u):
+	"""Evaluate the Bernstein basis polynomials of the given degree at the
+	parameter(s) u.  Returns an array of shape u.shape + (degree+1,), so that a
+	scalar u gives a single row of the basis matrix."""
+	u = np.asarray(u, dtype=float)[..., np.newaxis]
+	i = np.arange(degree + 1)
+	coeffs = np.array([binomial(degree, k) for k in i], dtype=float)
+	return coeffs * u**i * (1 - u)**(degree - i)
 
 class BezierCurve(object):
 	"""Represents a 1-D Bezier curve with the given control points."""
 	def __init__(self, ctrlpoints):
-		self.ctrlpoints = ctrlpoints
-		self.order = ctrlpoints.shape[0]
+		self.ctrlpoints = np.asarray(ctrlpoints, dtype=float)
+		self.order = self.ctrlpoints.shape[0]
+		self.degree = self.order - 1
 		#print(self.ctrlpoints[0])
 	
 	def __call__(self, u):
-		assert 0 <= u <= 1, "Bezier curve parameter u=%f out of range." % u
-		if self.order == 2: # linear
-			return (1-u) * self.ctrlpoints[0] + \
-			       u * self.ctrlpoints[1]
-		elif self.order == 3: # quadratic
-			return (1-u)**2 * self.ctrlpoints[0] + \
-			       2*u*(1-u) * self.ctrlpoints[1] + \
-			       u**2 * self.ctrlpoints[2]
-		elif self.order == 4: # cubic
-			return (1-u)**3 * self.ctrlpoints[0] + \
-			       3*u*((1-u)**2) * self.ctrlpoints[1] + \
-			       3*(u**2)*(1-u) * self.ctrlpoints[2] + \
-			       u**3 * self.ctrlpoints[3]
-		else:
-			raise NotImplemented("BezierCurve only supports up to cubic curves currently")
+		"""Evaluate the curve at u, which may be a scalar or an array of any shape.
+		The result has shape u.shape + ctrlpoints.shape[1:]."""
+		u = np.asarray(u, dtype=float)
+		assert np.all((0 <= u) & (u <= 1)), "Bezier curve parameter u out of range."
+		basis = bernstein_basis(self.degree, u)
+		return np.tensordot(basis, self.ctrlpoints, axes=([-1], [0]))
 
 class BezierSurface(object):
 	"""Represents a 2-D Bezier curve with the given control points."""
 	def __init__(self, ctrlpoints):
 		"""Construct from a 2D rectangular array of control points."""
-		self.ctrlpoints = ctrlpoints
-		self.order_u = ctrlpoints.shape[0]
-		self.order_v = ctrlpoints.shape[1]
+		self.ctrlpoints = np.asarray(ctrlpoints, dtype=float)
+		self.order_u = self.ctrlpoints.shape[0]
+		self.order_v = self.ctrlpoints.shape[1]
 		#print("BezierSurface(u=%d, v=%d)" % (self.order_u, self.order_v))
 	
 	def __call__(self, u, v):
-		# This function doesn't claim to be a terribly efficient solution
-		# Graphics applications typically use De Casteljau's algorithm.
-		
-		# Reduce the problem to the 1D case: solve along v for a 1D Bezier curve in u
-		
-		k_u = []
-		for j in range(self.order_u):
-			b_v = BezierCurve(self.ctrlpoints[j])
-			k_u.append(b_v(v))
-		b_u = BezierCurve(np.array(k_u))
-		return b_u(u)
+		"""Evaluate the surface at (u, v).  u and v may be scalars or arrays, and
+		are broadcast against each other; the result has shape
+		broadcast(u, v).shape + ctrlpoints.shape[2:]."""
+		u, v = np.broadcast_arrays(np.asarray(u, dtype=float),
+		                           np.asarray(v, dtype=float))
+		assert np.all((0 <= u) & (u <= 1)), "Bezier surface parameter u out of range."
+		assert np.all((0 <= v) & (v <= 1)), "Bezier surface parameter v out of range."
+		basis_u = bernstein_basis(self.order_u - 1, u)
+		basis_v = bernstein_basis(self.order_v - 1, v)
+		# Contract over v first, one (..., j) @ (j, i * k) product, then over u
+		k = self.ctrlpoints.reshape(self.order_u, self.order_v, -1)
+		k_v = basis_v @ k.transpose(1, 0, 2).reshape(self.order_v, -1)
+		k_v = k_v.reshape(u.shape + (self.order_u, k.shape[2]))
+		result = np.einsum("...i,...ik->...k", basis_u, k_v)
+		return result.reshape(u.shape + self.ctrlpoints.shape[2:])
+	
+	def grid(self, u, v):
+		"""Evaluate the surface on the tensor-product grid of 1D parameter vectors
+		u and v.  Returns an array of shape (len(u), len(v)) + ctrlpoints.shape[2:],
+		computed as B_u * K * B_v^T from the Bernstein basis matrices."""
+		u = np.asarray(u, dtype=float)
+		v = np.asarray(v, dtype=float)
+		assert np.all((0 <= u) & (u <= 1)), "Bezier surface parameter u out of range."
+		assert np.all((0 <= v) & (v <= 1)), "Bezier surface parameter v out of range."
+		basis_u = bernstein_basis(self.order_u - 1, u)
+		basis_v = bernstein_basis(self.order_v - 1, v)
+		k = self.ctrlpoints.reshape(self.order_u, self.order_v, -1)
+		# One B_u * K[..., c] * B_v^T matrix product per component c
+		result = basis_u @ k.transpose(2, 0, 1) @ basis_v.T
+		return result.transpose(1, 2, 0).reshape((len(u), len(v)) + self.ctrlpoints.shape[2:])
 
 if __name__ == "__main__":
 	a1 = np.array([-1,1])
@@ -0,0 +1,209 @@
+# Sweep.py
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+
+import os, sys
+import time
+import json
+import pickle
+import hashlib
+import itertools
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .FreeVortexBlades import FreeVortexBlades
+
+def parameterGrid(**axes):
+	"""Expand keyword arguments mapping names to lists of values into the list
+	of all combinations, as dicts of constructor keyword arguments."""
+	names = sorted(axes.keys())
+	return [dict(zip(names, values))
+	        for values in itertools.product(*[axes[name] for name in names])]
+
+@contextlib.contextmanager
+def redirectOutput(filename):
+	"""Send this process's stdout and stderr, including output of subprocesses
+	such as the OpenFOAM tools, to filename for the duration of the block."""
+	sys.stdout.flush()
+	sys.stderr.flush()
+	saved = os.dup(1), os.dup(2)
+	with open(filename, "a") as log:
+		os.dup2(log.fileno(), 1)
+		os.dup2(log.fileno(), 2)
+		try:
+			yield log
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			os.dup2(saved[0], 1)
+			os.dup2(saved[1], 2)
+			os.close(saved[0])
+			os.close(saved[1])
+
+def runSweepPoint(cls, index, params, point_dir, common_kwargs, write_stl):
+	"""Build one sweep point in its own directory and return its result row.
+	Runs in a worker process; any failure is caught and reported in the row
+	rather than raised."""
+	row = {"index": index, "dir": point_dir, "status": "ok", "error": None,
+	       "samples": None, "stl": None, "time_stl": None}
+	start = time.time()
+	os.makedirs(point_dir, exist_ok=True)
+	with redirectOutput(os.path.join(point_dir, "sweep.log")):
+		try:
+			kwargs = dict(common_kwargs)
+			kwargs.update(params)
+			kwargs["casename"] = os.path.join(point_dir, "case")
+			fv = cls(**kwargs)
+			row["time_build"] = time.time() - start
+
+			row["samples"] = os.path.join(point_dir, "samples.npz")
+			np.savez(row["samples"], xyz_points=fv.xyz_points, u_xyz_points=fv.u_xyz_points)
+			if write_stl and hasattr(fv, "writeStlMesh"):
+				stl_start = time.time()
+				row["stl"] = os.path.join(point_dir, "rotor.stl")
+				fv.writeStlMesh(row["stl"])
+				row["time_stl"] = time.time() - stl_start
+		except Exception as e:
+			traceback.print_exc()
+			row["status"] = "failed"
+			row["error"] = "%s: %s" % (type(e).__name__, e)
+	row["time_total"] = time.time() - start
+	return row
+
+class Sweep(object):
+	"""Runs a FreeVortex/FreeVortexBlades design for every point of a parameter
+	grid on a bounded process pool.  Each point gets an isolated directory
+	base_dir/point_NNNNN holding its OpenFOAM case, a log of all its output,
+	the sampled velocity field and optionally the STL.  A point that fails is
+	recorded as failed without stopping the others, as is one whose worker
+	process dies (see run).
+
+	Finished points are appended to base_dir/results.jsonl as they complete,
+	so an interrupted sweep picks up where it left off when run again with the
+	same grid.  Parameters must be picklable (e.g. no lambdas) since they are
+	sent to worker processes."""
+
+	def __init__(self, grid, base_dir="sweeps/sweep", cls=FreeVortexBlades,
+	             common_kwargs=None, processes=None, write_stl=True,
+	             retry_failed=False):
+		"""Keyword arguments:
+		grid -- list of dicts of constructor keyword arguments, see parameterGrid
+		base_dir -- directory for point directories and the results table
+		cls -- FreeVortex or a subclass to construct for each point
+		common_kwargs -- keyword arguments shared by every point
+		processes -- worker count, defaults to the number of CPU cores
+		write_stl -- write each point's STL mesh (FreeVortexBlades only)
+		retry_failed -- rerun points recorded as failed by an earlier run"""
+		self.grid = grid
+		self.base_dir = base_dir
+		self.cls = cls
+		self.common_kwargs = common_kwargs if common_kwargs is not None else {}
+		self.processes = processes if processes is not None else os.cpu_count()
+		self.write_stl = write_stl
+		self.retry_failed = retry_failed
+		self.results_file = os.path.join(self.base_dir, "results.jsonl")
+
+	@staticmethod
+	def pointKey(params):
+		"""Digest identifying a point's parameters across runs."""
+		return hashlib.sha1(pickle.dumps(sorted(params.items()))).hexdigest()
+
+	def pointDir(self, index):
+		return os.path.join(self.base_dir, "point_%05d" % index)
+
+	def loadProgress(self):
+		"""Latest recorded result row for each point, keyed by index."""
+		rows = {}
+		if os.path.exists(self.results_file):
+			with open(self.results_file) as f:
+				for line in f:
+					try:
+						row = json.loads(line)
+					except ValueError:
+						continue # partial line from an interrupted write
+					rows[row["index"]] = row
+		return rows
+
+	def recordProgress(self, row):
+		with open(self.results_file, "a") as f:
+			f.write(json.dumps(row) + "\n")
+
+	def isDone(self, index, params, rows):
+		row = rows.get(index)
+		if row is None or row["key"] != Sweep.pointKey(params):
+			return False
+		return row["status"] == "ok" or not self.retry_failed
+
+	def run(self):
+		"""Run all points not already done and return the results table."""
+		os.makedirs(self.base_dir, exist_ok=True)
+		rows = self.loadProgress()
+		pending = [(index, params) for index, params in enumerate(self.grid)
+		           if not self.isDone(index, params, rows)]
+		print("Sweep %s: %d of %d points to run on %d processes" %
+		      (self.base_dir, len(pending), len(self.grid), self.processes))
+
+		with ProcessPoolExecutor(max_workers=self.processes) as pool:
+			broken = self.collect(dict((self.submit(pool, index, params), (index, params))
+			                           for index, params in pending))
+		if broken:
+			# A worker died outright, e.g. killed by a segfault or the OOM killer,
+			# taking the pool and every point still in it down.  Rerun those
+			# points each in a worker of its own to find the one that did it.
+			print("Sweep %s: worker died, rerunning %d points one per worker" %
+			      (self.base_dir, len(broken)))
+			self.runIsolated(sorted(broken, key=lambda point: point[0]))
+		return self.table()
+
+	def submit(self, pool, index, params):
+		return pool.submit(runSweepPoint, self.cls, index, params,
+		                   self.pointDir(index), self.common_kwargs, self.write_stl)
+
+	def collect(self, futures, isolated=False):
+		"""Record the result of each future, mapped to its (index, params), as it
+		completes.  Returns the points lost to a broken pool, unless isolated,
+		when a dead worker fails only its own point and is recorded as such."""
+		broken = []
+		for future in as_completed(futures):
+			index, params = futures[future]
+			try:
+				row = future.result()
+			except BrokenProcessPool as e:
+				if not isolated:
+					broken.append((index, params))
+					continue
+				row = self.failedRow(index, e)
+			except Exception as e:
+				row = self.failedRow(index, e)
+			row["key"] = Sweep.pointKey(params)
+			row["params"] = {name: repr(value) for name, value in params.items()}
+			self.recordProgress(row)
+			print("Sweep point %d %s" % (index, row["status"]))
+		return broken
+
+	def failedRow(self, index, error):
+		return {"index": index, "dir": self.pointDir(index), "status": "failed",
+		        "error": "%s: %s" % (type(error).__name__, error)}
+
+	def runIsolated(self, points):
+		"""Run points in batches of up to processes at once, each in a pool of its
+		own, so a worker dying fails only the point it was running."""
+		for start in range(0, len(points), self.processes):
+			batch = points[start:start+self.processes]
+			pools = [ProcessPoolExecutor(max_workers=1) for point in batch]
+			try:
+				self.collect(dict((self.submit(pool, index, params), (index, params))
+				                  for pool, (index, params) in zip(pools, batch)),
+				             isolated=True)
+			finally:
+				for pool in pools:
+					pool.shutdown()
+
+	def table(self):
+		"""Result rows for every recorded point, in grid order."""
+		rows = self.loadProgress()
+		return [rows[index] for index in sorted(rows)]
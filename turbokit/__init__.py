@@ -0,0 +1,21 @@
+# turbokit
+# Copyright (c) 2015 Peter Hokanson
+# Vertical Limit Labs
+"""Python library for designing and simulating turbomachinery.
+
+Importing turbokit loads only numpy.  scipy is imported when a solved velocity
+field is first interpolated, and PyFoam when a case's boundary conditions are
+written.  The sweep and asyncio runner modules (turbokit.Sweep,
+turbokit.CaseRunner) are imported explicitly when needed."""
+
+from .Splines import BezierCurve, BezierSurface, intersection_2d, rtz_to_xyz
+from .MeridionalPatch import MeridionalPatch
+from .MeridionalPatchLinear import MeridionalPatchLinear
+from .MeridionalPatchSpline import MeridionalPatchSpline
+from .MeridionalPatchMerged import MeridionalPatchMerged
+from .BladeFactoryBase import BladeFactoryBase, BladeBase, default_thickness, \
+                              merge_meshes, instance_mesh, weld_mesh
+from . import stl_writer
+from .SolveCache import SolveCache
+from .FreeVortex import FreeVortex
+from .FreeVortexBlades import FreeVortexBlades
@@ -6,7 +6,9 @@
 
 import struct
 
-ASCII_FACET = """facet normal 0 0 0
+import numpy as np
+
+ASCII_FACET = """facet normal {normal[0]:.4f} {normal[1]:.4f} {normal[2]:.4f}
 outer loop
 vertex {face[0][0]:.4f} {face[0][1]:.4f} {face[0][2]:.4f}
 vertex {face[1][0]:.4f} {face[1][1]:.4f} {face[1][2]:.4f}
@@ -18,6 +20,57 @@ endfacet
 BINARY_HEADER ="80sI"
 BINARY_FACET = "12fH"
 
+# One binary STL facet: normal, three vertices, attribute byte count (50 bytes)
+BINARY_RECORD = np.dtype([('normal', '<f4', (3,)),
+                          ('vertices', '<f4', (3, 3)),
+                          ('attr', '<u2')])
+
+def facet_normal(face):
+    """ Unit normal of a triangle given as three vertices, or zeros if the
+    triangle is degenerate. """
+    u = [face[1][i] - face[0][i] for i in range(3)]
+    v = [face[2][i] - face[0][i] for i in range(3)]
+    n = [u[1]*v[2] - u[2]*v[1], u[2]*v[0] - u[0]*v[2], u[0]*v[1] - u[1]*v[0]]
+    length = (n[0]**2 + n[1]**2 + n[2]**2) ** 0.5
+    if length == 0:
+        return [0., 0., 0.]
+    return [c / length for c in n]
+
+def triangulate(vertices, faces):
+    """ Split an indexed mesh into triangles.
+
+    vertices is an (N, 3) array, faces an (F, 3) or (F, 4) index array.  Quads
+    are split the same way as ASCII_STL_Writer._split.  Degenerate (zero area)
+    triangles are dropped.  Returns (triangles, normals) with shapes (T, 3, 3)
+    and (T, 3).
+    """
+    # Work in the single precision STL stores, so that triangles which collapse
+    # when written are also treated as degenerate.
+    vertices = np.asarray(vertices, dtype=np.float32)
+    faces = np.asarray(faces)
+    if faces.shape[1] == 4:
+        faces = np.stack((faces[:, [0, 1, 2]], faces[:, [2, 3, 0]]), axis=1).reshape(-1, 3)
+    elif faces.shape[1] != 3:
+        raise ValueError('only 3 or 4 vertices for each face')
+    triangles = vertices[faces]
+    u = triangles[:, 1] - triangles[:, 0]
+    v = triangles[:, 2] - triangles[:, 0]
+    # Written out by component; noticeably faster than np.cross for long arrays
+    normals = np.empty_like(u)
+    normals[:, 0] = u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1]
+    normals[:, 1] = u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2]
+    normals[:, 2] = u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+    lengths = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+    keep = lengths > 0
+    if not keep.all():
+        triangles, normals, lengths = triangles[keep], normals[keep], lengths[keep]
+    normals /= lengths[:, np.newaxis]
+    return triangles, normals
+
+def count_triangles(vertices, faces):
+    """ Number of facets add_mesh will write for an indexed mesh. """
+    return len(triangulate(vertices, faces)[0])
+
 class ASCII_STL_Writer:
     """ Export 3D objects build of 3 or 4 vertices as ASCII STL file.
     """
@@ -31,8 +84,10 @@ class ASCII_STL_Writer:
     def close(self):
         self.fp.write("endsolid python\n")
 
-    def _write(self, face):
-        self.fp.write(ASCII_FACET.format(face=face))
+    def _write(self, face, normal=None):
+        if normal is None:
+            normal = facet_normal(face)
+        self.fp.write(ASCII_FACET.format(face=face, normal=normal))
 
     def _split(self, face):
         p1, p2, p3, p4 = face
@@ -54,24 +109,49 @@ class ASCII_STL_Writer:
         for face in faces:
             self.add_face(face)
 
+    def add_mesh(self, vertices, faces):
+        """ Add an indexed mesh: an (N, 3) vertex array and an (F, 3) or (F, 4)
+        face index array.  Degenerate triangles are skipped. """
+        triangles, normals = triangulate(vertices, faces)
+        for face, normal in zip(triangles.tolist(), normals.tolist()):
+            self._write(face, normal)
+
 class Binary_STL_Writer(ASCII_STL_Writer):
     """ Export 3D objects build of 3 or 4 vertices as binary STL file.
+
+    By default the triangle count in the header is patched in on close(), which
+    needs a seekable stream.  For pipes, gzip streams and the like, pass the
+    final triangle count up front instead; close() then checks it was met.
     """
-    def __init__(self, stream):
+    def __init__(self, stream, count=None):
         self.counter = 0
+        self.count = count
         super(Binary_STL_Writer, self).__init__(stream)
 
+    @property
+    def bytes_written(self):
+        return struct.calcsize(BINARY_HEADER) + BINARY_RECORD.itemsize * self.counter
+
     def close(self):
-        self._write_header()
+        if self.count is None:
+            self._write_header()
+        elif self.counter != self.count:
+            raise ValueError('wrote %d facets, header declares %d' % (self.counter, self.count))
 
     def _write_header(self):
-        self.fp.seek(0)
-        self.fp.write(struct.pack(BINARY_HEADER, bytes('Python Binary STL Writer', 'utf-8'), self.counter))
+        if self.count is None:
+            self.fp.seek(0)
+            count = self.counter
+        else:
+            count = self.count
+        self.fp.write(struct.pack(BINARY_HEADER, bytes('Python Binary STL Writer', 'utf-8'), count))
 
-    def _write(self, face):
+    def _write(self, face, normal=None):
+        if normal is None:
+            normal = facet_normal(face)
         self.counter += 1
         data = [
-            0., 0., 0.,
+            normal[0], normal[1], normal[2],
             face[0][0], face[0][1], face[0][2],
             face[1][0], face[1][1], face[1][2],
             face[2][0], face[2][1], face[2][2],
@@ -79,6 +159,16 @@ class Binary_STL_Writer(ASCII_STL_Writer):
         ]
         self.fp.write(struct.pack(BINARY_FACET, *data))
 
+    def add_mesh(self, vertices, faces):
+        """ Add an indexed mesh, writing all facets from a single structured
+        array rather than packing them one at a time. """
+        triangles, normals = triangulate(vertices, faces)
+        records = np.zeros(len(triangles), dtype=BINARY_RECORD)
+        records['normal'] = normals
+        records['vertices'] = triangles
+        self.fp.write(records.tobytes())
+        self.counter += len(records)
+
 
 def example():
     def get_cube():